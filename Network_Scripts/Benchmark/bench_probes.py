@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+bench_probes.py – Banco de pruebas reproducible para las herramientas de sondeo
+--------------------------------------------------------------------------------
+Mide hosts/s, latencia p99 de sondeo y RSS máximo de los checkers ICMP/SNMP sin
+necesidad de una red real. Todo ocurre sobre loopback (127.0.0.0/8 es local en
+Linux, así que cada dirección de 127.64.0.0/10 es un "host" distinto):
+
+- ICMP: responde el propio kernel. Dentro de un namespace de red (--netns) se puede
+  añadir retardo y pérdida solo al tráfico ICMP con tc/netem.
+- SNMP: agente UDP que responde sysName.0 con retardo y pérdida configurables,
+  contestando desde la misma dirección a la que se preguntó (IP_PKTINFO).
+- TCP: listeners en los puertos indicados (banner SSH en el 22) para los escáneres de puertos.
+
+Cada checker se ejecuta con listas de 1k, 10k y 65k destinos y los resultados se
+guardan en JSON. Con --baseline se comparan contra una ejecución anterior y el
+script termina con código 1 si hay regresiones.
+
+Ejemplo (como root, aislado en su propio namespace):
+    python3 bench_probes.py --netns --icmp-delay 2 --snmp-delay 1 --snmp-loss 1 -o bench.json
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_NET = "127.64.0.0/10"
+SIZES = (1000, 10000, 65000)
+SNMP_PORT = 161
+TCP_PORTS = (22, 80)
+NETNS = "bench-probes"
+IP_PKTINFO = getattr(socket, "IP_PKTINFO", 8)
+
+# Checkers disponibles. Todos leen 'ip.txt' del directorio de trabajo de la ejecución.
+# 'stats': el checker escribe stats.json con percentiles de latencia (--stats-json).
+CHECKERS = {
+    "full_scan": {
+        "script": "full_scan_icmp_snmp.py",
+        "args": ["-c", "1", "-t", "50", "--stats-json", "stats.json"],
+        "stats": True,
+    },
+    "full_scan_workers": {
+        "script": "full_scan_icmp_snmp.py",
+        "args": ["-c", "1", "-w", str(os.cpu_count() or 1), "--stats-json", "stats.json"],
+        "stats": True,
+        "snmp_port_flag": "--snmp-port",
+    },
+    "check_table": {"script": "Protocol_ICMP-SNMP_check_table.py", "args": []},
+    "community_table": {"script": "Table_Protocol_ICMP-SNMP_Comunity_Check.py", "args": []},
+    "check_icmp": {"script": "Protocol_ICMP-SNMP_check.py", "args": [], "stdin": "1\n3\n"},
+    "nmap_tcp": {"script": "Nmap/AsyncNmapScanner.py", "args": ["-i", "ip.txt", "-o", "nmap.json"], "tcp_ports_flag": "-p"},
+}
+DEFAULT_CHECKERS = ("full_scan", "full_scan_workers", "check_table", "community_table", "check_icmp")
+
+# --- Servicios simulados ---
+
+def ber_read(data, offset):
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[offset:offset + size], "big")
+        offset += size
+    return tag, offset, offset + length
+
+def ber_tlv(tag, payload):
+    length = len(payload)
+    if length < 0x80:
+        return bytes((tag, length)) + payload
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes((tag, 0x80 | len(encoded))) + encoded + payload
+
+def snmp_response(request, communities, sysname):
+    """
+    Construye el GetResponse para un GetRequest v1/v2c, o None si la comunidad no es válida
+    (un agente real simplemente no contesta en ese caso).
+    """
+    try:
+        _, pos, _ = ber_read(request, 0)
+        _, start, pos = ber_read(request, pos)
+        version = request[start - 2:pos]
+        _, start, pos = ber_read(request, pos)
+        community = request[start:pos]
+        tag, start, _ = ber_read(request, pos)
+        if tag != 0xA0 or community.decode(errors="replace") not in communities:
+            return None
+        _, id_start, id_end = ber_read(request, start)
+        _, _, pos = ber_read(request, id_end)          # error-status
+        _, _, pos = ber_read(request, pos)             # error-index
+        _, vbl_start, _ = ber_read(request, pos)       # varbind list
+        _, vb_start, _ = ber_read(request, vbl_start)  # primer varbind
+        _, oid_start, oid_end = ber_read(request, vb_start)
+    except IndexError:
+        return None
+    oid = request[oid_start - 2:oid_end]
+    varbind = ber_tlv(0x30, oid + ber_tlv(0x04, sysname.encode()))
+    pdu = ber_tlv(0xA2, request[id_start - 2:id_end] + b"\x02\x01\x00\x02\x01\x00" + ber_tlv(0x30, varbind))
+    return ber_tlv(0x30, version + ber_tlv(0x04, community) + pdu)
+
+async def run_snmp_agent(port, communities, delay, loss):
+    """
+    Agente SNMP mínimo. Usa IP_PKTINFO para responder desde la dirección consultada,
+    igual que haría cada host real, aunque el socket escuche en 0.0.0.0.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+    sock.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.setblocking(False)
+
+    def send(packet, address, pktinfo):
+        try:
+            sock.sendmsg([packet], [(socket.IPPROTO_IP, IP_PKTINFO, pktinfo)], 0, address)
+        except OSError:
+            pass
+
+    def on_readable():
+        while True:
+            try:
+                data, ancdata, _, address = sock.recvmsg(4096, socket.CMSG_SPACE(12))
+            except (BlockingIOError, InterruptedError):
+                return
+            if loss and random.random() * 100 < loss:
+                continue
+            destination = next((cdata for level, kind, cdata in ancdata
+                                if level == socket.IPPROTO_IP and kind == IP_PKTINFO), None)
+            if destination is None:
+                continue
+            target = socket.inet_ntoa(destination[8:12])
+            response = snmp_response(data, communities, f"bench-{target}")
+            if response is None:
+                continue
+            # ipi_ifindex = 0, ipi_spec_dst = dirección consultada
+            pktinfo = struct.pack("I4s4s", 0, destination[8:12], b"\0\0\0\0")
+            if delay:
+                loop.call_later(delay / 1000, send, response, address, pktinfo)
+            else:
+                send(response, address, pktinfo)
+
+    loop.add_reader(sock.fileno(), on_readable)
+
+async def handle_tcp(reader, writer):
+    port = writer.get_extra_info("sockname")[1]
+    try:
+        if port == 22:
+            writer.write(b"SSH-2.0-OpenSSH_bench\r\n")
+            await writer.drain()
+        await asyncio.wait_for(reader.read(1024), timeout=2)
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def run_stand_ins(snmp_port, communities, snmp_delay, snmp_loss, tcp_ports, ready):
+    await run_snmp_agent(snmp_port, communities, snmp_delay, snmp_loss)
+    for port in tcp_ports:
+        await asyncio.start_server(handle_tcp, "0.0.0.0", port, backlog=4096, reuse_address=True)
+    ready.set()
+    await asyncio.Event().wait()
+
+def stand_ins_process(snmp_port, communities, snmp_delay, snmp_loss, tcp_ports, ready):
+    try:
+        asyncio.run(run_stand_ins(snmp_port, communities, snmp_delay, snmp_loss, tcp_ports, ready))
+    except KeyboardInterrupt:
+        pass
+
+def shape_icmp(delay, loss):
+    """
+    Retardo/pérdida solo para ICMP en lo: qdisc prio con netem en la banda 3 y un filtro u32
+    que manda allí el protocolo 1. Se aplica en cada sentido (el RTT ve el doble de retardo).
+    """
+    commands = [
+        ["tc", "qdisc", "replace", "dev", "lo", "root", "handle", "1:", "prio"],
+        ["tc", "qdisc", "add", "dev", "lo", "parent", "1:3", "handle", "30:", "netem",
+         "delay", f"{delay}ms", "loss", f"{loss}%"],
+        ["tc", "filter", "add", "dev", "lo", "parent", "1:0", "protocol", "ip", "u32",
+         "match", "ip", "protocol", "1", "0xff", "flowid", "1:3"],
+    ]
+    for command in commands:
+        subprocess.run(command, check=True)
+
+# --- Medición ---
+
+def process_tree_rss_kb(root_pid):
+    """
+    RSS total (KB) del proceso y todos sus descendientes, leído de /proc
+    """
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                stat = file.read()
+            with open(f"/proc/{entry}/statm") as file:
+                rss_pages[int(entry)] = int(file.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, ()))
+    return total * (os.sysconf("SC_PAGE_SIZE") // 1024)
+
+def run_checker(name, spec, targets, workdir, args):
+    """
+    Ejecuta un checker sobre la lista de destinos y retorna su registro de resultados
+    """
+    with open(os.path.join(workdir, "ip.txt"), "w") as file:
+        file.write("\n".join(targets) + "\n")
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, spec["script"])] + spec["args"]
+    if "snmp_port_flag" in spec:
+        command += [spec["snmp_port_flag"], str(args.snmp_port)]
+    if "tcp_ports_flag" in spec:
+        command += [spec["tcp_ports_flag"], ",".join(map(str, args.tcp_ports))]
+
+    env = dict(os.environ, TERM="dumb")
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdin=subprocess.PIPE,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if spec.get("stdin"):
+        process.stdin.write(spec["stdin"])
+    process.stdin.close()
+
+    # stderr se drena en un hilo para que el checker no se bloquee con la tubería llena
+    stderr_tail = []
+    drain = threading.Thread(target=lambda: stderr_tail.extend(process.stderr.readlines()[-5:]), daemon=True)
+    drain.start()
+
+    # wait4 (en lugar de Popen.poll) devuelve también el uso de recursos del hijo,
+    # cuyo ru_maxrss incluye a sus descendientes ya esperados
+    peak_tree_rss = 0
+    timed_out = False
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        peak_tree_rss = max(peak_tree_rss, process_tree_rss_kb(process.pid))
+        if time.perf_counter() - start > args.timeout:
+            process.kill()
+            timed_out = True
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    process.returncode = returncode = os.waitstatus_to_exitcode(status)
+    drain.join(timeout=1)
+
+    p99 = None
+    stats_file = os.path.join(workdir, "stats.json")
+    if spec.get("stats") and os.path.isfile(stats_file):
+        with open(stats_file) as file:
+            p99 = json.load(file).get("latency_ms", {}).get("p99")
+        os.remove(stats_file)
+
+    return {
+        "checker": name,
+        "targets": len(targets),
+        "elapsed_s": round(elapsed, 3),
+        "hosts_per_s": round(len(targets) / elapsed, 1),
+        "p99_ms": p99,
+        "peak_rss_kb": usage.ru_maxrss,
+        "peak_tree_rss_kb": peak_tree_rss,
+        "returncode": returncode,
+        "timed_out": timed_out,
+        "stderr_tail": "".join(stderr_tail).strip()[-500:] if returncode else "",
+    }
+
+def compare_with_baseline(results, baseline_file, tolerance):
+    """
+    Compara con un JSON anterior por (checker, destinos). Retorna la lista de regresiones.
+    """
+    with open(baseline_file) as file:
+        baseline = {(r["checker"], r["targets"]): r for r in json.load(file)["results"]}
+    regressions = []
+    factor = tolerance / 100
+    for result in results:
+        old = baseline.get((result["checker"], result["targets"]))
+        if not old:
+            continue
+        checks = (
+            ("hosts_per_s", result["hosts_per_s"] < old["hosts_per_s"] * (1 - factor)),
+            ("p99_ms", result["p99_ms"] is not None and old["p99_ms"] is not None
+             and result["p99_ms"] > old["p99_ms"] * (1 + factor)),
+            ("peak_tree_rss_kb", result["peak_tree_rss_kb"] > old["peak_tree_rss_kb"] * (1 + factor)),
+        )
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append((result["checker"], result["targets"], metric, old[metric], result[metric]))
+    return regressions
+
+def run_benchmark(args):
+    network = ipaddress.ip_network(TARGET_NET)
+    if max(args.sizes) > network.num_addresses - 2:
+        sys.exit(f"El tamaño máximo es {network.num_addresses - 2} destinos")
+
+    if args.icmp_delay or args.icmp_loss:
+        if not args.inside:
+            sys.exit("--icmp-delay/--icmp-loss modifican 'lo' y solo se permiten dentro de --netns")
+        try:
+            shape_icmp(args.icmp_delay, args.icmp_loss)
+        except (OSError, subprocess.CalledProcessError) as e:
+            sys.exit(f"No se pudo configurar tc/netem en lo (¿módulos sch_prio/sch_netem disponibles?): {e}")
+
+    ready = multiprocessing.Event()
+    stand_ins = multiprocessing.Process(
+        target=stand_ins_process,
+        args=(args.snmp_port, args.communities, args.snmp_delay, args.snmp_loss, args.tcp_ports, ready),
+        daemon=True,
+    )
+    stand_ins.start()
+    if not ready.wait(10):
+        sys.exit("No se pudieron arrancar los servicios simulados (¿puertos en uso o sin privilegios?)")
+
+    hosts = network.hosts()
+    all_targets = [str(next(hosts)) for _ in range(max(args.sizes))]
+    results = []
+    try:
+        for name in args.checkers:
+            spec = CHECKERS[name]
+            if name == "nmap_tcp" and not shutil.which("nmap"):
+                print(f"- {name}: nmap no instalado, se omite")
+                continue
+            for size in sorted(args.sizes):
+                with tempfile.TemporaryDirectory(prefix="bench_probes_") as workdir:
+                    result = run_checker(name, spec, all_targets[:size], workdir, args)
+                results.append(result)
+                p99 = f"{result['p99_ms']:.2f} ms" if result["p99_ms"] is not None else "-"
+                status = "TIMEOUT" if result["timed_out"] else f"rc={result['returncode']}"
+                print(f"- {name:<18} {size:>6} destinos: {result['hosts_per_s']:>9.1f} hosts/s  "
+                      f"p99 {p99:>10}  RSS {result['peak_tree_rss_kb'] / 1024:>7.1f} MB  {status}")
+    finally:
+        stand_ins.terminate()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "config": {
+            "target_net": TARGET_NET,
+            "icmp_delay_ms": args.icmp_delay,
+            "icmp_loss_pct": args.icmp_loss,
+            "snmp_delay_ms": args.snmp_delay,
+            "snmp_loss_pct": args.snmp_loss,
+            "snmp_port": args.snmp_port,
+            "communities": args.communities,
+            "tcp_ports": args.tcp_ports,
+            "netns": bool(args.inside),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResultados guardados en '{args.output}'")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for checker, size, metric, before, after in regressions:
+            print(f"REGRESIÓN {checker} ({size} destinos): {metric} {before} -> {after}")
+        if regressions:
+            sys.exit(1)
+        print(f"Sin regresiones frente a '{args.baseline}' (tolerancia {args.tolerance}%)")
+
+def run_in_netns(args):
+    """
+    Crea un namespace de red desechable, se relanza dentro de él y lo elimina al terminar
+    """
+    subprocess.run(["ip", "netns", "add", NETNS], check=True)
+    try:
+        subprocess.run(["ip", "netns", "exec", NETNS, "ip", "link", "set", "lo", "up"], check=True)
+        argv = [arg for arg in sys.argv[1:] if arg != "--netns"]
+        command = ["ip", "netns", "exec", NETNS, sys.executable, os.path.abspath(__file__), "--inside"] + argv
+        return subprocess.run(command).returncode
+    finally:
+        subprocess.run(["ip", "netns", "del", NETNS])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Banco de pruebas local (loopback) para los checkers ICMP/SNMP.")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="Fichero JSON de resultados")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=list(SIZES),
+                        help="Número de destinos por ejecución (por defecto: 1000 10000 65000)")
+    parser.add_argument("-k", "--checkers", nargs="+", choices=sorted(CHECKERS), default=list(DEFAULT_CHECKERS),
+                        help="Checkers a medir")
+    parser.add_argument("--netns", action="store_true", help=f"Ejecuta todo en un namespace de red aislado ({NETNS})")
+    parser.add_argument("--inside", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--icmp-delay", type=float, default=0, help="Retardo ICMP en ms por sentido (requiere --netns)")
+    parser.add_argument("--icmp-loss", type=float, default=0, help="Pérdida ICMP en %% por sentido (requiere --netns)")
+    parser.add_argument("--snmp-delay", type=float, default=0, help="Retardo de respuesta del agente SNMP en ms")
+    parser.add_argument("--snmp-loss", type=float, default=0, help="Porcentaje de peticiones SNMP sin respuesta")
+    parser.add_argument("--snmp-port", type=int, default=SNMP_PORT, help=f"Puerto del agente SNMP (por defecto: {SNMP_PORT})")
+    parser.add_argument("--communities", nargs="+", default=["public"],
+                        help="Comunidades a las que responde el agente (por defecto: public)")
+    parser.add_argument("--tcp-ports", type=int, nargs="*", default=list(TCP_PORTS),
+                        help="Puertos TCP con listener (por defecto: 22 80)")
+    parser.add_argument("--timeout", type=float, default=1800, help="Tiempo máximo por ejecución en segundos")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=10, help="Margen de regresión en %% (por defecto: 10)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.netns and not args.inside:
+        if os.geteuid() != 0:
+            sys.exit("--netns requiere privilegios de root")
+        sys.exit(run_in_netns(args))
+    run_benchmark(args)
+
+if __name__ == "__main__":
+    main()
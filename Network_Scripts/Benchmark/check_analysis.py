@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+check_analysis.py – Regresión del análisis y los gráficos de mtr_analysis.py con pocos destinos
+---------------------------------------------------------------------------------------------
+Genera trayectos sintéticos (sin red ni root) para cada número de destinos de --sizes, ejecuta
+perform_comprehensive_analysis y render_figures en un directorio temporal y falla (código 1) si
+alguna figura da error o no se escribe. Por defecto cubre 1 y 2 destinos y los casos justo por
+debajo y por encima de N_CLUSTERS (sin perfiles de rendimiento y con ellos).
+
+Ejemplo:
+    python3 check_analysis.py --sizes 2 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mtr_analysis  # noqa: E402
+
+
+def synthetic_paths(count, hops=5, cycles=20, seed=42):
+    """Retorna {destino: PathStats} con count destinos que comparten los primeros saltos"""
+    rng = random.Random(seed)
+    paths = {}
+    for index in range(count):
+        host = f"198.51.100.{index + 1}"
+        path = mtr_analysis.PathStats(host, host, hops)
+        base = rng.uniform(1, 20)
+        for ttl in range(1, hops + 1):
+            address = host if ttl == hops else f"10.{ttl}.{0 if ttl < 3 else index}.1"
+            for _ in range(cycles):
+                if rng.random() < 0.02 * ttl:
+                    path.loss(ttl)
+                else:
+                    path.reply(ttl, base * ttl + rng.gauss(0, 1), address)
+        paths[host] = path
+    return paths
+
+
+def check(count, dpi):
+    """Retorna la lista de problemas del análisis y los gráficos con count destinos"""
+    table = mtr_analysis.hop_table(synthetic_paths(count))
+    analysis = mtr_analysis.perform_comprehensive_analysis(table)
+    all_data_dfs = {host: df.drop(columns=['target', 'category']).reset_index(drop=True)
+                    for host, df in table.groupby('target', sort=False)}
+    problems = []
+    with tempfile.TemporaryDirectory() as outdir:
+        jobs = mtr_analysis.figure_jobs(analysis, all_data_dfs, outdir)
+        rendered, _ = mtr_analysis.render_figures(jobs, outdir, dpi=dpi, fmt="png")
+        for name, _, _ in jobs:
+            if name not in rendered:
+                problems.append(f"{name}: error al dibujar")
+            elif name == "01_correlation_and_clustering" and 'pca' not in analysis:
+                continue  # con un solo destino no hay PCA y la figura se omite
+            elif not os.path.exists(mtr_analysis.figure_path(outdir, name, "png")):
+                problems.append(f"{name}: no se escribió")
+    return problems
+
+
+def main():
+    clusters = mtr_analysis.N_CLUSTERS
+    parser = argparse.ArgumentParser(description="Comprueba el análisis y los gráficos de mtr_analysis.py con pocos destinos")
+    parser.add_argument("--sizes", type=int, nargs="+", default=sorted({1, 2, max(2, clusters - 1), clusters + 1}),
+                        help="Números de destinos a comprobar")
+    parser.add_argument("--dpi", type=int, default=40, help="Resolución de las figuras de prueba")
+    args = parser.parse_args()
+
+    mtr_analysis.import_analysis()
+    failed = False
+    for count in args.sizes:
+        problems = check(count, args.dpi)
+        print(f"{count} destinos: {'OK' if not problems else 'REGRESIÓN'}")
+        for problem in problems:
+            print(f"  {problem}")
+        failed |= bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+check_startup.py – Presupuesto de tiempo de arranque de mtr_analysis.py
+------------------------------------------------------------------------
+Importa el script con 'python -X importtime' varias veces y toma la mejor medida del
+tiempo acumulado de su import. Falla (código 1) si supera --budget-ms o si a la hora de
+importar ya se cargan librerías pesadas que solo necesitan el análisis y los gráficos
+(pandas, numpy, matplotlib, seaborn, sklearn, adjustText).
+
+Ejemplo:
+    python3 check_startup.py --budget-ms 300
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "seaborn", "sklearn", "adjustText")
+
+
+def measure(module):
+    """Retorna (µs acumulados del import de module, conjunto de módulos de primer nivel importados)"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"Error importando {module}:\n{proc.stderr.strip().splitlines()[-1]}")
+    cumulative, loaded = None, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        name = name.strip()
+        loaded.add(name.split(".")[0])
+        if name == module:
+            cumulative = int(cumulative_us)
+    return cumulative, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprueba el tiempo de arranque (import) de mtr_analysis.py")
+    parser.add_argument("--module", default="mtr_analysis", help="Módulo de Network_Scripts a medir")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="Máximo tiempo de import permitido (ms)")
+    parser.add_argument("--repeat", type=int, default=5, help="Mediciones; se usa la mejor para evitar ruido")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    best_ms = min(cumulative for cumulative, _ in runs) / 1000
+    heavy = sorted(set(HEAVY_MODULES) & runs[0][1])
+
+    print(f"{args.module}: {best_ms:.1f} ms (mejor de {args.repeat}, presupuesto {args.budget_ms:.0f} ms)")
+    failed = False
+    if best_ms > args.budget_ms:
+        print(f"REGRESIÓN: el import supera el presupuesto en {best_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if heavy:
+        print(f"REGRESIÓN: se importan al arrancar: {', '.join(heavy)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,864 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import subprocess
+import numpy as np
 import threading
+import asyncio
+import socket
+import struct
+import os
+import sys
 import time
 import csv
+import queue
+import argparse
+import ipaddress
+import signal
+import sqlite3
 from datetime import datetime
 from collections import deque
 
+# Planificador de sondeos: cada dispositivo se sondea una vez por INTERVAL segundos,
+# repartidos en WHEEL_SLOTS ranuras para no enviar todos los pings a la vez.
+PROBE_INTERVAL = 1.0
+PROBE_TIMEOUT = 1.0
+WHEEL_SLOTS = 20
+# Cada cuánto recoge la interfaz los resultados acumulados (ms)
+RESULTS_POLL_MS = 200
+# El gráfico se redibuja como mucho GRAPH_FPS veces por segundo, sea cual sea el ritmo de sondeo
+GRAPH_FPS = 5
+
+# Historial por dispositivo: anillo con las últimas RAW_POINTS muestras en bruto y agregados
+# mín/media/máx por nivel (segundos por cubo, cubos retenidos): 1 min durante 24 h,
+# 10 min durante 7 días y 1 h durante 30 días. Los arrays crecen por duplicación desde
+# GROW_START elementos hasta su capacidad, así que un dispositivo recién añadido apenas ocupa memoria
+RAW_POINTS = 900
+ROLLUPS = ((60, 1440), (600, 1008), (3600, 720))
+GROW_START = 16
+# Con muchos dispositivos solo se grafican los seleccionados o, sin selección, los primeros de la tabla
+GRAPH_MAX_LINES = 10
+# Importaciones cuyo historial lleno (series_bytes() por dispositivo) superaría IMPORT_CONFIRM_MB piden
+# confirmación (~2700 dispositivos con los valores por defecto; un /16 son 65534 hosts)
+IMPORT_CONFIRM_MB = 256
+
+# Tabla de dispositivos: columna -> encabezado, y estados por los que se puede filtrar
+TABLE_COLUMNS = {'IP': 'Dirección IP', 'Status': 'Estado', 'Latency': 'Latencia (ms)',
+                 'Loss': 'Pérdida (%)', 'Jitter': 'Jitter (ms)'}
+DEVICE_STATES = ("Todos", "Activo", "Inalcanzable", "Error", "No iniciado")
+OUTCOME_STATES = {"Éxito": "Activo", "Fallo": "Inalcanzable"}
+
+# Reproducción de registros: filas por trozo al leer CSV, puntos máximos por línea y
+# fallos seguidos a partir de los cuales se cuenta una caída
+LOAD_CHUNK_ROWS = 1_000_000
+REPLAY_POINTS = 2000
+OUTAGE_MIN_FAILURES = 3
+LOCAL_UTC_OFFSET = datetime.now().astimezone().utcoffset().total_seconds()
+
+# Ventanas del gráfico: nombre -> (segundos visibles, segundos por unidad del eje, unidad)
+GRAPH_WINDOWS = {
+    "5 min": (300, 1, "segundos"),
+    "15 min": (900, 1, "segundos"),
+    "1 hora": (3600, 60, "minutos"),
+    "24 horas": (86400, 3600, "horas"),
+    "7 días": (604800, 3600, "horas"),
+    "30 días": (2592000, 86400, "días"),
+}
+
+# Registro de eventos: escritor en segundo plano con cola acotada y volcado por lotes
+LOG_FILE = "network_log.csv"
+LOG_QUEUE_SIZE = 50000
+LOG_FLUSH_INTERVAL = 2.0
+LOG_FLUSH_ROWS = 1000
+LOG_MAX_MB = 50
+# Formato binario: instante (float64), id de dispositivo (uint32), latencia ms (float32, NaN sin respuesta), estado (uint8).
+# Los nombres de dispositivo se guardan, uno por línea en orden de id, en '<fichero>.devices'.
+BIN_RECORD = struct.Struct("<dIfB")
+BIN_DTYPE = np.dtype([("time", "<f8"), ("device", "<u4"), ("latency", "<f4"), ("status", "u1")])
+STATUS_CODES = {"Éxito": 0, "Fallo": 1, "Error": 2}
+# Formato sqlite: base de datos en modo WAL (la interfaz puede leerla mientras se escribe);
+# las muestras anteriores a --keep-days se purgan como mucho una vez cada SQLITE_PRUNE_INTERVAL s
+SQLITE_PRUNE_INTERVAL = 3600
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS samples (time REAL NOT NULL, device INTEGER NOT NULL, latency REAL, status INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS samples_device_time ON samples (device, time);
+"""
+# Extensión por defecto del registro según el formato
+LOG_EXTENSIONS = {"csv": ".csv", "bin": ".bin", "sqlite": ".db"}
+# Modo --headless: cada cuánto se imprime el resumen de estados (s)
+HEADLESS_REPORT = 60
+
+def import_gui():
+    """
+    Tk y matplotlib solo se importan si hay interfaz: el modo --headless corre en servidores sin pantalla
+    """
+    global tk, ttk, messagebox, filedialog, plt, FigureCanvasTkAgg
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def expand_targets(entries):
+    """
+    Retorna las IPs/nombres de la lista, expandiendo las redes en notación CIDR a sus hosts
+    """
+    targets = []
+    for entry in entries:
+        entry = entry.strip()
+        if not entry or entry.startswith("#"):
+            continue
+        if "/" in entry:
+            try:
+                targets.extend(str(host) for host in ipaddress.ip_network(entry, strict=False).hosts())
+                continue
+            except ValueError:
+                print(f"Aviso: red inválida '{entry}', se trata como host")
+        targets.append(entry)
+    return targets
+
+def read_targets(filename):
+    """
+    Lee un dispositivo o red por línea; las líneas vacías o que empiezan por # se ignoran
+    """
+    try:
+        with open(filename, "r") as file:
+            return expand_targets(file.read().splitlines())
+    except OSError as e:
+        print(f"Error al leer '{filename}': {e}")
+        return []
+
+def grow(array, capacity):
+    """
+    Retorna una copia de array con el doble de filas (mín. GROW_START, máx. capacity) y el mismo contenido
+    """
+    rows = min(capacity, max(GROW_START, 2 * len(array)))
+    grown = np.full((rows,) + array.shape[1:], np.nan, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def ring_view(array, head, size):
+    """
+    Retorna el contenido de un anillo en orden cronológico
+    """
+    if size < len(array):
+        return array[:size]
+    return np.concatenate((array[head:], array[:head]))
+
+def series_bytes(capacity=RAW_POINTS, rollups=ROLLUPS):
+    """
+    Retorna la memoria del historial de un dispositivo con todos sus anillos llenos: tres float64 por
+    muestra en bruto y, por cubo, su inicio (float64) y cuatro estadísticas float32
+    """
+    return capacity * 3 * 8 + sum(buckets * (8 + 4 * 4) for _, buckets in rollups)
+
+class Rollup:
+    """
+    Un nivel de agregación: anillo de cubos cerrados (inicio, mín, media, máx, % pérdida)
+    más el cubo abierto, que se acumula sin guardar las muestras. El anillo se reserva al
+    cerrar el primer cubo y crece hasta capacity cubos
+    """
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.starts = np.empty(0)
+        self.stats = np.empty((0, 4), dtype=np.float32)
+        self.head = 0
+        self.size = 0
+        self.bucket = None
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.lost = 0
+        self.total = 0.0
+        self.low = np.inf
+        self.high = -np.inf
+
+    def _current(self):
+        received = self.count - self.lost
+        if received:
+            return self.low, self.total / received, self.high, 100.0 * self.lost / self.count
+        return np.nan, np.nan, np.nan, 100.0
+
+    def add(self, timestamp, value):
+        bucket = timestamp // self.width
+        if bucket != self.bucket:
+            if self.count:
+                if self.size == len(self.starts) < self.capacity:
+                    self.starts = grow(self.starts, self.capacity)
+                    self.stats = grow(self.stats, self.capacity)
+                self.starts[self.head] = self.bucket * self.width
+                self.stats[self.head] = self._current()
+                self.head = (self.head + 1) % self.capacity
+                self.size = min(self.size + 1, self.capacity)
+            self.bucket = bucket
+            self._reset()
+        self.count += 1
+        if value != value:  # NaN: sin respuesta
+            self.lost += 1
+        else:
+            self.total += value
+            self.low = min(self.low, value)
+            self.high = max(self.high, value)
+
+    def oldest(self):
+        if self.size == 0:
+            return self.bucket * self.width if self.count else np.inf
+        return self.starts[self.head if self.size == self.capacity else 0]
+
+    def holds_everything(self):
+        return self.size < self.capacity
+
+    def view(self):
+        """
+        Retorna (centro del cubo, mín, media, máx), incluido el cubo abierto
+        """
+        starts = ring_view(self.starts, self.head, self.size)
+        stats = ring_view(self.stats, self.head, self.size)
+        if self.count:
+            starts = np.append(starts, self.bucket * self.width)
+            stats = np.vstack((stats, self._current()))
+        centers = starts + self.width / 2
+        return centers, stats[:, 0], stats[:, 1], stats[:, 2]
+
+class DeviceSeries:
+    """
+    Historial de un dispositivo en arrays NumPy que crecen bajo demanda: las últimas muestras en bruto
+    (NaN = sin respuesta) y un Rollup por nivel, todo actualizado al vuelo, así que dibujar
+    horas o días de historia cuesta lo mismo que dibujar unos minutos.
+
+    Pérdida y jitter (media de |diferencia| entre respuestas consecutivas) se calculan sobre
+    el anillo en bruto con contadores que suman la muestra nueva y restan la que sale: O(1).
+    """
+    def __init__(self, capacity=RAW_POINTS, rollups=ROLLUPS):
+        self.capacity = capacity
+        self.times = np.empty(0)
+        self.latency = np.empty(0)
+        self.deltas = np.empty(0)
+        self.head = 0
+        self.size = 0
+        self.lost = 0
+        self.delta_sum = 0.0
+        self.delta_count = 0
+        self.previous = np.nan
+        self.rollups = [Rollup(width, buckets) for width, buckets in rollups]
+
+    def append(self, timestamp, latency):
+        value = np.nan if latency is None else latency
+        if self.size == len(self.times) < self.capacity:
+            self.times = grow(self.times, self.capacity)
+            self.latency = grow(self.latency, self.capacity)
+            self.deltas = grow(self.deltas, self.capacity)
+        index = self.head
+        if self.size == self.capacity:
+            if self.latency[index] != self.latency[index]:
+                self.lost -= 1
+            old_delta = self.deltas[index]
+            if old_delta == old_delta:
+                self.delta_count -= 1
+                self.delta_sum = self.delta_sum - old_delta if self.delta_count else 0.0
+        else:
+            self.size += 1
+        delta = abs(value - self.previous)
+        self.times[index] = timestamp
+        self.latency[index] = value
+        self.deltas[index] = delta
+        if value != value:
+            self.lost += 1
+        if delta == delta:
+            self.delta_sum += delta
+            self.delta_count += 1
+        self.previous = value
+        self.head = (index + 1) % self.capacity
+        for rollup in self.rollups:
+            rollup.add(timestamp, value)
+
+    @property
+    def loss(self):
+        return 100.0 * self.lost / self.size if self.size else 0.0
+
+    @property
+    def jitter(self):
+        return self.delta_sum / self.delta_count if self.delta_count else np.nan
+
+    def view(self, span):
+        """
+        Retorna (tiempos, mín, media, máx) de los últimos span segundos con la resolución
+        más fina que cubre la ventana completa
+        """
+        if self.size == 0:
+            empty = np.empty(0)
+            return empty, empty, empty, empty
+        newest = self.times[self.head - 1]
+        cutoff = newest - span
+        raw_full = self.size == self.capacity
+        if not raw_full or self.times[self.head] <= cutoff:
+            times = ring_view(self.times, self.head, self.size)
+            latency = ring_view(self.latency, self.head, self.size)
+            data = (times, latency, latency, latency)
+        else:
+            rollup = next((r for r in self.rollups if r.holds_everything() or r.oldest() <= cutoff),
+                          self.rollups[-1])
+            data = rollup.view()
+        keep = data[0] >= cutoff
+        return tuple(column[keep] for column in data)
+
+class HistorySeries:
+    """
+    Serie completa de un dispositivo leída de un registro, para reproducirla: arrays ordenados
+    por tiempo (NaN = sin respuesta). view() recorta la ventana con búsqueda binaria y, si
+    tiene más de max_points muestras, la reduce a cubos mín/media/máx con reduceat.
+    """
+    def __init__(self, times, latency):
+        self.times = times
+        self.latency = latency
+        self.size = len(times)
+        received = latency[~np.isnan(latency)]
+        self.lost = self.size - len(received)
+        deltas = np.abs(np.diff(latency))
+        deltas = deltas[~np.isnan(deltas)]
+        self.delta_count = len(deltas)
+        self.delta_sum = float(deltas.sum())
+        self.mean = float(received.mean()) if len(received) else None
+
+    @property
+    def loss(self):
+        return 100.0 * self.lost / self.size if self.size else 0.0
+
+    @property
+    def jitter(self):
+        return self.delta_sum / self.delta_count if self.delta_count else np.nan
+
+    def view(self, span, end, max_points=REPLAY_POINTS):
+        """
+        Retorna (tiempos, mín, media, máx) de la ventana (end - span, end]
+        """
+        low = np.searchsorted(self.times, end - span, side="right")
+        high = np.searchsorted(self.times, end, side="right")
+        times = self.times[low:high]
+        latency = self.latency[low:high]
+        if len(times) <= max_points:
+            return times, latency, latency, latency
+        bounds = np.unique(np.linspace(0, len(times), max_points, endpoint=False).astype(np.int64))
+        sizes = np.diff(np.append(bounds, len(times)))
+        received = ~np.isnan(latency)
+        counts = np.add.reduceat(received, bounds)
+        sums = np.add.reduceat(np.where(received, latency, 0.0), bounds)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(counts > 0, sums / counts, np.nan)
+        centers = np.add.reduceat(times, bounds) / sizes
+        return centers, np.fmin.reduceat(latency, bounds), mean, np.fmax.reduceat(latency, bounds)
+
+    def outages(self, min_failures=OUTAGE_MIN_FAILURES):
+        """
+        Retorna [(inicio, fin, fallos)] de cada racha de al menos min_failures fallos seguidos.
+        El fin es la primera respuesta posterior (o la última muestra si la caída sigue abierta).
+        """
+        failed = np.isnan(self.latency).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], failed, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        keep = ends - starts >= min_failures
+        starts, ends = starts[keep], ends[keep]
+        end_times = self.times[np.minimum(ends, self.size - 1)]
+        return list(zip(self.times[starts].tolist(), end_times.tolist(), (ends - starts).tolist()))
+
+def _read_csv_log(path, chunk_rows):
+    """
+    Lee un registro CSV (instante, dispositivo, latencia, estado) por trozos con pandas.
+    Retorna (nombres, ids, instantes, latencias) como arrays.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        sys.exit("La reproducción de registros CSV necesita pandas (pip install pandas); los registros .bin no")
+    names, ids, times, latency = {}, [], [], []
+    reader = pd.read_csv(path, header=None, names=("time", "device", "latency", "status"),
+                         usecols=("time", "device", "latency"), dtype={"device": str},
+                         chunksize=chunk_rows)
+    for chunk in reader:
+        stamps = pd.to_datetime(chunk["time"], format="ISO8601")
+        # Los CSV guardan hora local sin zona: se pasa a epoch con el desfase local actual
+        seconds = (stamps - pd.Timestamp(0)).dt.total_seconds().to_numpy() - LOCAL_UTC_OFFSET
+        codes, uniques = pd.factorize(chunk["device"])
+        remap = np.array([names.setdefault(name, len(names)) for name in uniques], dtype=np.uint32)
+        ids.append(remap[codes])
+        times.append(seconds)
+        latency.append(pd.to_numeric(chunk["latency"], errors="coerce").to_numpy(np.float64))
+    if not ids:
+        return [], np.empty(0, np.uint32), np.empty(0), np.empty(0)
+    return list(names), np.concatenate(ids), np.concatenate(times), np.concatenate(latency)
+
+def _read_bin_log(path):
+    """
+    Lee un registro binario (BIN_RECORD) de una vez con np.fromfile. Los nombres salen de
+    '<fichero>.devices'; para ficheros rotados (network_log.2024-05-01.bin) del fichero base.
+    """
+    directory, name = os.path.split(path)
+    parts = name.split(".")
+    candidates = [path + ".devices", os.path.join(directory, f"{parts[0]}.{parts[-1]}.devices")]
+    sidecar = next((candidate for candidate in candidates if os.path.exists(candidate)), None)
+    if sidecar is None:
+        sys.exit(f"No se encontró la lista de dispositivos de '{path}' ({candidates[0]})")
+    with open(sidecar) as file:
+        names = file.read().splitlines()
+    records = np.fromfile(path, dtype=BIN_DTYPE)
+    return names, records["device"], records["time"], records["latency"].astype(np.float64)
+
+def _read_sqlite_log(path, chunk_rows):
+    """
+    Lee una base sqlite del modo --log-format sqlite (también mientras otro proceso escribe en ella:
+    WAL permite lectores concurrentes, que ven una instantánea)
+    """
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        names = [name for (name,) in connection.execute("SELECT name FROM devices ORDER BY id")]
+        cursor = connection.execute("SELECT device, time, COALESCE(latency, -1.0) FROM samples")
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    finally:
+        connection.close()
+    rows = np.concatenate(chunks) if chunks else np.empty((0, 3))
+    latency = rows[:, 2]
+    latency[latency < 0] = np.nan
+    return names, rows[:, 0].astype(np.uint32), rows[:, 1], latency
+
+def load_history(paths, chunk_rows=LOAD_CHUNK_ROWS):
+    """
+    Carga uno o varios registros (CSV, .bin, p. ej. los ficheros rotados de un día, o una
+    base sqlite) y retorna {dispositivo: HistorySeries}
+    """
+    merged_names, ids, times, latency = {}, [], [], []
+    for path in paths:
+        if path.endswith(".bin"):
+            names, file_ids, file_times, file_latency = _read_bin_log(path)
+        elif path.endswith((".db", ".sqlite")):
+            names, file_ids, file_times, file_latency = _read_sqlite_log(path, chunk_rows)
+        else:
+            names, file_ids, file_times, file_latency = _read_csv_log(path, chunk_rows)
+        remap = np.array([merged_names.setdefault(name, len(merged_names)) for name in names] or [0], dtype=np.uint32)
+        ids.append(remap[file_ids])
+        times.append(file_times)
+        latency.append(file_latency)
+    ids, times, latency = np.concatenate(ids), np.concatenate(times), np.concatenate(latency)
+    # Un solo ordenado por (dispositivo, instante) y cada dispositivo queda en un tramo contiguo
+    order = np.lexsort((times, ids))
+    ids, times, latency = ids[order], times[order], latency[order]
+    bounds = np.flatnonzero(np.diff(ids)) + 1
+    names = list(merged_names)
+    history = {}
+    starts = np.concatenate(([0], bounds))
+    for start, device_times, device_latency in zip(starts, np.split(times, bounds), np.split(latency, bounds)):
+        if len(device_times):
+            history[names[ids[start]]] = HistorySeries(device_times, device_latency)
+    return history
+
+def write_outages(history, filename, min_failures=OUTAGE_MIN_FAILURES):
+    """
+    Escribe las caídas de todos los dispositivos en un CSV y retorna cuántas hay
+    """
+    total = 0
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Dispositivo", "Inicio", "Fin", "Duración (s)", "Fallos seguidos"])
+        for ip, series in history.items():
+            for start, end, failures in series.outages(min_failures):
+                writer.writerow([ip, datetime.fromtimestamp(start), datetime.fromtimestamp(end),
+                                 f"{end - start:.1f}", failures])
+                total += 1
+    return total
+
+class EventLogger:
+    """
+    Escribe los eventos de ping desde un hilo propio. log() solo encola (nunca bloquea al
+    llamante: si la cola se llena, el evento se descarta y se cuenta), y el hilo vuelca por
+    lotes cuando se acumulan LOG_FLUSH_ROWS filas o pasan LOG_FLUSH_INTERVAL segundos.
+
+    Rotación opcional: 'size' al superar max_mb, 'day' al cambiar de fecha. El fichero cerrado
+    se renombra con la fecha/hora (network_log.2024-05-01.csv) y se abre uno nuevo.
+
+    Con fmt='sqlite' cada lote es una transacción (executemany) sobre una base en modo WAL;
+    en lugar de rotar, keep_days purga las muestras antiguas.
+    """
+    def __init__(self, path=LOG_FILE, fmt="csv", rotate=None, max_mb=LOG_MAX_MB,
+                 flush_interval=LOG_FLUSH_INTERVAL, flush_rows=LOG_FLUSH_ROWS, keep_days=None):
+        self.path = path
+        self.fmt = fmt
+        self.rotate = rotate
+        self.keep_days = keep_days
+        self.next_prune = 0.0
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.file = None
+        self.writer = None
+        self.opened_day = None
+        self.device_ids = {}
+        if fmt == "bin":
+            self._load_device_ids()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def log(self, timestamp, ip, latency, status):
+        try:
+            self.queue.put_nowait((timestamp, ip, latency, status))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=10)
+        if self.dropped:
+            print(f"Aviso: se descartaron {self.dropped} eventos de registro (cola llena)")
+
+    def _load_device_ids(self):
+        try:
+            with open(self.path + ".devices") as file:
+                for index, name in enumerate(file.read().splitlines()):
+                    self.device_ids[name] = index
+        except FileNotFoundError:
+            pass
+
+    def _device_id(self, ip):
+        index = self.device_ids.get(ip)
+        if index is None:
+            index = self.device_ids[ip] = len(self.device_ids)
+            if self.fmt == "sqlite":
+                self.file.execute("INSERT INTO devices (id, name) VALUES (?, ?)", (index, ip))
+            else:
+                with open(self.path + ".devices", "a") as file:
+                    file.write(ip + "\n")
+        return index
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False
+            if item:
+                batch.append(item)
+            if item is None or len(batch) >= self.flush_rows or time.monotonic() >= deadline:
+                if batch:
+                    try:
+                        self._write(batch)
+                    except OSError as e:
+                        print(f"Error al escribir el registro: {e}")
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+            if item is None:
+                break
+        if self.file:
+            self.file.close()
+
+    def _open(self):
+        if self.fmt == "sqlite":
+            # La conexión se crea en el hilo escritor, que es el único que la usa
+            self.file = sqlite3.connect(self.path)
+            self.file.execute("PRAGMA journal_mode=WAL")
+            self.file.execute("PRAGMA synchronous=NORMAL")
+            self.file.executescript(SQLITE_SCHEMA)
+            self.device_ids = {name: index for index, name in self.file.execute("SELECT id, name FROM devices")}
+            return
+        self.file = open(self.path, "ab" if self.fmt == "bin" else "a", newline=None if self.fmt == "bin" else "")
+        self.writer = csv.writer(self.file) if self.fmt == "csv" else None
+        self.opened_day = datetime.now().date()
+
+    def _prune(self):
+        if self.keep_days is None or time.monotonic() < self.next_prune:
+            return
+        self.next_prune = time.monotonic() + SQLITE_PRUNE_INTERVAL
+        with self.file:
+            self.file.execute("DELETE FROM samples WHERE time < ?", (time.time() - self.keep_days * 86400,))
+
+    def _rotate_if_needed(self, first_timestamp):
+        if self.rotate == "size":
+            if self.file.tell() < self.max_bytes:
+                return
+            suffix = datetime.now().strftime("%Y%m%d-%H%M%S")
+        elif self.rotate == "day":
+            if datetime.fromtimestamp(first_timestamp).date() == self.opened_day:
+                return
+            suffix = self.opened_day.isoformat()
+        else:
+            return
+        self.file.close()
+        stem, ext = os.path.splitext(self.path)
+        target = f"{stem}.{suffix}{ext}"
+        counter = 1
+        while os.path.exists(target):
+            target = f"{stem}.{suffix}-{counter}{ext}"
+            counter += 1
+        os.replace(self.path, target)
+        self._open()
+
+    def _write(self, batch):
+        if self.file is None:
+            self._open()
+        if self.fmt == "sqlite":
+            with self.file:
+                self.file.executemany("INSERT INTO samples (time, device, latency, status) VALUES (?, ?, ?, ?)",
+                                      [(timestamp, self._device_id(ip), latency, STATUS_CODES.get(status, 2))
+                                       for timestamp, ip, latency, status in batch])
+            self._prune()
+            return
+        self._rotate_if_needed(batch[0][0])
+        if self.fmt == "bin":
+            nan = float("nan")
+            self.file.write(b"".join(
+                BIN_RECORD.pack(timestamp, self._device_id(ip), nan if latency is None else latency,
+                                STATUS_CODES.get(status, 2))
+                for timestamp, ip, latency, status in batch))
+        else:
+            self.writer.writerows((datetime.fromtimestamp(timestamp), ip, latency, status)
+                                  for timestamp, ip, latency, status in batch)
+        self.file.flush()
+
+class ProbeScheduler:
+    """
+    Un único hilo en segundo plano con su propio event loop sondea todos los dispositivos
+    desde un solo socket ICMP, usando una rueda de tiempos: el intervalo se divide en
+    ranuras y cada dispositivo se asigna a la menos cargada. Los resultados se acumulan
+    en una cola que la interfaz vacía por lotes, así el coste no crece con hilos ni forks.
+
+    Sin permisos para sockets ICMP (ni root ni ping_group_range) se recurre a lanzar
+    'ping -c 1' desde el mismo planificador.
+    """
+    def __init__(self, interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT, slots=WHEEL_SLOTS):
+        self.interval = interval
+        self.timeout = timeout
+        self.wheel = [set() for _ in range(slots)]
+        self.slot_of = {}
+        self.addresses = {}
+        self.results = deque()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.running = False
+        self.sock = None
+        self.raw = False
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+        self.pending = {}
+        self.sent_order = deque()
+
+    def add(self, ip):
+        with self.lock:
+            if ip in self.slot_of:
+                return
+            slot = min(range(len(self.wheel)), key=lambda i: len(self.wheel[i]))
+            self.wheel[slot].add(ip)
+            self.slot_of[ip] = slot
+
+    def remove(self, ip):
+        with self.lock:
+            slot = self.slot_of.pop(ip, None)
+            if slot is not None:
+                self.wheel[slot].discard(ip)
+            self.addresses.pop(ip, None)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Se espera al hilo (como mucho una ranura) para que un nuevo start() no comparta el socket
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def drain(self):
+        """
+        Retorna todos los resultados pendientes: [(ip, instante, latencia_ms o None, estado)]
+        """
+        batch = []
+        while self.results:
+            batch.append(self.results.popleft())
+        return batch
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    def _open_socket(self):
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except PermissionError:
+            try:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+                self.raw = True
+            except PermissionError:
+                self.sock = None
+                return
+        self.sock.setblocking(False)
+        self.loop.add_reader(self.sock.fileno(), self._on_reply)
+
+    async def _main(self):
+        self.pending.clear()
+        self.sent_order.clear()
+        self._open_socket()
+        tick = self.interval / len(self.wheel)
+        next_tick = self.loop.time()
+        slot = 0
+        try:
+            while self.running:
+                with self.lock:
+                    due = list(self.wheel[slot])
+                for ip in due:
+                    if self.sock:
+                        await self._send(ip)
+                    else:
+                        self.loop.create_task(self._ping_subprocess(ip))
+                self._expire()
+                slot = (slot + 1) % len(self.wheel)
+                next_tick += tick
+                await asyncio.sleep(max(0.0, next_tick - self.loop.time()))
+        finally:
+            if self.sock:
+                self.loop.remove_reader(self.sock.fileno())
+                self.sock.close()
+                self.sock = None
+
+    async def _resolve(self, ip):
+        address = self.addresses.get(ip)
+        if address is None:
+            infos = await self.loop.getaddrinfo(ip, None, family=socket.AF_INET)
+            address = self.addresses[ip] = infos[0][4][0]
+        return address
+
+    async def _send(self, ip):
+        try:
+            address = await self._resolve(ip)
+        except (socket.gaierror, OSError):
+            self.results.append((ip, time.time(), None, "Error"))
+            return
+        self.seq = (self.seq + 1) & 0xFFFF
+        header = struct.pack("!BBHHH", 8, 0, 0, self.ident, self.seq)
+        payload = b"NetworkMonitor"
+        packet = struct.pack("!BBHHH", 8, 0, icmp_checksum(header + payload), self.ident, self.seq) + payload
+        now = time.perf_counter()
+        try:
+            self.sock.sendto(packet, (address, 0))
+        except OSError:
+            self.results.append((ip, time.time(), None, "Inalcanzable"))
+            return
+        key = (address, self.seq)
+        self.pending[key] = (ip, now)
+        self.sent_order.append((now, key))
+
+    def _on_reply(self):
+        while True:
+            try:
+                data, (address, _) = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            received = time.perf_counter()
+            offset = (data[0] & 0x0F) * 4 if self.raw else 0
+            if len(data) < offset + 8 or data[offset] != 0:  # 0 = echo reply
+                continue
+            ident, seq = struct.unpack_from("!HH", data, offset + 4)
+            if self.raw and ident != self.ident:
+                continue
+            entry = self.pending.pop((address, seq), None)
+            if entry:
+                ip, sent = entry
+                self.results.append((ip, time.time(), (received - sent) * 1000, "Éxito"))
+
+    def _expire(self):
+        """
+        Los ecos se envían en orden, así que los caducados siempre están al principio
+        """
+        limit = time.perf_counter() - self.timeout
+        while self.sent_order and self.sent_order[0][0] < limit:
+            _, key = self.sent_order.popleft()
+            entry = self.pending.pop(key, None)
+            if entry:
+                self.results.append((entry[0], time.time(), None, "Fallo"))
+
+    async def _ping_subprocess(self, ip):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ping", "-c", "1", "-W", str(int(self.timeout) or 1), ip,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+            output, _ = await process.communicate()
+            if process.returncode != 0:
+                self.results.append((ip, time.time(), None, "Fallo"))
+                return
+            latency = float(output.decode().split("time=")[1].split()[0])
+            self.results.append((ip, time.time(), latency, "Éxito"))
+        except Exception as e:
+            print(f"Error al hacer ping a {ip}: {str(e)}")
+            self.results.append((ip, time.time(), None, "Error"))
+
 class NetworkMonitor:
-    def __init__(self, master):
+    def __init__(self, master, logger=None, history=None, min_failures=OUTAGE_MIN_FAILURES):
         self.master = master
+        # Con history ({dispositivo: HistorySeries}) se reproduce un registro en lugar de sondear
+        self.history = history
+        self.logger = logger or (None if history is not None else EventLogger())
         self.master.title("Monitor de Red")
         self.master.geometry("1000x700")
         self.master.configure(bg='#f0f0f0')
 
         self.devices = {}
         self.running = False
-        self.max_data_points = 100
         self.start_time = None
+        self.epoch = time.time()
+        self.window = "5 min"
+        if history:
+            self.epoch = min(series.times[0] for series in history.values())
+            self.replay_last = max(series.times[-1] for series in history.values())
+            self.replay_end = self.replay_last
+            self.window = "1 hora"
+            self.outage_cache = {}
+            self.min_failures = min_failures
+            self.outage_spans = []
+        self.scheduler = ProbeScheduler()
+        # Una línea persistente por dispositivo graficado; el fondo estático (ejes, rejilla, leyenda)
+        # se guarda tras cada dibujado completo y en cada fotograma solo se pintan las líneas
+        self.lines = {}
+        self.background = None
+        self.graph_dirty = False
+        self.layout_dirty = True
+        # Tabla: las filas de todos los dispositivos existen en el Treeview, las que no pasan
+        # el filtro están desenganchadas (detach); solo se tocan las filas marcadas como sucias
+        self.visible = set()
+        self.dirty_rows = set()
+        self.sort_column = 'IP'
+        self.sort_reverse = False
+        self.state_filter = DEVICE_STATES[0]
+        self.latency_filter = None
 
         self.create_widgets()
+        if history:
+            self.master.title(f"Monitor de Red - reproducción de {len(history)} dispositivos")
+            for ip, series in history.items():
+                last = series.latency[-1]
+                self.insert_device(ip, {"series": series, "state": "Inalcanzable" if last != last else "Activo",
+                                        "latency": series.mean})
+            self.apply_view()
+        self.master.after(RESULTS_POLL_MS, self.process_results)
+        self.master.after(int(1000 / GRAPH_FPS), self.render_graph)
 
     def create_widgets(self):
         # Frame principal
@@ -30,30 +867,59 @@ class NetworkMonitor:
 
         # Frame de entrada
         input_frame = ttk.Frame(main_frame, padding="10")
-        input_frame.pack(fill=tk.X, pady=(0, 20))
+        input_frame.pack(fill=tk.X, pady=(0, 10))
 
-        ttk.Label(input_frame, text="Dirección IP:").pack(side=tk.LEFT)
+        ttk.Label(input_frame, text="Dirección IP o red:").pack(side=tk.LEFT)
         self.ip_entry = ttk.Entry(input_frame, width=30)
         self.ip_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5)
         self.ip_entry.bind('<Return>', self.add_device)
 
-        ttk.Button(input_frame, text="Añadir", command=self.add_device).pack(side=tk.LEFT, padx=(0, 5))
+        add_button = ttk.Button(input_frame, text="Añadir", command=self.add_device)
+        add_button.pack(side=tk.LEFT, padx=(0, 5))
+        import_button = ttk.Button(input_frame, text="Importar...", command=self.import_file)
+        import_button.pack(side=tk.LEFT, padx=(0, 5))
         self.start_button = ttk.Button(input_frame, text="Iniciar", command=self.start_monitoring)
         self.start_button.pack(side=tk.LEFT, padx=(0, 5))
         self.stop_button = ttk.Button(input_frame, text="Detener", command=self.stop_monitoring, state=tk.DISABLED)
         self.stop_button.pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(input_frame, text="Borrar IP", command=self.remove_device).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(input_frame, text="Salir", command=self.quit_app).pack(side=tk.LEFT)
+        if self.history is not None:
+            for widget in (self.ip_entry, add_button, import_button, self.start_button):
+                widget.config(state=tk.DISABLED)
+
+        # Frame de filtros
+        filter_frame = ttk.Frame(main_frame, padding=(10, 0))
+        filter_frame.pack(fill=tk.X)
+
+        ttk.Label(filter_frame, text="Mostrar:").pack(side=tk.LEFT)
+        self.state_box = ttk.Combobox(filter_frame, values=DEVICE_STATES, state="readonly", width=12)
+        self.state_box.set(DEVICE_STATES[0])
+        self.state_box.pack(side=tk.LEFT, padx=5)
+        self.state_box.bind('<<ComboboxSelected>>', self.apply_view)
+        ttk.Label(filter_frame, text="Latencia mínima (ms):").pack(side=tk.LEFT, padx=(10, 0))
+        self.latency_entry = ttk.Entry(filter_frame, width=8)
+        self.latency_entry.pack(side=tk.LEFT, padx=5)
+        self.latency_entry.bind('<Return>', self.apply_view)
+        self.count_label = ttk.Label(filter_frame, text="0 dispositivos")
+        self.count_label.pack(side=tk.LEFT, padx=10)
+        self.window_box = ttk.Combobox(filter_frame, values=list(GRAPH_WINDOWS), state="readonly", width=9)
+        self.window_box.set(self.window)
+        self.window_box.pack(side=tk.RIGHT)
+        self.window_box.bind('<<ComboboxSelected>>', self.change_window)
+        ttk.Label(filter_frame, text="Ventana:").pack(side=tk.RIGHT, padx=(10, 5))
 
         # Frame de dispositivos
         device_frame = ttk.Frame(main_frame, padding="10")
         device_frame.pack(fill=tk.BOTH, expand=True)
 
-        self.device_tree = ttk.Treeview(device_frame, columns=('IP', 'Status'), show='headings')
-        self.device_tree.heading('IP', text='Dirección IP')
-        self.device_tree.heading('Status', text='Estado')
+        self.device_tree = ttk.Treeview(device_frame, columns=tuple(TABLE_COLUMNS), show='headings')
+        for column, title in TABLE_COLUMNS.items():
+            self.device_tree.heading(column, text=title, command=lambda c=column: self.sort_by(c))
+            self.device_tree.column(column, width=160 if column == 'IP' else 100)
         self.device_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.device_tree.bind('<Delete>', self.remove_device)
+        self.device_tree.bind('<<TreeviewSelect>>', self.sync_lines)
 
         scrollbar = ttk.Scrollbar(device_frame, orient=tk.VERTICAL, command=self.device_tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -64,33 +930,183 @@ class NetworkMonitor:
         graph_frame.pack(fill=tk.BOTH, expand=True)
 
         self.fig, self.ax = plt.subplots(figsize=(10, 4), dpi=100)
+        self.ax.set_xlabel(f"Tiempo ({GRAPH_WINDOWS[self.window][2]})")
+        self.ax.set_ylabel("Latencia (ms)")
+        self.ax.set_title("Monitoreo de Latencia")
+        self.ax.set_xlim(0, 10)
+        self.ax.set_ylim(0, 10)
         self.canvas = FigureCanvasTkAgg(self.fig, master=graph_frame)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+        if self.history:
+            # Deslizador de reproducción: fija el final de la ventana visible
+            scrub_frame = ttk.Frame(graph_frame)
+            scrub_frame.pack(fill=tk.X)
+            self.scrub_label = ttk.Label(scrub_frame, text=str(datetime.fromtimestamp(self.replay_end)), width=28)
+            self.scrub_label.pack(side=tk.RIGHT)
+            self.scrub_scale = tk.Scale(scrub_frame, from_=0, to=int(self.replay_last - self.epoch) + 1,
+                                        orient=tk.HORIZONTAL, showvalue=False, command=self.scrub)
+            self.scrub_scale.set(int(self.replay_last - self.epoch) + 1)
+            self.scrub_scale.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
     def add_device(self, event=None):
-        ip = self.ip_entry.get().strip()
-        if ip and ip not in self.devices:
-            self.devices[ip] = {
-                "latency": deque(maxlen=self.max_data_points),
-                "times": deque(maxlen=self.max_data_points),
-                "status": "No iniciado",
-                "tree_id": self.device_tree.insert('', 'end', values=(ip, "No iniciado"))
-            }
-            self.ip_entry.delete(0, tk.END)
-        elif ip in self.devices:
-            messagebox.showwarning("Advertencia", f"La IP {ip} ya está en la lista.")
-        else:
+        text = self.ip_entry.get().strip()
+        if not text:
             messagebox.showwarning("Advertencia", "Por favor, ingrese una dirección IP válida.")
+            return
+        targets = expand_targets(text.replace(",", " ").split())
+        added = self.add_devices(targets)
+        if added:
+            self.ip_entry.delete(0, tk.END)
+        elif len(targets) == 1:
+            messagebox.showwarning("Advertencia", f"La IP {targets[0]} ya está en la lista.")
+
+    def import_file(self):
+        filename = filedialog.askopenfilename(title="Importar dispositivos",
+                                              filetypes=[("Texto", "*.txt"), ("Todos", "*")])
+        if filename:
+            targets = read_targets(filename)
+            added = self.add_devices(targets)
+            messagebox.showinfo("Importar", f"Se añadieron {added} dispositivos ({len(targets) - added} repetidos).")
+
+    def add_devices(self, targets):
+        """
+        Añade de una vez una lista de IPs/nombres; retorna cuántos eran nuevos
+        """
+        new = [ip for ip in dict.fromkeys(targets) if ip not in self.devices]
+        memory_mb = len(new) * series_bytes() / 2**20
+        if memory_mb > IMPORT_CONFIRM_MB and not messagebox.askokcancel(
+                "Importar", f"Se van a añadir {len(new)} dispositivos, cuyo historial puede ocupar "
+                            f"hasta {memory_mb:,.0f} MB de memoria. ¿Continuar?"):
+            return 0
+        for ip in new:
+            self.insert_device(ip, {"series": DeviceSeries(), "state": "No iniciado", "latency": None})
+            if self.running:
+                self.scheduler.add(ip)
+        if new:
+            self.apply_view()
+        return len(new)
+
+    def insert_device(self, ip, device):
+        self.devices[ip] = device
+        self.device_tree.insert('', 'end', iid=ip, values=self.row_values(ip))
+        self.visible.add(ip)
 
     def remove_device(self, event=None):
-        selected_item = self.device_tree.selection()
-        if selected_item:
-            ip = self.device_tree.item(selected_item)['values'][0]
+        selected = self.device_tree.selection()
+        if not selected:
+            messagebox.showwarning("Advertencia", "Por favor, seleccione una IP para borrar.")
+            return
+        for ip in selected:
             del self.devices[ip]
-            self.device_tree.delete(selected_item)
+            self.scheduler.remove(ip)
+            self.visible.discard(ip)
+            self.dirty_rows.discard(ip)
+        self.device_tree.delete(*selected)
+        self.count_label.config(text=f"{len(self.visible)} de {len(self.devices)} dispositivos")
+        self.sync_lines()
+
+    def row_values(self, ip):
+        device = self.devices[ip]
+        series = device["series"]
+        latency = device["latency"]
+        return (ip, device["state"],
+                "" if latency is None else f"{latency:.2f}",
+                f"{series.loss:.0f}" if series.size else "",
+                f"{series.jitter:.2f}" if series.delta_count else "")
+
+    def matches(self, ip):
+        device = self.devices[ip]
+        if self.state_filter != DEVICE_STATES[0] and device["state"] != self.state_filter:
+            return False
+        if self.latency_filter is not None:
+            return device["latency"] is not None and device["latency"] >= self.latency_filter
+        return True
+
+    def sort_key(self, ip):
+        device = self.devices[ip]
+        if self.sort_column == 'Latency':
+            return np.inf if device["latency"] is None else device["latency"]
+        if self.sort_column == 'Loss':
+            return device["series"].loss
+        if self.sort_column == 'Jitter':
+            jitter = device["series"].jitter
+            return np.inf if jitter != jitter else jitter
+        if self.sort_column == 'Status':
+            return device["state"]
+        try:
+            return (0, int(ipaddress.ip_address(ip)))
+        except ValueError:
+            return (1, ip)
+
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
         else:
-            messagebox.showwarning("Advertencia", "Por favor, seleccione una IP para borrar.")
+            self.sort_column, self.sort_reverse = column, False
+        self.apply_view()
+
+    def apply_view(self, event=None):
+        """
+        Reconstruye de una pasada qué filas se ven y en qué orden (al cambiar filtro u orden)
+        """
+        self.state_filter = self.state_box.get()
+        try:
+            self.latency_filter = float(self.latency_entry.get()) if self.latency_entry.get().strip() else None
+        except ValueError:
+            self.latency_filter = None
+        rows = sorted((ip for ip in self.devices if self.matches(ip)), key=self.sort_key, reverse=self.sort_reverse)
+        self.device_tree.detach(*self.device_tree.get_children())
+        for index, ip in enumerate(rows):
+            self.device_tree.move(ip, '', index)
+            self.device_tree.item(ip, values=self.row_values(ip))
+        self.visible = set(rows)
+        self.dirty_rows.clear()
+        self.count_label.config(text=f"{len(rows)} de {len(self.devices)} dispositivos")
+        self.sync_lines()
+
+    def refresh_rows(self):
+        """
+        Una pasada por fotograma: solo las filas cuyo estado cambió. Las que empiezan a
+        cumplir el filtro se añaden al final; el orden completo se rehace con apply_view.
+        """
+        if not self.dirty_rows:
+            return
+        for ip in self.dirty_rows:
+            if ip not in self.devices:
+                continue
+            if self.matches(ip):
+                self.device_tree.item(ip, values=self.row_values(ip))
+                if ip not in self.visible:
+                    self.device_tree.move(ip, '', 'end')
+                    self.visible.add(ip)
+            elif ip in self.visible:
+                self.device_tree.detach(ip)
+                self.visible.discard(ip)
+        self.dirty_rows.clear()
+        self.count_label.config(text=f"{len(self.visible)} de {len(self.devices)} dispositivos")
+
+    def sync_lines(self, event=None):
+        """
+        Con miles de dispositivos no se grafican todos: solo los seleccionados o,
+        sin selección, los primeros GRAPH_MAX_LINES de la tabla en su orden actual
+        """
+        targets = self.device_tree.selection()[:GRAPH_MAX_LINES] or self.device_tree.get_children()[:GRAPH_MAX_LINES]
+        if set(targets) == set(self.lines):
+            return
+        for ip in set(self.lines) - set(targets):
+            for line in self.lines.pop(ip):
+                line.remove()
+        for ip in targets:
+            if ip not in self.lines:
+                # Media y, más tenue, máximo: con ventanas largas el máximo de cada cubo delata los picos
+                mean_line, = self.ax.plot([], [], label=ip, animated=True)
+                peak_line, = self.ax.plot([], [], color=mean_line.get_color(), alpha=0.3, linewidth=0.8,
+                                          label=f"_{ip}", animated=True)
+                self.lines[ip] = (mean_line, peak_line)
+        self.layout_dirty = True
 
     def start_monitoring(self):
         self.running = True
@@ -98,75 +1114,236 @@ class NetworkMonitor:
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         for ip in self.devices:
-            threading.Thread(target=self.monitor_device, args=(ip,), daemon=True).start()
+            self.scheduler.add(ip)
+        self.scheduler.start()
 
     def stop_monitoring(self):
         self.running = False
+        self.scheduler.stop()
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
 
-    def monitor_device(self, ip):
-        while self.running and ip in self.devices:
-            try:
-                output = subprocess.check_output(["ping", "-c", "1", ip], universal_newlines=True)
-                latency = float(output.split("time=")[1].split()[0])
-                current_time = time.time() - self.start_time
-                self.devices[ip]["latency"].append(latency)
-                self.devices[ip]["times"].append(current_time)
-                status = f"Latencia: {latency:.2f} ms"
-                self.devices[ip]["status"] = status
-                self.log_event(ip, latency, "Éxito")
-            except subprocess.CalledProcessError:
-                current_time = time.time() - self.start_time
-                self.devices[ip]["latency"].append(None)
-                self.devices[ip]["times"].append(current_time)
-                status = "Inalcanzable"
-                self.devices[ip]["status"] = status
-                self.log_event(ip, None, "Fallo")
-            except Exception as e:
-                print(f"Error al hacer ping a {ip}: {str(e)}")
-                current_time = time.time() - self.start_time
-                self.devices[ip]["latency"].append(None)
-                self.devices[ip]["times"].append(current_time)
-                status = "Error"
-                self.devices[ip]["status"] = status
-                self.log_event(ip, None, "Error")
-
-            self.master.after(0, self.update_device_status, ip, status)
-            self.master.after(0, self.update_graph)
-            time.sleep(1)
-
-    def update_device_status(self, ip, status):
-        if ip in self.devices:
-            self.device_tree.item(self.devices[ip]["tree_id"], values=(ip, status))
+    def process_results(self):
+        """
+        Aplica de una vez todos los resultados acumulados por el planificador;
+        tabla y gráfico solo se marcan como pendientes y los redibuja render_graph
+        """
+        batch = self.scheduler.drain()
+        for ip, timestamp, latency, outcome in batch:
+            device = self.devices.get(ip)
+            if device is None or self.start_time is None:
+                continue
+            # Sin respuesta se guarda NaN: el hueco se ve en la línea y tiempos y latencias siguen alineados
+            device["series"].append(timestamp, latency)
+            device["latency"] = latency
+            device["state"] = OUTCOME_STATES.get(outcome, "Error")
+            self.log_event(timestamp, ip, latency, outcome)
+            self.dirty_rows.add(ip)
+        if batch:
+            self.graph_dirty = True
+        self.master.after(RESULTS_POLL_MS, self.process_results)
+
+    def render_graph(self):
+        self.refresh_rows()
+        if self.graph_dirty or self.layout_dirty:
+            self.graph_dirty = False
+            self.update_graph()
+        self.master.after(int(1000 / GRAPH_FPS), self.render_graph)
+
+    def change_window(self, event=None):
+        self.window = self.window_box.get()
+        self.ax.set_xlabel(f"Tiempo ({GRAPH_WINDOWS[self.window][2]})")
+        self.layout_dirty = True
+
+    def scrub(self, value):
+        self.replay_end = self.epoch + float(value)
+        self.scrub_label.config(text=str(datetime.fromtimestamp(self.replay_end).replace(microsecond=0)))
+        self.layout_dirty = True
+
+    def draw_outages(self, span, unit):
+        """
+        Sombrea en el fondo las caídas de los dispositivos graficados que caen en la ventana
+        """
+        for patch in self.outage_spans:
+            patch.remove()
+        self.outage_spans = []
+        start_limit = self.replay_end - span
+        for ip, (mean_line, _) in self.lines.items():
+            if ip not in self.outage_cache:
+                self.outage_cache[ip] = self.devices[ip]["series"].outages(self.min_failures)
+            for start, end, _ in self.outage_cache[ip]:
+                if end >= start_limit and start <= self.replay_end:
+                    self.outage_spans.append(self.ax.axvspan((start - self.epoch) / unit, (end - self.epoch) / unit,
+                                                             color=mean_line.get_color(), alpha=0.15))
+
+    def on_draw(self, event):
+        # Tras un dibujado completo (cambio de escala, leyenda o tamaño de ventana) se guarda el fondo
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for lines in self.lines.values():
+            for line in lines:
+                self.ax.draw_artist(line)
+
+    def rescale(self, t_min, t_max, y_max, width, force=False):
+        """
+        Ajusta los ejes solo cuando los datos se salen de ellos, dejando margen
+        para que los dibujados completos sean la excepción. width es el ancho de la
+        ventana en unidades del eje. Retorna True si cambiaron.
+        """
+        changed = False
+        left, right = self.ax.get_xlim()
+        if force or t_max > right or t_min < left:
+            self.ax.set_xlim(t_min, max(t_max + width * 0.25, t_min + width))
+            changed = True
+        bottom, top = self.ax.get_ylim()
+        if force or y_max > top or y_max * 4 < top and top > 10:
+            self.ax.set_ylim(0, max(y_max * 1.25, 10.0))
+            changed = True
+        return changed
 
     def update_graph(self):
         try:
-            self.ax.clear()
-            for ip, data in self.devices.items():
-                times = list(data["times"])
-                latencies = [l for l in data["latency"] if l is not None]
-                if latencies and times:
-                    self.ax.plot(times, latencies, label=ip)
-            self.ax.legend()
-            self.ax.set_xlabel("Tiempo (segundos)")
-            self.ax.set_ylabel("Latencia (ms)")
-            self.ax.set_title("Monitoreo de Latencia")
-            self.canvas.draw()
+            span, unit, _ = GRAPH_WINDOWS[self.window]
+            t_min, t_max, y_max = np.inf, -np.inf, 0.0
+            for ip, (mean_line, peak_line) in self.lines.items():
+                series = self.devices[ip]["series"]
+                times, _, mean, peak = series.view(span) if self.history is None else series.view(span, self.replay_end)
+                times = (times - self.epoch) / unit
+                mean_line.set_data(times, mean)
+                peak_line.set_data(times, peak)
+                if len(times):
+                    t_min, t_max = min(t_min, times[0]), max(t_max, times[-1])
+                    finite = peak[np.isfinite(peak)]
+                    if finite.size:
+                        y_max = max(y_max, finite.max())
+            if self.history is not None:
+                # En reproducción la ventana la fija el deslizador y solo cambia al moverlo
+                rescaled = self.layout_dirty
+                if rescaled:
+                    end = (self.replay_end - self.epoch) / unit
+                    self.ax.set_xlim(end - span / unit, end)
+                    self.ax.set_ylim(0, max(y_max * 1.25, 10.0))
+                    self.draw_outages(span, unit)
+            else:
+                rescaled = np.isfinite(t_max) and self.rescale(t_min, t_max, y_max, span / unit,
+                                                               force=self.layout_dirty)
+            if self.layout_dirty:
+                legend = self.ax.get_legend()
+                if legend:
+                    legend.remove()
+                if self.lines:
+                    self.ax.legend(loc="upper left")
+            if rescaled or self.layout_dirty or self.background is None:
+                self.layout_dirty = False
+                self.canvas.draw()
+            else:
+                self.canvas.restore_region(self.background)
+                for lines in self.lines.values():
+                    for line in lines:
+                        self.ax.draw_artist(line)
+                self.canvas.blit(self.ax.bbox)
         except Exception as e:
             print(f"Error al actualizar el gráfico: {str(e)}")
 
-    def log_event(self, ip, latency, status):
-        with open("network_log.csv", "a", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([datetime.now(), ip, latency, status])
+    def log_event(self, timestamp, ip, latency, status):
+        if self.logger:
+            self.logger.log(timestamp, ip, latency, status)
 
     def quit_app(self):
         if messagebox.askokcancel("Salir", "¿Está seguro que desea salir?"):
             self.stop_monitoring()
             self.master.quit()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Monitor de latencia ICMP para varios dispositivos.")
+    parser.add_argument("-i", "--input", help="Fichero con un dispositivo o red CIDR por línea para cargar al inicio")
+    parser.add_argument("--replay", nargs="+", metavar="REGISTRO",
+                        help="Reproduce uno o varios registros (CSV, .bin o .db) en lugar de sondear")
+    parser.add_argument("--outages", metavar="CSV",
+                        help="Con --replay, escribe las caídas (fallos seguidos) de cada dispositivo en este CSV")
+    parser.add_argument("--min-failures", type=int, default=OUTAGE_MIN_FAILURES,
+                        help=f"Fallos seguidos para contar una caída (por defecto: {OUTAGE_MIN_FAILURES})")
+    parser.add_argument("--log-file", default=LOG_FILE, help=f"Fichero de registro de eventos (por defecto: {LOG_FILE})")
+    parser.add_argument("--log-format", choices=("csv", "bin", "sqlite"), default="csv",
+                        help="csv (por defecto), bin (registro binario compacto para capturas largas) "
+                             "o sqlite (base en modo WAL que la interfaz puede abrir con --replay)")
+    parser.add_argument("--rotate", choices=("size", "day"), help="Rota el registro por tamaño o por día")
+    parser.add_argument("--max-mb", type=float, default=LOG_MAX_MB,
+                        help=f"Tamaño máximo por fichero con --rotate size (por defecto: {LOG_MAX_MB} MB)")
+    parser.add_argument("--keep-days", type=float,
+                        help="Con --log-format sqlite, purga las muestras más antiguas que estos días")
+    parser.add_argument("--headless", action="store_true",
+                        help="Sin interfaz: sondea los dispositivos de -i y solo registra (servicio 24/7). "
+                             "Con --replay, solo calcula las caídas")
+    return parser.parse_args()
+
+def replay(args):
+    start = time.perf_counter()
+    history = load_history(args.replay)
+    samples = sum(series.size for series in history.values())
+    print(f"Cargadas {samples} muestras de {len(history)} dispositivos en {time.perf_counter() - start:.1f} s")
+    if not history:
+        sys.exit("Los registros no contienen eventos")
+    if args.outages:
+        total = write_outages(history, args.outages, args.min_failures)
+        print(f"{total} caídas escritas en {args.outages}")
+    if args.headless:
+        return
+    import_gui()
+    root = tk.Tk()
+    NetworkMonitor(root, history=history, min_failures=args.min_failures)
+    root.mainloop()
+
+def run_headless(targets, logger):
+    """
+    El mismo bucle que la interfaz (planificador + registro por lotes) sin Tk ni matplotlib.
+    Termina con SIGINT o SIGTERM.
+    """
+    scheduler = ProbeScheduler()
+    for ip in targets:
+        scheduler.add(ip)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    states = dict.fromkeys(targets, "No iniciado")
+    print(f"Monitorizando {len(targets)} dispositivos sin interfaz; registro en {logger.path}")
+    scheduler.start()
+    next_report = time.monotonic() + HEADLESS_REPORT
+    while not stop.wait(RESULTS_POLL_MS / 1000):
+        for ip, timestamp, latency, outcome in scheduler.drain():
+            logger.log(timestamp, ip, latency, outcome)
+            states[ip] = OUTCOME_STATES.get(outcome, "Error")
+        if time.monotonic() >= next_report:
+            next_report += HEADLESS_REPORT
+            counts = {state: 0 for state in DEVICE_STATES[1:]}
+            for state in states.values():
+                counts[state] += 1
+            print(f"{datetime.now().replace(microsecond=0)} " + ", ".join(f"{state}: {count}" for state, count in counts.items()))
+    scheduler.stop()
+    for ip, timestamp, latency, outcome in scheduler.drain():
+        logger.log(timestamp, ip, latency, outcome)
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.replay:
+        replay(args)
+        sys.exit(0)
+    log_file = args.log_file
+    if log_file == LOG_FILE:
+        log_file = os.path.splitext(LOG_FILE)[0] + LOG_EXTENSIONS[args.log_format]
+    logger = EventLogger(log_file, fmt=args.log_format, rotate=args.rotate, max_mb=args.max_mb,
+                         keep_days=args.keep_days)
+    if args.headless:
+        targets = read_targets(args.input) if args.input else []
+        if not targets:
+            logger.close()
+            sys.exit("El modo --headless necesita los dispositivos en un fichero (-i ip.txt)")
+        run_headless(targets, logger)
+        logger.close()
+        sys.exit(0)
+    import_gui()
     root = tk.Tk()
-    app = NetworkMonitor(root)
+    app = NetworkMonitor(root, logger)
+    if args.input:
+        app.add_devices(read_targets(args.input))
     root.mainloop()
+    logger.close()
@@ -8,11 +8,18 @@ import multiprocessing
 import logging
 import argparse
 import json
+import re
+import shutil
 from tqdm import tqdm
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Límite de cada lote: el timeout base más BATCH_TIMEOUT_PER_IP segundos por cada IP adicional,
+# sin pasar de BATCH_TIMEOUT_MAX (un nmap colgado no retiene los resultados del lote indefinidamente)
+BATCH_TIMEOUT_PER_IP = 10
+BATCH_TIMEOUT_MAX = 3600
+
 async def read_ips(file_path):
     """Lee las IPs desde un archivo de texto."""
     try:
@@ -22,45 +29,120 @@ async def read_ips(file_path):
         logging.error(f"Error reading IP file: {e}")
         return []
 
-def scan_ip_sync(ip, port_range='1-65535', scan_args='-T5 -n -Pn --min-rate=5000 --max-retries=2', udp_scan=False):
-    """Escanea puertos de una IP de forma síncrona utilizando nmap."""
+# Tipos de escaneo TCP de nmap; si scan_args no trae ninguno se añade -sS al combinar con -sU
+TCP_SCAN_TYPES = re.compile(r'(^|\s)-s[STAWMNFXI]')
+
+def find_nmap_services():
+    """Busca el fichero nmap-services (NMAPDIR, junto al binario de nmap o rutas estándar)."""
+    candidates = [os.environ.get('NMAPDIR', '')]
+    nmap_bin = shutil.which('nmap')
+    if nmap_bin:
+        nmap_dir = os.path.dirname(os.path.realpath(nmap_bin))
+        candidates += [nmap_dir, os.path.join(os.path.dirname(nmap_dir), 'share', 'nmap')]
+    candidates += ['/usr/share/nmap', '/usr/local/share/nmap', '/opt/homebrew/share/nmap']
+    for directory in candidates:
+        path = os.path.join(directory, 'nmap-services')
+        if directory and os.path.isfile(path):
+            return path
+    return None
+
+def top_udp_ports(count):
+    """Retorna los count puertos UDP más frecuentes según nmap-services, como lista de puertos para -p."""
+    path = find_nmap_services()
+    if not path:
+        return None
+    ports = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3 or line.startswith('#') or not fields[1].endswith('/udp'):
+                continue
+            ports.append((float(fields[2]), int(fields[1].split('/')[0])))
+    top = sorted(port for _, port in sorted(ports, reverse=True)[:max(1, count)])
+    return ','.join(map(str, top))
+
+def host_result(nm, ip, udp_scan=False):
+    """Extrae el resultado de una IP de un escaneo ya realizado, en el formato de scan_ip_sync."""
+    if ip not in nm.all_hosts():
+        return ip, "IP not reachable"
+    if 'tcp' not in nm[ip] and not (udp_scan and 'udp' in nm[ip]):
+        return ip, "No TCP ports scanned"
+    open_ports = [port for port, data in nm[ip].get('tcp', {}).items() if data['state'] == 'open']
+    if udp_scan:
+        udp_open_ports = [port for port, data in nm[ip].get('udp', {}).items() if data['state'] == 'open']
+        return ip, {'tcp': open_ports, 'udp': udp_open_ports}
+    return ip, open_ports
+
+def scan_batch_sync(ips, port_range='1-65535', scan_args='-T5 -n -Pn --min-rate=5000 --max-retries=2', udp_scan=False,
+                    udp_ports=None):
+    """Escanea un lote de IPs con una sola invocación de nmap y separa la salida por IP.
+
+    nmap reparte su paralelismo y su control de tasa entre todos los objetivos de la
+    invocación, por lo que un proceso por lote rinde mucho más que uno por IP. Con
+    udp_scan, TCP (port_range) y UDP (udp_ports, por defecto port_range) se escanean en
+    la misma pasada con -sU y puertos 'T:...,U:...'.
+    """
     nm = nmap.PortScanner()
     try:
-        nm.scan(ip, port_range, scan_args)
-        if ip not in nm.all_hosts():
-            return ip, "IP not reachable"
-        if 'tcp' not in nm[ip]:
-            return ip, "No TCP ports scanned"
-        open_ports = [port for port, data in nm[ip]['tcp'].items() if data['state'] == 'open']
-        
         if udp_scan:
-            nm.scan(ip, port_range, scan_args + ' -sU')
-            udp_open_ports = [port for port, data in nm[ip].get('udp', {}).items() if data['state'] == 'open']
-            return ip, {'tcp': open_ports, 'udp': udp_open_ports}
-
-        return ip, open_ports
+            ports = f"T:{port_range},U:{udp_ports or port_range}"
+            scan_args += ' -sU' if TCP_SCAN_TYPES.search(scan_args) else ' -sS -sU'
+        else:
+            ports = port_range
+        nm.scan(' '.join(ips), ports, scan_args)
+        return [host_result(nm, ip, udp_scan) for ip in ips]
     except nmap.PortScannerError as e:
-        return ip, f"Nmap scan error: {str(e)}"
+        return [(ip, f"Nmap scan error: {str(e)}") for ip in ips]
     except Exception as e:
-        return ip, f"General error: {str(e)}"
+        return [(ip, f"General error: {str(e)}") for ip in ips]
 
-async def scan_ip_pool(ip, pool, semaphore, port_range, scan_args, pbar, timeout=300, udp_scan=False):
-    """Gestiona la concurrencia de los escaneos utilizando semáforos y un pool de procesos."""
+def scan_ip_sync(ip, port_range='1-65535', scan_args='-T5 -n -Pn --min-rate=5000 --max-retries=2', udp_scan=False,
+                 udp_ports=None):
+    """Escanea puertos de una IP de forma síncrona utilizando nmap."""
+    return scan_batch_sync([ip], port_range, scan_args, udp_scan, udp_ports)[0]
+
+def batch_timeout(timeout, batch_size):
+    """Retorna el límite en segundos de un lote de batch_size IPs (timeout para una sola IP)."""
+    return min(timeout + BATCH_TIMEOUT_PER_IP * (batch_size - 1), max(timeout, BATCH_TIMEOUT_MAX))
+
+def make_batches(ips, batch_size):
+    """Agrupa las IPs en lotes de como máximo batch_size direcciones."""
+    batch_size = max(1, batch_size)
+    return [ips[i:i + batch_size] for i in range(0, len(ips), batch_size)]
+
+async def scan_batch_pool(batch, pool, semaphore, port_range, scan_args, pbar, timeout=300, udp_scan=False,
+                          udp_ports=None):
+    """Gestiona la concurrencia de los lotes utilizando semáforos y un pool de procesos.
+
+    El límite de cada lote se calcula con batch_timeout(timeout, len(batch)).
+    """
+    limit = batch_timeout(timeout, len(batch))
     async with semaphore:
         try:
-            result = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(pool, scan_ip_sync, ip, port_range, scan_args, udp_scan),
-                timeout=timeout
+            results = await asyncio.wait_for(
+                asyncio.get_event_loop().run_in_executor(pool, scan_batch_sync, batch, port_range, scan_args,
+                                                        udp_scan, udp_ports),
+                timeout=limit
             )
         except asyncio.TimeoutError:
-            result = (ip, f"Scan timed out after {timeout} seconds")
-        pbar.update(1)
-        return result
+            results = [(ip, f"Scan timed out after {limit} seconds") for ip in batch]
+        pbar.update(len(batch))
+        return results
+
+def has_open_ports(ports):
+    """Indica si un resultado (lista TCP o dict {'tcp', 'udp'}) tiene algún puerto abierto."""
+    return any(ports.values()) if isinstance(ports, dict) else bool(ports)
+
+def format_ports(ports):
+    """Formatea los puertos abiertos de un resultado para el log."""
+    if isinstance(ports, dict):
+        return ' | '.join(f"{proto}: {', '.join(map(str, proto_ports)) or '-'}" for proto, proto_ports in ports.items())
+    return ', '.join(map(str, ports))
 
 async def process_results(results):
     """Procesa los resultados de los escaneos."""
-    open_ports = [(ip, ports) for ip, ports in results if isinstance(ports, list) and ports]
-    closed_ports = [ip for ip, ports in results if isinstance(ports, list) and not ports]
+    open_ports = [(ip, ports) for ip, ports in results if isinstance(ports, (list, dict)) and has_open_ports(ports)]
+    closed_ports = [ip for ip, ports in results if isinstance(ports, (list, dict)) and not has_open_ports(ports)]
     errors = [(ip, error) for ip, error in results if isinstance(error, str)]
     return open_ports, closed_ports, errors
 
@@ -97,21 +179,32 @@ async def main(args):
         logging.error("No IPs to scan. Exiting.")
         return
     
-    max_concurrent = min(multiprocessing.cpu_count() * 4, args.max_concurrent, len(ips))
+    udp_ports = None
+    if args.udp:
+        udp_ports = args.udp_ports or top_udp_ports(args.top_udp)
+        if udp_ports is None:
+            logging.warning(f"nmap-services not found; UDP will scan the TCP port range {args.port_range}")
+        else:
+            logging.info(f"UDP ports: {udp_ports if args.udp_ports else f'top {args.top_udp}'}")
+
+    batches = make_batches(ips, args.batch_size)
+    max_concurrent = min(multiprocessing.cpu_count() * 4, args.max_concurrent, len(batches))
     semaphore = asyncio.Semaphore(max_concurrent)
     
-    logging.info(f"Starting scan of {len(ips)} IPs with max concurrency of {max_concurrent}")
+    logging.info(f"Starting scan of {len(ips)} IPs in {len(batches)} batches of up to {args.batch_size} IPs "
+                 f"with max concurrency of {max_concurrent}")
     
-    with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as pool:
+    with ProcessPoolExecutor(max_workers=min(multiprocessing.cpu_count(), len(batches))) as pool:
         with tqdm(total=len(ips), desc="Scanning IPs") as pbar:
-            tasks = [scan_ip_pool(ip, pool, semaphore, args.port_range, args.scan_args, pbar, timeout=300, udp_scan=args.udp) for ip in ips]
-            results = await asyncio.gather(*tasks)
+            tasks = [scan_batch_pool(batch, pool, semaphore, args.port_range, args.scan_args, pbar,
+                                     timeout=args.timeout, udp_scan=args.udp, udp_ports=udp_ports) for batch in batches]
+            results = [result for batch_results in await asyncio.gather(*tasks) for result in batch_results]
     
     open_ports, closed_ports, errors = await process_results(results)
     
     logging.info("\nResults:")
     for ip, ports in open_ports:
-        logging.info(f"{ip}: Open ports - {', '.join(map(str, ports))}")
+        logging.info(f"{ip}: Open ports - {format_ports(ports)}")
     
     logging.info(f"\nIPs with no open ports: {len(closed_ports)}")
     logging.info(f"IPs with errors: {len(errors)}")
@@ -131,8 +224,13 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--output', help='Output file for results (JSON format)')
     parser.add_argument('-p', '--port-range', default='1-65535', help='Port range to scan (default: 1-65535)')
     parser.add_argument('-a', '--scan-args', default='-T5 -n -Pn --min-rate=5000 --max-retries=2', help='Nmap scan arguments')
-    parser.add_argument('-m', '--max-concurrent', type=int, default=1000, help='Maximum number of concurrent scans')
-    parser.add_argument('-u', '--udp', action='store_true', help='Perform UDP scan in addition to TCP')
+    parser.add_argument('-m', '--max-concurrent', type=int, default=1000, help='Maximum number of concurrent scans (batches)')
+    parser.add_argument('-b', '--batch-size', type=int, default=256, help='IPs per nmap invocation (default: 256, 1 = one nmap per IP)')
+    parser.add_argument('-t', '--timeout', type=int, default=300, help=f'Scan timeout in seconds for a single IP; batches get {BATCH_TIMEOUT_PER_IP}s more per extra IP, '
+                             f'capped at {BATCH_TIMEOUT_MAX}s (default: 300)')
+    parser.add_argument('-u', '--udp', action='store_true', help='Perform UDP scan in the same nmap pass as TCP')
+    parser.add_argument('--top-udp', type=int, default=100, help='With -u, scan the N most frequent UDP ports from nmap-services (default: 100)')
+    parser.add_argument('--udp-ports', help='With -u, explicit UDP ports to scan instead of --top-udp (e.g. 53,123,161 or 1-65535)')
     args = parser.parse_args()
 
     if os.name == 'nt':  # Para Windows
@@ -1,8 +1,25 @@
 #!/usr/bin/python3
 import subprocess
 import csv
+import json
+import argparse
+import asyncio
+import ctypes
+import heapq
+import ipaddress
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from array import array
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from os import system
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime
+from os import system, path, replace
 import sys
 from prettytable import PrettyTable
 
@@ -12,18 +29,56 @@ GREEN = "\033[32m"
 YELLOW = "\033[33m"
 END = "\033[0m"
 
+# Comunidades SNMP a comprobar (el orden define los bits del estado guardado)
+COMMUNITIES = ("public", "GestionGrp")
+
+# Ficheros del modo de detección de cambios
+STATE_FILE = "estado_anterior.json"
+DELTA_FILE = "cambios.csv"
+
+# Modo daemon: intervalo entre ciclos, muestras por host y dirección del exportador
+DAEMON_INTERVAL = 60
+DAEMON_HISTORY = 60
+METRICS_LISTEN = "0.0.0.0:9470"
+
+# Motor asíncrono (--workers): timeouts como los de ping -W 1 y snmpget con timeout 0.9
+ENGINE_ICMP_TIMEOUT = 1.0
+ENGINE_SNMP_TIMEOUT = 0.9
+ENGINE_PING_SPACING = 0.1
+ENGINE_MAX_INFLIGHT = 512
+ENGINE_BATCH = 256
+
+# Instrumentación: sub-buckets por potencia de 2 (16 => error relativo <= 6.25%) y hosts en el ranking
+HIST_SUB_BUCKETS = 16
+HIST_BUCKETS = HIST_SUB_BUCKETS * 40
+SLOWEST_HOSTS = 20
+
 def cleaner():
     system('clear')
 
 def read_ips(filename="ip.txt"):
+    """
+    Lee una IP por línea. Las líneas en notación CIDR (10.0.0.0/16) se expanden a sus hosts.
+    """
     try:
         with open(filename, "r") as file:
-            return file.read().splitlines()
+            lines = file.read().splitlines()
     except FileNotFoundError:
         print("Error: No se encontró el archivo '{}'".format(filename))
         return []
+    ips = []
+    for line in lines:
+        line = line.strip()
+        if "/" in line:
+            try:
+                ips.extend(str(host) for host in ipaddress.ip_network(line, strict=False).hosts())
+                continue
+            except ValueError:
+                print("Aviso: red inválida '{}', se trata como host".format(line))
+        ips.append(line)
+    return ips
 
-def ping_health(ip, count=15):
+def ping_health(ip, count=15, timings=None):
     """
     Realiza múltiples pings y analiza la salud de la conexión
     Retorna: (disponible, paquetes_perdidos, latencia_promedio)
@@ -36,11 +91,27 @@ def ping_health(ip, count=15):
     )
 
     if result.returncode != 0:
+        if timings:
+            for _ in range(count):
+                timings.record(ip, "ICMP", None)
         return False, 100, 0
 
     # Parsear la salida del ping
     output = result.stdout
 
+    # RTT de cada eco (las líneas "time=X ms"); los que faltan son timeouts
+    if timings:
+        replies = 0
+        for line in output.split('\n'):
+            if 'time=' in line:
+                try:
+                    timings.record(ip, "ICMP", int(float(line.split('time=')[1].split()[0]) * 1_000_000))
+                    replies += 1
+                except (ValueError, IndexError):
+                    pass
+        for _ in range(max(0, count - replies)):
+            timings.record(ip, "ICMP", None)
+
     # Extraer pérdida de paquetes
     packet_loss = 0
     for line in output.split('\n'):
@@ -64,26 +135,40 @@ def ping_health(ip, count=15):
 
     return True, packet_loss, avg_latency
 
-def get_ping_status(available, packet_loss, latency):
+def get_ping_class(available, packet_loss, latency):
     """
-    Determina el estado de salud del ping
+    Clasifica la salud del ping en una categoría (DOWN, Excelente, Buena...)
     """
     if not available:
-        return f"{RED}DOWN{END}", RED
+        return "DOWN"
     elif packet_loss == 0 and latency < 50:
-        return f"{GREEN}Excelente (0% loss, {latency:.1f}ms){END}", GREEN
+        return "Excelente"
     elif packet_loss == 0 and latency < 100:
-        return f"{GREEN}Buena (0% loss, {latency:.1f}ms){END}", GREEN
+        return "Buena"
     elif packet_loss > 0 and packet_loss < 20:
-        return f"{YELLOW}Regular ({packet_loss}% loss, {latency:.1f}ms){END}", YELLOW
+        return "Regular"
     elif packet_loss >= 20 and packet_loss < 50:
-        return f"{YELLOW}Mala ({packet_loss}% loss, {latency:.1f}ms){END}", YELLOW
+        return "Mala"
     else:
-        return f"{RED}Crítica ({packet_loss}% loss, {latency:.1f}ms){END}", RED
+        return "Crítica"
+
+def get_ping_status(available, packet_loss, latency):
+    """
+    Determina el estado de salud del ping
+    """
+    ping_class = get_ping_class(available, packet_loss, latency)
+    if ping_class == "DOWN":
+        return f"{RED}DOWN{END}", RED
+    color = GREEN if ping_class in ("Excelente", "Buena") else YELLOW if ping_class in ("Regular", "Mala") else RED
+    return f"{color}{ping_class} ({packet_loss}% loss, {latency:.1f}ms){END}", color
 
-def snmp_get(community, ip):
+def snmp_get(community, ip, timings=None):
     command = ["timeout", "0.9", "snmpget", "-v2c", "-c", community, ip, "SNMPv2-MIB::sysName.0"]
+    start = time.perf_counter_ns()
     result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if timings:
+        # Incluye el arranque de snmpget; 124 es el código de 'timeout' al cortar la espera
+        timings.record(ip, f"SNMP {community}", time.perf_counter_ns() - start if result.returncode == 0 else None)
     return result.returncode == 0
 
 def write_results_to_csv(results):
@@ -93,18 +178,33 @@ def write_results_to_csv(results):
         for result in results:
             writer.writerow(result)
 
-def test_ip(ip):
-    # Test de salud ICMP con 5 pings
-    icmp_available, packet_loss, latency = ping_health(ip, count=5)
-    ping_status, _ = get_ping_status(icmp_available, packet_loss, latency)
+def probe_ip(ip, count=5, timings=None):
+    """
+    Sondeo completo de una IP: salud ICMP y, si responde, cada comunidad SNMP
+    Retorna: (disponible, paquetes_perdidos, latencia_promedio, [resultado por comunidad])
+    """
+    icmp_available, packet_loss, latency = ping_health(ip, count=count, timings=timings)
 
     # Tests SNMP (solo si el host responde a ping)
     if icmp_available:
-        snmp_public_result = snmp_get("public", ip)
-        snmp_gestiongrp_result = snmp_get("GestionGrp", ip)
+        snmp_results = [snmp_get(community, ip, timings) for community in COMMUNITIES]
     else:
-        snmp_public_result = False
-        snmp_gestiongrp_result = False
+        snmp_results = [False] * len(COMMUNITIES)
+    if timings:
+        timings.finish_host(ip)
+    return icmp_available, packet_loss, latency, snmp_results
+
+def test_ip(ip, count=5, timings=None):
+    # Test de salud ICMP con 5 pings
+    return format_result(ip, probe_ip(ip, count, timings))
+
+def format_result(ip, result):
+    """
+    Convierte el resultado de un sondeo en (fila de tabla, fila CSV, estado compacto)
+    """
+    icmp_available, packet_loss, latency, snmp_results = result
+    ping_status, _ = get_ping_status(icmp_available, packet_loss, latency)
+    snmp_public_result, snmp_gestiongrp_result = snmp_results
 
     snmp_public_color = GREEN if snmp_public_result else RED
     snmp_gestiongrp_color = GREEN if snmp_gestiongrp_result else RED
@@ -127,41 +227,881 @@ def test_ip(ip):
         snmp_gestiongrp_result
     ]
 
-    return table_row, csv_row
+    # Registro compacto para el modo de detección de cambios
+    state = make_state(icmp_available, get_ping_class(icmp_available, packet_loss, latency), snmp_results)
+
+    return table_row, csv_row, state
+
+# --- Instrumentación de tiempos por sondeo ---
+
+class LatencyHistogram:
+    """
+    Histograma log-lineal al estilo HDR sobre nanosegundos: HIST_SUB_BUCKETS cubetas
+    por cada potencia de 2, en un array de enteros preasignado. Registrar una muestra
+    es aritmética de enteros y un incremento, sin crear objetos nuevos.
+    """
+    __slots__ = ("counts", "samples", "timeouts", "max_ns")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * HIST_BUCKETS))
+        self.samples = 0
+        self.timeouts = 0
+        self.max_ns = 0
+
+    @staticmethod
+    def bucket(ns):
+        shift = ns.bit_length() - 5
+        if shift <= 0:
+            return ns
+        return min(HIST_BUCKETS - 1, HIST_SUB_BUCKETS * shift + (ns >> shift))
+
+    @staticmethod
+    def bucket_value(index):
+        """
+        Punto medio del rango de valores de la cubeta
+        """
+        if index < 2 * HIST_SUB_BUCKETS:
+            return index
+        shift = index // HIST_SUB_BUCKETS - 1
+        mantissa = index % HIST_SUB_BUCKETS + HIST_SUB_BUCKETS
+        return (mantissa << shift) + (1 << shift) // 2
+
+    def record(self, ns):
+        self.counts[self.bucket(ns)] += 1
+        self.samples += 1
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.samples += other.samples
+        self.timeouts += other.timeouts
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def percentiles(self, quantiles=(50, 90, 99)):
+        """
+        Retorna {cuantil: ns} recorriendo el histograma una sola vez
+        """
+        result = {}
+        pending = sorted(quantiles)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            while pending and seen >= pending[0] / 100 * self.samples:
+                result[pending.pop(0)] = min(self.bucket_value(index), self.max_ns)
+            if not pending:
+                break
+        return result
+
+    def summary_ms(self):
+        values = self.percentiles()
+        summary = {f"p{q}": round(values[q] / 1e6, 3) if q in values else None for q in (50, 90, 99)}
+        summary["max"] = round(self.max_ns / 1e6, 3) if self.samples else None
+        summary["samples"] = self.samples
+        summary["timeouts"] = self.timeouts
+        return summary
+
+class ProbeTimings:
+    """
+    Tiempos de todos los sondeos de un barrido: un histograma por tipo de sondeo
+    (ICMP, SNMP <comunidad>) y otro por tipo y red /24, más el ranking de hosts más lentos.
+    """
+    def __init__(self):
+        self.by_probe = {}
+        self.by_prefix = {}
+        self.host_worst = {}
+        self.slowest = []
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Se envía entre procesos al terminar cada worker; el lock no es serializable
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _probe_histogram(self, probe):
+        histogram = self.by_probe.get(probe)
+        if histogram is None:
+            histogram = self.by_probe[probe] = LatencyHistogram()
+        return histogram
+
+    def _prefix_histogram(self, probe, prefix):
+        prefixes = self.by_prefix.get(probe)
+        if prefixes is None:
+            prefixes = self.by_prefix[probe] = {}
+        histogram = prefixes.get(prefix)
+        if histogram is None:
+            histogram = prefixes[prefix] = LatencyHistogram()
+        return histogram
+
+    def _offer_slowest(self, entry):
+        if len(self.slowest) < SLOWEST_HOSTS:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def record(self, ip, probe, ns):
+        """
+        Registra un sondeo; ns=None indica timeout
+        """
+        with self.lock:
+            histogram = self._probe_histogram(probe)
+            prefix_histogram = self._prefix_histogram(probe, ip[:ip.rfind(".")])
+            if ns is None:
+                histogram.timeouts += 1
+                prefix_histogram.timeouts += 1
+                return
+            histogram.record(ns)
+            prefix_histogram.record(ns)
+            worst = self.host_worst.get(ip)
+            if worst is None or ns > worst[0]:
+                self.host_worst[ip] = (ns, probe)
+
+    def finish_host(self, ip):
+        """
+        Cierra el host y lo ofrece al ranking por su sondeo más lento (heap de tamaño fijo)
+        """
+        with self.lock:
+            worst = self.host_worst.pop(ip, None)
+            if worst is None:
+                return
+            self._offer_slowest((worst[0], ip, worst[1]))
+
+    def merge(self, other):
+        with self.lock:
+            for probe, histogram in other.by_probe.items():
+                self._probe_histogram(probe).merge(histogram)
+            for probe, prefixes in other.by_prefix.items():
+                for prefix, histogram in prefixes.items():
+                    self._prefix_histogram(probe, prefix).merge(histogram)
+            for entry in other.slowest:
+                self._offer_slowest(entry)
+
+    def to_dict(self, top_prefixes=20):
+        prefixes = {}
+        for probe, by_prefix in self.by_prefix.items():
+            ranked = sorted(by_prefix.items(), key=lambda item: item[1].percentiles((99,)).get(99, 0), reverse=True)
+            prefixes[probe] = {f"{prefix}.0/24": histogram.summary_ms() for prefix, histogram in ranked[:top_prefixes]}
+        return {
+            "probes": {probe: histogram.summary_ms() for probe, histogram in self.by_probe.items()},
+            "slowest_prefixes": prefixes,
+            "slowest_hosts": [{"ip": ip, "probe": probe, "ms": round(ns / 1e6, 3)}
+                              for ns, ip, probe in sorted(self.slowest, reverse=True)],
+        }
+
+def print_timings(timings, top_prefixes=10):
+    data = timings.to_dict(top_prefixes)
+    table = PrettyTable(["Sondeo", "Muestras", "Timeouts", "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)"])
+    table.align["Sondeo"] = "l"
+    for probe, summary in data["probes"].items():
+        table.add_row([probe, summary["samples"], summary["timeouts"], summary["p50"], summary["p90"],
+                       summary["p99"], summary["max"]])
+    print("\nTiempos por tipo de sondeo:")
+    print(table)
+
+    table = PrettyTable(["Sondeo", "Red", "Muestras", "Timeouts", "p50 (ms)", "p99 (ms)", "max (ms)"])
+    table.align["Red"] = "l"
+    for probe, prefixes in data["slowest_prefixes"].items():
+        for prefix, summary in prefixes.items():
+            table.add_row([probe, prefix, summary["samples"], summary["timeouts"], summary["p50"],
+                           summary["p99"], summary["max"]])
+    print(f"\nRedes /24 con peor p99 (top {top_prefixes} por sondeo):")
+    print(table)
+
+    table = PrettyTable(["IP", "Sondeo más lento", "Latencia (ms)"])
+    table.align["IP"] = "l"
+    for host in data["slowest_hosts"]:
+        table.add_row([host["ip"], host["probe"], host["ms"]])
+    print(f"\nLos {SLOWEST_HOSTS} hosts más lentos:")
+    print(table)
+
+# --- Motor asíncrono en proceso (modo --workers) ---
+# Cada worker abre su propio socket ICMP y UDP y sondea su parte de la lista
+# con un único event loop, sin lanzar ping ni snmpget por host.
+
+SO_ATTACH_FILTER = 26
+SNMP_SYSNAME_OID = (1, 3, 6, 1, 2, 1, 1, 5, 0)
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def ber_tlv(tag, payload):
+    length = len(payload)
+    if length < 0x80:
+        return bytes((tag, length)) + payload
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes((tag, 0x80 | len(encoded))) + encoded + payload
+
+def ber_int(value):
+    return ber_tlv(0x02, value.to_bytes((value.bit_length() + 8) // 8 or 1, "big", signed=True))
+
+def ber_oid(oid):
+    body = bytearray((40 * oid[0] + oid[1],))
+    for arc in oid[2:]:
+        chunk = [arc & 0x7F]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7F))
+            arc >>= 7
+        body.extend(reversed(chunk))
+    return ber_tlv(0x06, bytes(body))
+
+def build_snmp_get(community, request_id, oid=SNMP_SYSNAME_OID):
+    """
+    GetRequest SNMPv2c equivalente a 'snmpget -v2c -c <comunidad> <ip> sysName.0'
+    """
+    varbind = ber_tlv(0x30, ber_oid(oid) + b"\x05\x00")
+    pdu = ber_tlv(0xA0, ber_int(request_id) + ber_int(0) + ber_int(0) + ber_tlv(0x30, varbind))
+    return ber_tlv(0x30, ber_int(1) + ber_tlv(0x04, community.encode()) + pdu)
+
+def ber_read(data, offset):
+    """
+    Lee un TLV y retorna (tag, inicio del contenido, fin del contenido)
+    """
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[offset:offset + size], "big")
+        offset += size
+    return tag, offset, offset + length
+
+def parse_snmp_response(data):
+    """
+    Retorna (request_id, error_status) de un GetResponse, o None si no es válido
+    """
+    try:
+        tag, pos, _ = ber_read(data, 0)
+        if tag != 0x30:
+            return None
+        for _ in range(2):  # versión y comunidad
+            _, _, pos = ber_read(data, pos)
+        tag, pos, _ = ber_read(data, pos)
+        if tag != 0xA2:
+            return None
+        _, start, end = ber_read(data, pos)
+        request_id = int.from_bytes(data[start:end], "big", signed=True)
+        _, start, end = ber_read(data, end)
+        return request_id, int.from_bytes(data[start:end], "big")
+    except IndexError:
+        return None
+
+def attach_ident_filter(sock, ident):
+    """
+    Filtro BPF para que un socket ICMP raw solo reciba echo replies con nuestro identificador.
+    Sin él, cada worker recibiría (y tendría que descartar) las respuestas de todos los demás.
+    """
+    program = [
+        (0xB1, 0, 0, 0),        # ldxb 4*([0]&0xf)   -> longitud de la cabecera IP
+        (0x48, 0, 0, 4),        # ldh [x+4]          -> identificador ICMP
+        (0x15, 0, 1, ident),    # jeq #ident
+        (0x06, 0, 0, 0xFFFF),   # ret #0xffff        -> aceptar
+        (0x06, 0, 0, 0),        # ret #0             -> descartar
+    ]
+    filters = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *ins) for ins in program))
+    fprog = struct.pack("HL", len(program), ctypes.addressof(filters))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    return filters
+
+def open_icmp_socket(ident):
+    """
+    Usa un socket ICMP sin privilegios si el sistema lo permite (ping_group_range);
+    si no, un socket raw (requiere root) con filtro por identificador.
+    Retorna (socket, es_raw, buffer del filtro que debe mantenerse vivo)
+    """
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False, None
+    except PermissionError:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        return sock, True, attach_ident_filter(sock, ident)
+
+class AsyncProber:
+    """
+    Sondeos ICMP y SNMP concurrentes sobre un único socket de cada tipo.
+    Las respuestas se asocian a su petición por (ip, secuencia) en ICMP y por request-id en SNMP.
+    """
+    def __init__(self, count=5, icmp_timeout=ENGINE_ICMP_TIMEOUT, snmp_timeout=ENGINE_SNMP_TIMEOUT, snmp_port=161,
+                 timings=None):
+        self.count = count
+        self.timings = timings
+        self.icmp_timeout = icmp_timeout
+        self.snmp_timeout = snmp_timeout
+        self.snmp_port = snmp_port
+        self.loop = asyncio.get_running_loop()
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+        self.request_id = 0
+        self.pending_icmp = {}
+        self.pending_snmp = {}
+        self.icmp, self.icmp_raw, self._filter = open_icmp_socket(self.ident)
+        self.snmp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for sock in (self.icmp, self.snmp):
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+            self.loop.add_reader(sock.fileno(), self._on_icmp if sock is self.icmp else self._on_snmp)
+
+    def close(self):
+        for sock in (self.icmp, self.snmp):
+            self.loop.remove_reader(sock.fileno())
+            sock.close()
+
+    def _on_icmp(self):
+        while True:
+            try:
+                data, (ip, _) = self.icmp.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            offset = (data[0] & 0x0F) * 4 if self.icmp_raw else 0
+            if len(data) < offset + 8 or data[offset] != 0:  # 0 = echo reply
+                continue
+            ident, seq = struct.unpack_from("!HH", data, offset + 4)
+            if self.icmp_raw and ident != self.ident:
+                continue
+            waiter = self.pending_icmp.pop((ip, seq), None)
+            if waiter and not waiter.done():
+                waiter.set_result(time.perf_counter_ns())
+
+    def _on_snmp(self):
+        while True:
+            try:
+                data = self.snmp.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:  # ICMP port unreachable notificado en el socket
+                continue
+            parsed = parse_snmp_response(data)
+            if parsed is None:
+                continue
+            waiter = self.pending_snmp.pop(parsed[0], None)
+            if waiter and not waiter.done():
+                waiter.set_result(parsed[1] == 0)
+
+    async def _send(self, sock, packet, address):
+        for _ in range(50):
+            try:
+                sock.sendto(packet, address)
+                return True
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)
+            except OSError:
+                return False
+        return False
+
+    async def _echo(self, ip, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        self.seq = (self.seq + 1) & 0xFFFF
+        seq = self.seq
+        header = struct.pack("!BBHHH", 8, 0, 0, self.ident, seq)
+        payload = b"full_scan_icmp_snmp"
+        packet = struct.pack("!BBHHH", 8, 0, icmp_checksum(header + payload), self.ident, seq) + payload
+        waiter = self.loop.create_future()
+        self.pending_icmp[(ip, seq)] = waiter
+        sent_at = time.perf_counter_ns()
+        if not await self._send(self.icmp, packet, (ip, 0)):
+            self.pending_icmp.pop((ip, seq), None)
+            return None
+        try:
+            rtt = await asyncio.wait_for(waiter, self.icmp_timeout) - sent_at
+        except asyncio.TimeoutError:
+            self.pending_icmp.pop((ip, seq), None)
+            rtt = None
+        if self.timings:
+            self.timings.record(ip, "ICMP", rtt)
+        return rtt
+
+    async def ping_health(self, ip):
+        """
+        Equivalente en proceso de ping_health(): (disponible, paquetes_perdidos, latencia_promedio)
+        """
+        rtts = await asyncio.gather(*(self._echo(ip, i * ENGINE_PING_SPACING) for i in range(self.count)))
+        replies = [rtt for rtt in rtts if rtt is not None]
+        if not replies:
+            return False, 100, 0
+        return True, round(100 * (self.count - len(replies)) / self.count), sum(replies) / len(replies) / 1e6
+
+    async def snmp_get(self, community, ip):
+        self.request_id = (self.request_id + 1) & 0x7FFFFFFF
+        request_id = self.request_id
+        waiter = self.loop.create_future()
+        self.pending_snmp[request_id] = waiter
+        sent_at = time.perf_counter_ns()
+        if not await self._send(self.snmp, build_snmp_get(community, request_id), (ip, self.snmp_port)):
+            self.pending_snmp.pop(request_id, None)
+            return False
+        try:
+            ok = await asyncio.wait_for(waiter, self.snmp_timeout)
+            elapsed = time.perf_counter_ns() - sent_at
+        except asyncio.TimeoutError:
+            self.pending_snmp.pop(request_id, None)
+            ok, elapsed = False, None
+        if self.timings:
+            self.timings.record(ip, f"SNMP {community}", elapsed)
+        return ok
+
+    async def probe(self, ip):
+        """
+        Equivalente en proceso de probe_ip()
+        """
+        try:
+            available, packet_loss, latency = await self.ping_health(ip)
+        except OSError:
+            available, packet_loss, latency = False, 100, 0
+        if available:
+            snmp_results = list(await asyncio.gather(*(self.snmp_get(c, ip) for c in COMMUNITIES)))
+        else:
+            snmp_results = [False] * len(COMMUNITIES)
+        if self.timings:
+            self.timings.finish_host(ip)
+        return ip, (available, packet_loss, latency, snmp_results)
+
+async def sweep_shard(shard, options, results_queue, max_inflight=ENGINE_MAX_INFLIGHT):
+    """
+    Sondea la parte asignada manteniendo como mucho max_inflight hosts en curso
+    y envía los resultados al escritor en lotes de ENGINE_BATCH.
+    """
+    timings = ProbeTimings()
+    prober = AsyncProber(timings=timings, **options)
+    targets = iter(shard)
+    running = set()
+    batch = []
+    try:
+        while True:
+            for ip in targets:
+                running.add(asyncio.ensure_future(prober.probe(ip)))
+                if len(running) >= max_inflight:
+                    break
+            if not running:
+                break
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            batch.extend(task.result() for task in done)
+            if len(batch) >= ENGINE_BATCH:
+                results_queue.put(batch)
+                batch = []
+    finally:
+        prober.close()
+    if batch:
+        results_queue.put(batch)
+    results_queue.put(timings)
+
+def sweep_worker(shard, options, results_queue, max_inflight=ENGINE_MAX_INFLIGHT):
+    try:
+        asyncio.run(sweep_shard(shard, options, results_queue, max_inflight))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"{RED}Error en worker {os.getpid()}: {e}{END}", file=sys.stderr)
+    finally:
+        results_queue.put(None)
+
+def sharded_sweep(ips, workers, options, max_inflight=ENGINE_MAX_INFLIGHT, timings=None):
+    """
+    Reparte las IPs entre N procesos (round-robin, para equilibrar rangos contiguos)
+    y retorna un generador de (ip, resultado) que se consume desde un único escritor.
+    Los tiempos de cada worker se acumulan en 'timings' cuando este termina.
+    """
+    workers = max(1, min(workers, len(ips)))
+    results_queue = multiprocessing.Queue(maxsize=workers * 64)
+    processes = [multiprocessing.Process(target=sweep_worker, args=(ips[i::workers], options, results_queue, max_inflight),
+                                         daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    finished = 0
+    try:
+        while finished < workers:
+            try:
+                batch = results_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+            if batch is None:
+                finished += 1
+                continue
+            if isinstance(batch, ProbeTimings):
+                if timings:
+                    timings.merge(batch)
+                continue
+            yield from batch
+    finally:
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+# --- Detección de cambios entre ejecuciones ---
+
+def make_state(available, ping_class, snmp_results):
+    """
+    Registro compacto por IP: [up (0/1), clase de latencia, máscara de bits SNMP].
+    El bit i de la máscara corresponde a COMMUNITIES[i].
+    """
+    mask = 0
+    for i, ok in enumerate(snmp_results):
+        if ok:
+            mask |= 1 << i
+    return [int(available), ping_class, mask]
+
+def load_state(filename=STATE_FILE):
+    """
+    Carga el estado de la ejecución anterior. Retorna (hosts, comunidades) o (None, None)
+    """
+    if not path.isfile(filename):
+        return None, None
+    try:
+        with open(filename, "r") as file:
+            data = json.load(file)
+        return data["hosts"], data.get("communities", list(COMMUNITIES))
+    except (ValueError, KeyError) as e:
+        print(f"{YELLOW}Aviso: estado anterior '{filename}' ilegible ({e}), se ignora.{END}")
+        return None, None
+
+def save_state(states, filename=STATE_FILE):
+    data = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "communities": list(COMMUNITIES),
+        "hosts": states,
+    }
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as file:
+        json.dump(data, file, separators=(",", ":"))
+    # Reemplazo atómico para no dejar un estado a medias si se interrumpe
+    replace(tmp, filename)
+
+def diff_states(previous, current, previous_communities):
+    """
+    Compara dos diccionarios {ip: registro} y retorna solo las transiciones:
+    UP<->DOWN, comunidad SNMP que empieza a funcionar o falla, y cambios de clase de latencia.
+    Si el host cae, solo se informa la caída (SNMP y latencia son consecuencia de ella).
+    """
+    changes = []
+    for ip, (up, ping_class, mask) in current.items():
+        old = previous.get(ip)
+        if old is None:
+            continue
+        old_up, old_class, old_mask = old
+        if old_up != up:
+            changes.append([ip, "ICMP", "UP" if old_up else "DOWN", "UP" if up else "DOWN"])
+            if not up:
+                continue
+        elif not up:
+            continue
+        if old_up and old_class != ping_class:
+            changes.append([ip, "Latencia", old_class, ping_class])
+        for i, community in enumerate(COMMUNITIES):
+            if community not in previous_communities:
+                continue
+            was_ok = bool(old_mask >> previous_communities.index(community) & 1)
+            is_ok = bool(mask >> i & 1)
+            if old_up and was_ok != is_ok:
+                changes.append([ip, f"SNMP {community}", "OK" if was_ok else "FALLO", "OK" if is_ok else "FALLO"])
+    return changes
+
+def write_changes_to_csv(changes, filename=DELTA_FILE):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["IP", "Cambio", "Anterior", "Actual"])
+        writer.writerows(changes)
+
+def print_changes(changes):
+    if not changes:
+        print(f"{GREEN}Sin cambios respecto a la ejecución anterior.{END}")
+        return
+    table = PrettyTable(["IP", "Cambio", "Anterior", "Actual"])
+    table.align["IP"] = "l"
+    for ip, kind, before, after in changes:
+        color = RED if after in ("DOWN", "FALLO") else GREEN if after in ("UP", "OK") else YELLOW
+        table.add_row([ip, kind, before, f"{color}{after}{END}"])
+    print(table)
+
+# --- Modo daemon con exportador OpenMetrics ---
+
+# Familias de métricas por host: (nombre, ayuda). Todas son gauges.
+HOST_METRICS = (
+    ("probe_icmp_up", "1 si el host respondió a ICMP en el último ciclo"),
+    ("probe_icmp_packet_loss_percent", "Pérdida de paquetes ICMP en el último ciclo"),
+    ("probe_icmp_latency_ms", "Latencia ICMP media en el último ciclo"),
+    ("probe_icmp_availability_ratio", "Fracción de ciclos con respuesta ICMP en la ventana de historial"),
+    ("probe_snmp_up", "1 si la comunidad SNMP respondió a sysName.0 en el último ciclo"),
+)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class ProbeDaemon:
+    """
+    Sondea el inventario en bucle y mantiene el estado en memoria:
+    un ring buffer de tamaño fijo por host y las líneas de métricas ya renderizadas.
+    El cuerpo de /metrics se reconstruye una vez por ciclo y se sirve desde caché,
+    así que los scrapes nunca esperan al sondeo ni lo bloquean.
+    """
+    def __init__(self, ips, count=5, interval=DAEMON_INTERVAL, history=DAEMON_HISTORY, threads=10,
+                 workers=0, engine_options=None, max_inflight=ENGINE_MAX_INFLIGHT):
+        self.ips = ips
+        self.count = count
+        self.interval = interval
+        self.threads = threads
+        self.workers = workers
+        self.engine_options = engine_options
+        self.max_inflight = max_inflight
+        self.history = {ip: deque(maxlen=history) for ip in ips}
+        self.up_counts = dict.fromkeys(ips, 0)
+        self.host_keys = {}
+        self.host_lines = {}
+        self.cycles = 0
+        self.last_cycle_duration = 0.0
+        self.last_cycle_end = 0.0
+        self.stop_event = threading.Event()
+        self.cached = {False: b"", True: b"# EOF\n"}
+
+    def record(self, ip, result):
+        available, packet_loss, latency, snmp_results = result
+        samples = self.history[ip]
+        if len(samples) == samples.maxlen and samples[0][1]:
+            self.up_counts[ip] -= 1
+        samples.append((time.time(), available, latency if available else None))
+        if available:
+            self.up_counts[ip] += 1
+        availability = self.up_counts[ip] / len(samples)
+
+        # Solo se vuelve a renderizar el host si algo ha cambiado
+        key = (available, packet_loss, round(latency, 2), tuple(snmp_results), round(availability, 4))
+        if self.host_keys.get(ip) == key:
+            return
+        self.host_keys[ip] = key
+        label = f'ip="{escape_label(ip)}"'
+        lines = [
+            f"probe_icmp_up{{{label}}} {int(available)}\n",
+            f"probe_icmp_packet_loss_percent{{{label}}} {packet_loss}\n",
+            f"probe_icmp_latency_ms{{{label}}} {latency:.3f}\n" if available else "",
+            f"probe_icmp_availability_ratio{{{label}}} {availability:.4f}\n",
+            "".join(f'probe_snmp_up{{{label},community="{escape_label(community)}"}} {int(ok)}\n'
+                    for community, ok in zip(COMMUNITIES, snmp_results)),
+        ]
+        self.host_lines[ip] = lines
+
+    def render(self):
+        """
+        Une las líneas cacheadas de cada host por familia y publica el cuerpo
+        en formato OpenMetrics y en formato de texto clásico de Prometheus.
+        """
+        families = []
+        for i, (name, help_text) in enumerate(HOST_METRICS):
+            families.append(f"# HELP {name} {help_text}\n# TYPE {name} gauge\n")
+            families.extend(lines[i] for lines in self.host_lines.values())
+        body = "".join(families)
+        daemon_gauges = (
+            "# HELP probe_targets Número de hosts en el inventario\n# TYPE probe_targets gauge\n"
+            f"probe_targets {len(self.ips)}\n"
+            "# HELP probe_cycle_duration_seconds Duración del último ciclo de sondeo\n# TYPE probe_cycle_duration_seconds gauge\n"
+            f"probe_cycle_duration_seconds {self.last_cycle_duration:.3f}\n"
+            "# HELP probe_last_cycle_timestamp_seconds Fin del último ciclo (epoch)\n# TYPE probe_last_cycle_timestamp_seconds gauge\n"
+            f"probe_last_cycle_timestamp_seconds {self.last_cycle_end:.3f}\n"
+        )
+        # Los contadores se declaran sin sufijo en OpenMetrics y con _total en el formato clásico
+        counter_help = "# HELP {0} Ciclos de sondeo completados\n# TYPE {0} counter\n"
+        counter_sample = f"probe_cycles_total {self.cycles}\n"
+        self.cached = {
+            True: (body + daemon_gauges + counter_help.format("probe_cycles") + counter_sample + "# EOF\n").encode(),
+            False: (body + daemon_gauges + counter_help.format("probe_cycles_total") + counter_sample).encode(),
+        }
+
+    def run_cycle(self, executor):
+        start = time.time()
+        if self.workers:
+            results = sharded_sweep(self.ips, self.workers, self.engine_options, self.max_inflight)
+        else:
+            results = zip(self.ips, executor.map(lambda ip: probe_ip(ip, self.count), self.ips))
+        for ip, result in results:
+            self.record(ip, result)
+            if self.stop_event.is_set():
+                break
+        self.cycles += 1
+        self.last_cycle_end = time.time()
+        self.last_cycle_duration = self.last_cycle_end - start
+        self.render()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while not self.stop_event.is_set():
+                self.run_cycle(executor)
+                up = sum(1 for samples in self.history.values() if samples and samples[-1][1])
+                print(f"[{datetime.now():%H:%M:%S}] Ciclo {self.cycles}: {up}/{len(self.ips)} hosts UP "
+                      f"en {self.last_cycle_duration:.1f}s")
+                self.stop_event.wait(max(0.0, self.interval - self.last_cycle_duration))
+
+def make_metrics_handler(daemon):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404, "Use /metrics")
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = daemon.cached[openmetrics]
+            self.send_response(200)
+            if openmetrics:
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            else:
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return MetricsHandler
+
+def run_daemon(ips, args):
+    host, _, port = args.listen.rpartition(":")
+    daemon = ProbeDaemon(ips, count=args.count, interval=args.interval, history=args.history, threads=args.threads,
+                         workers=args.workers, engine_options=engine_options(args), max_inflight=args.max_inflight)
+    daemon.render()
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), make_metrics_handler(daemon))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Modo daemon: {len(ips)} hosts cada {args.interval}s, métricas en http://{args.listen}/metrics")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop_event.set()
+        print("\nDeteniendo daemon...")
+    finally:
+        server.shutdown()
+
+def engine_options(args):
+    return {"count": args.count, "snmp_port": args.snmp_port}
+
+def write_stats_json(filename, total, up, elapsed, timings):
+    """
+    Métricas del barrido en JSON (las usa el banco de pruebas de Benchmark/).
+    'latency_ms' resume los ecos ICMP; el detalle por sondeo y por /24 va en 'timings'.
+    """
+    icmp = timings.by_probe.get("ICMP")
+    stats = {
+        "hosts": total,
+        "up": up,
+        "elapsed_s": round(elapsed, 3),
+        "hosts_per_s": round(total / elapsed, 1) if elapsed else None,
+        "latency_ms": icmp.summary_ms() if icmp else {},
+        "timings": timings.to_dict(),
+    }
+    with open(filename, "w") as file:
+        json.dump(stats, file, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Comprueba salud ICMP y comunidades SNMP de una lista de IPs.")
+    parser.add_argument("-i", "--input", default="ip.txt", help="Fichero con las IPs a comprobar (por defecto: ip.txt)")
+    parser.add_argument("-d", "--diff", action="store_true",
+                        help="Modo cambios: compara con la ejecución anterior y muestra solo las transiciones")
+    parser.add_argument("--state-file", default=STATE_FILE, help=f"Fichero de estado entre ejecuciones (por defecto: {STATE_FILE})")
+    parser.add_argument("--delta-file", default=DELTA_FILE, help=f"Fichero CSV de cambios (por defecto: {DELTA_FILE})")
+    parser.add_argument("-c", "--count", type=int, default=5, help="Pings por IP en cada sondeo (por defecto: 5)")
+    parser.add_argument("-t", "--threads", type=int, default=10, help="Sondeos simultáneos (por defecto: 10)")
+    parser.add_argument("-w", "--workers", type=int, default=0,
+                        help="Reparte el barrido entre N procesos con sondeo asíncrono en proceso (requiere root "
+                             "o ping_group_range); 0 usa ping/snmpget como siempre (por defecto: 0)")
+    parser.add_argument("--max-inflight", type=int, default=ENGINE_MAX_INFLIGHT,
+                        help=f"Hosts sondeados a la vez por cada worker (por defecto: {ENGINE_MAX_INFLIGHT})")
+    parser.add_argument("--snmp-port", type=int, default=161, help="Puerto SNMP de los hosts con --workers (por defecto: 161)")
+    parser.add_argument("--timing", action="store_true",
+                        help="Muestra percentiles por tipo de sondeo y por /24, timeouts y los hosts más lentos")
+    parser.add_argument("--stats-json", help="Guarda duración, hosts/s y percentiles de latencia del barrido en este JSON")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Sondea el inventario en bucle y expone /metrics en formato OpenMetrics/Prometheus")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL,
+                        help=f"Segundos entre ciclos en modo daemon (por defecto: {DAEMON_INTERVAL})")
+    parser.add_argument("--history", type=int, default=DAEMON_HISTORY,
+                        help=f"Muestras guardadas por host en modo daemon (por defecto: {DAEMON_HISTORY})")
+    parser.add_argument("--listen", default=METRICS_LISTEN,
+                        help=f"Dirección host:puerto del exportador (por defecto: {METRICS_LISTEN})")
+    return parser.parse_args()
 
 def main():
-    cleaner()
-    ips = read_ips()
+    args = parse_args()
+    ips = [ip for ip in read_ips(args.input) if ip.strip()]
 
     if not ips:
         print("No se encontraron IPs para probar.")
         return
 
+    if args.daemon:
+        run_daemon(ips, args)
+        return
+
+    cleaner()
     print(f"Iniciando pruebas para {len(ips)} IPs...")
-    print("(Realizando 5 pings por IP para evaluar salud de conexión)\n")
+    print(f"(Realizando {args.count} pings por IP para evaluar salud de conexión)\n")
 
     table = PrettyTable(["IP", "Estado ICMP", "SNMP public", "SNMP GestionGrp"])
     table.align["IP"] = "l"
     table.align["Estado ICMP"] = "l"
 
-    csv_results = []
+    states = {}
+    timings = ProbeTimings()
+    up = 0
+    start = time.perf_counter()
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(executor.map(test_ip, ips))
+    def collect(results):
+        # Único escritor: los resultados llegan en streaming y se vuelcan al CSV según se reciben
+        nonlocal up
+        for table_row, csv_row, state in results:
+            table.add_row(table_row)
+            states[csv_row[0]] = state
+            up += state[0]
+            yield csv_row
 
-    for table_row, csv_row in results:
-        table.add_row(table_row)
-        csv_results.append(csv_row)
+    if args.workers:
+        print(f"Modo sharding: {args.workers} procesos, {args.max_inflight} hosts en curso por proceso\n")
+        sweep = sharded_sweep(ips, args.workers, engine_options(args), args.max_inflight, timings)
+        write_results_to_csv(collect(format_result(ip, result) for ip, result in sweep))
+    else:
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            write_results_to_csv(collect(executor.map(lambda ip: test_ip(ip, args.count, timings), ips)))
+    elapsed = time.perf_counter() - start
 
-    print(table)
-    write_results_to_csv(csv_results)
+    previous, previous_communities = load_state(args.state_file)
+
+    if args.diff:
+        if previous is None:
+            print(f"{YELLOW}No hay ejecución anterior en '{args.state_file}'; se guarda el estado actual como referencia.{END}")
+            changes = []
+        else:
+            changes = diff_states(previous, states, previous_communities)
+            print_changes(changes)
+        write_changes_to_csv(changes, args.delta_file)
+        print(f"\n✓ {len(changes)} cambios guardados en '{args.delta_file}'.")
+    else:
+        print(table)
+
+    save_state(states, args.state_file)
 
     print("\n✓ Pruebas completadas y resultados guardados en 'resultados.csv'.")
 
     # Estadísticas resumidas
     total = len(ips)
-    up = sum(1 for _, csv in results if csv[1] == "UP")
     print(f"\nResumen: {up}/{total} hosts alcanzables ({(up/total*100):.1f}%)")
 
+    if args.timing:
+        print_timings(timings)
+
+    if args.stats_json:
+        write_stats_json(args.stats_json, total, up, elapsed, timings)
+
 if __name__ == "__main__":
     main()
@@ -8,29 +8,48 @@ MEJORAS CLAVE:
 1. ESTIMACIÓN HOLÍSTICA: El tiempo total estimado ahora es la suma del tiempo de sondeo
    Y el tiempo de post-procesamiento (análisis, gráficos, guardado), ofreciendo la
    predicción más realista posible.
-2. HEURÍSTICA DE PROCESAMIENTO: Se introduce una constante (`PROCESSING_TIME_PER_HOST`) para
-   estimar de forma robusta la fase de análisis.
+2. ESTIMACIÓN CALIBRADA: cada ejecución guarda lo que tardó cada fase y la siguiente estimación
+   ajusta con ello un modelo de coste por fase (`PROCESSING_TIME_PER_HOST` solo sin historial).
 3. MANTIENE todas las mejoras de usabilidad, robustez y etiquetado inteligente de versiones anteriores.
+
+Uso:
+    python3 mtr_analysis.py                 # sondeo + análisis + gráficos
+    python3 mtr_analysis.py --no-analysis   # solo sondeo: CSV por salto en OUTDIR y salir
+    python3 mtr_analysis.py --compare 7     # última ejecución del histórico frente a los 7 días anteriores
+    python3 mtr_analysis.py -c destinos.json --category cdn dns -d 5m
+    python3 mtr_analysis.py --daemon -d 1m  # monitorización continua en ventanas de 1 minuto
+    python3 mtr_analysis.py --dpi 80        # previsualización rápida de los gráficos (--format svg: vectoriales)
+
+Fichero de configuración (JSON; todas las claves son opcionales y la línea de órdenes manda sobre él):
+    {"execution_time": "5m", "interval": 0.5, "n_clusters": 4, "max_workers": 32, "max_pps": 2000,
+     "engine": "auto", "protocol": "icmp", "fig_format": "png", "fig_dpi": 300,
+     "targets": {"cdn": ["cloudflare.com", "akamai.com"], "dns": ["8.8.8.8", "1.1.1.1"]}}
+'targets' también puede ser una lista simple (categoría 'general').
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import json
+import asyncio
+import socket
+import struct
 import subprocess
 import threading
 import time
 import math
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# Librerías de análisis y visualización
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from adjustText import adjust_text
+import csv
+import argparse
+import pickle
+import hashlib
+import ipaddress
+import signal
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# pandas/numpy/sklearn y matplotlib/seaborn/adjustText se importan en import_analysis() e import_plotting()
 from tqdm import tqdm
 
 # --- Configuración ---
@@ -41,21 +60,110 @@ URLS = [
     "netflix.com", "zoom.us", "dropbox.com", "oracle.com",
     "debian.org", "akamai.com", "level3.net", "telia.net"
 ]
+CATEGORIES = {}   # {destino: categoría}; se rellena desde 'targets' del fichero de configuración
 EXECUTION_TIME = "1m"
 INTERVAL = 0.5
 OUTDIR   = "master_mtr_analysis_final"
 N_CLUSTERS = 3
+# Un salto explica la degradación de un destino si en él la latencia sube al menos BOTTLENECK_DELTA_MS, o si
+# pierde al menos BOTTLENECK_LOSS_PCT y esa pérdida llega hasta el destino.
+BOTTLENECK_DELTA_MS = 10.0
+BOTTLENECK_LOSS_PCT = 5.0
 
-# --- Heurística de Procesamiento ---
-# Segundos estimados que tarda el análisis y la generación de gráficos por cada host.
-# Ajusta este valor si tu máquina es significativamente más rápida o lenta.
+# --- Estimación de tiempos ---
+# Cada ejecución completa añade a TIMINGS_FILE lo que tardó cada fase; la estimación ajusta con las últimas
+# CALIBRATION_RUNS un modelo lineal por fase (segundos = a + b·saltos; en los gráficos, segundos por figura
+# = a + b·destinos). Hasta que haya historial se usan PROCESSING_TIME_PER_HOST y DEFAULT_HOPS_PER_HOST.
 PROCESSING_TIME_PER_HOST = 1.5
+TIMINGS_FILE = "mtr_timings.jsonl"
+CALIBRATION_RUNS = 20
+DEFAULT_HOPS_PER_HOST = 15
+
+# --- Gráficos ---
+# Se dibujan en un pool de RENDER_WORKERS procesos (backend Agg). FIG_FORMAT 'png' o 'svg'; para
+# previsualizaciones rápidas basta FIG_DPI 72-100. Las figuras cuyos datos no cambian no se redibujan.
+FIG_FORMAT = "png"
+FIG_DPI = 300
+FIG_FORMATS = ("png", "svg")
+RENDER_WORKERS = os.cpu_count() or 1
+RENDER_CACHE = ".render_cache.json"
+
+# --- Olas de sondeo ---
+# Los destinos se sondean en olas: cada una con tantos destinos como quepan en MAX_PPS enviando MAX_TTL sondas
+# por intervalo, y con el motor 'mtr' como mucho MAX_WORKERS procesos mtr a la vez.
+MAX_WORKERS = 32
+CONFIG_KEYS = {"execution_time": "EXECUTION_TIME", "interval": "INTERVAL", "n_clusters": "N_CLUSTERS",
+               "max_workers": "MAX_WORKERS", "max_pps": "MAX_PPS", "engine": "ENGINE", "protocol": "PROBE_PROTOCOL",
+               "fig_format": "FIG_FORMAT", "fig_dpi": "FIG_DPI"}
+
+# --- Motor de sondeo ---
+# 'native': motor asyncio propio, todos los destinos desde un proceso (necesita root para sockets raw);
+# 'mtr': un 'mtr --raw' por destino leído en streaming; 'auto': el nativo si hay permisos, si no mtr.
+ENGINE = "auto"
+PROBE_PROTOCOL = "icmp"  # 'icmp' (echo, como mtr) o 'udp' (puertos 33434+, como mtr -u)
+MAX_TTL = 30
+PROBE_TIMEOUT = 2.0      # segundos que se espera la respuesta de cada sonda
+MAX_PPS = 2000           # presupuesto global de paquetes por segundo del motor nativo
+UDP_BASE_PORT = 33434
+UDP_PORT_RANGE = 8192
+
+# --- Vista en vivo y parada temprana ---
+# Se para antes de EXECUTION_TIME cuando, en todos los destinos y tras MIN_CYCLES ciclos, el IC95 de la
+# latencia al destino es menor que ±max(CI_LATENCY_MS, CI_LATENCY_REL·media) y el de la pérdida que ±CI_LOSS_PCT.
+EARLY_STOP = True
+MIN_CYCLES = 10
+CI_LATENCY_MS = 1.0
+CI_LATENCY_REL = 0.05
+CI_LOSS_PCT = 5.0
+LIVE_REFRESH = 5.0   # segundos entre refrescos de la tabla en vivo
+
+# --- Anotación de saltos ---
+# Los saltos se guardan por IP (mtr se lanza con -n) y se anotan después con su PTR, resuelto de forma concurrente
+# y guardado en HOP_CACHE para ejecuciones siguientes, y con su ASN de una tabla local de prefijos (sin red).
+ANNOTATE_HOPS = True
+HOP_CACHE = "mtr_hop_cache.json"
+PTR_TTL = 86400          # segundos que vale un PTR en caché
+PTR_NEGATIVE_TTL = 3600  # ídem para las IPs sin PTR (o que no respondieron a tiempo)
+PTR_TIMEOUT = 2.0
+PTR_CONCURRENCY = 64     # consultas PTR simultáneas
+ASN_TABLE = ""           # fichero 'prefijo ASN [nombre del AS]' por línea (p. ej. ipasn.dat de pyasn); "" = sin ASN
+
+# --- Modo continuo (--daemon) ---
+# Se sondea sin fin en ventanas de EXECUTION_TIME. Los resúmenes por destino son medias exponenciales de las
+# ventanas y los perfiles solo se reajustan cuando los resúmenes se desplazan de media más de DRIFT_THRESHOLD
+# desviaciones típicas desde el último ajuste.
+DAEMON_HALF_LIFE = 10    # ventanas tras las que una medida pesa la mitad
+DRIFT_THRESHOLD = 0.5
+DAEMON_FILE = "path_health.csv"   # estado actual de cada destino, en OUTDIR, reescrito en cada ventana
+
+# --- Histórico ---
+# Cada ejecución completa se añade a STORE_DIR en Parquet (necesita pyarrow), particionado por día UTC:
+# STORE_DIR/date=AAAA-MM-DD/run-<run_id>.parquet, con los saltos y los metadatos de la ejecución. "" lo desactiva.
+STORE_DIR = "mtr_history"
+BASELINE_DAYS = 7     # ventana de referencia por defecto de --compare
+COMPARE_TOP = 10      # filas de cada tabla de --compare que se muestran en pantalla
+
+RAW_COLUMNS = ["hop", "host", "loss", "avg", "stdev", "best", "worst", "cv", "sent", "name", "asn", "as_name"]
 
-# Ejecución totalmente paralela
-WORKERS = len(URLS)
+def import_analysis():
+    """
+    Las librerías de análisis tardan segundos en importarse: solo se cargan tras el sondeo, y nunca con --no-analysis
+    """
+    global pd, np, StandardScaler, PCA, IncrementalPCA, KMeans, MiniBatchKMeans
+    import pandas as pd
+    import numpy as np
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA, IncrementalPCA
+    from sklearn.cluster import KMeans, MiniBatchKMeans
 
-os.makedirs(OUTDIR, exist_ok=True)
-plt.style.use('seaborn-v0_8-whitegrid')
+def import_plotting():
+    """matplotlib (backend Agg), seaborn y adjustText: solo en los procesos que dibujan"""
+    global plt, sns, adjust_text
+    import matplotlib;matplotlib.use("Agg",force=True)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from adjustText import adjust_text
+    plt.style.use('seaborn-v0_8-whitegrid')
 
 # --- Utilidades, Captura y Parseo (Sin cambios) ---
 def parse_duration(duration_str: str) -> int:
@@ -90,15 +198,64 @@ def serialize_analysis_dict(analysis_data:dict)->dict:
         elif isinstance(value,dict):serializable[key]=serialize_analysis_dict(value)
         else:serializable[key]=value
     return serializable
-def probe(host:str,rounds:int,interval:float):
-    cmd=["mtr","--json","-c",str(rounds),"-i",str(interval),host]
-    proc=subprocess.run(cmd,capture_output=True,text=True,check=False)
-    if proc.returncode!=0:
-        if"resolve"not in proc.stderr.lower():tqdm.write(f"\n⚠️ Error en {host}: {proc.stderr.strip()}")
-        return host,None
-    try:return host,json.loads(proc.stdout)
-    except json.JSONDecodeError:tqdm.write(f"\n⚠️ JSON inválido en {host}.");return host,None
-def parse_df_realistic(data:dict)->pd.DataFrame:
+def probe(path,rounds:int,interval:float,stop:threading.Event):
+    """
+    Lanza 'mtr --raw -n' y vuelca cada línea en cuanto llega en el PathStats del destino: x = sonda enviada,
+    h = IP del salto, p = respuesta (µs); los nombres los pone después annotate_hops, con caché. Las sondas sin respuesta tras PROBE_TIMEOUT
+    cuentan como pérdida. Con stop activado se termina mtr y queda lo recogido.
+    """
+    cmd=["mtr","--raw","-n","-c",str(rounds),"-i",str(interval),path.host]
+    proc=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True,bufsize=1)
+    sent={};addresses={};expired=deque()
+    for line in proc.stdout:
+        if stop.is_set():proc.terminate();break
+        fields=line.split()
+        if len(fields)<3 or not fields[1].isdigit():continue
+        kind,ttl=fields[0],int(fields[1])+1
+        if ttl>len(path.hops):continue
+        if kind=="x":sent[fields[2]]=ttl;expired.append((time.monotonic(),fields[2]))
+        elif kind=="h":addresses[ttl]=fields[2]
+        elif kind=="p"and len(fields)>=4 and sent.pop(fields[3],None)is not None:
+            path.reply(ttl,int(fields[2])/1000,addresses.get(ttl,"???"))
+        limit=time.monotonic()-PROBE_TIMEOUT
+        while expired and expired[0][0]<limit:
+            ttl=sent.pop(expired.popleft()[1],None)
+            if ttl:path.loss(ttl)
+    proc.wait()
+    for ttl in sent.values():path.loss(ttl)
+    if proc.returncode not in(0,-15):
+        error=proc.stderr.read().strip()
+        if"resolve"not in error.lower():tqdm.write(f"\n⚠️ Error en {path.host}: {error}")
+
+def probe_mtr(hosts:list,rounds:int,interval:float,on_cycle=None)->tuple:
+    """
+    Un 'mtr --raw' por destino, todos a la vez (probe_waves limita cuántos), leídos en streaming.
+    Retorna ({host: PathStats}, True si se interrumpió con Ctrl+C)
+    """
+    paths={}
+    for host in hosts:
+        try:paths[host]=PathStats(host,socket.gethostbyname(host),MAX_TTL)
+        except OSError:pass
+    stop=threading.Event();interrupted=False
+    with ThreadPoolExecutor(max_workers=max(1,len(paths)))as executor:
+        futures=[executor.submit(probe,path,rounds,interval,stop)for path in paths.values()]
+        try:
+            while not all(future.done()for future in futures):
+                time.sleep(min(1.0,interval))
+                cycle=min((path.hops[0].sent for path in paths.values()),default=0)-1
+                if on_cycle and cycle>=0 and on_cycle(cycle,paths):stop.set()
+        except KeyboardInterrupt:
+            stop.set();interrupted=True;tqdm.write("\n⏹️  Sondeo interrumpido: se analiza lo recogido hasta ahora.")
+        for future in futures:
+            try:future.result()
+            except Exception as e:tqdm.write(f"\nError procesando: {e}")
+    return paths,interrupted
+def hop_rows(data:dict,annotations:dict=None)->list:
+    """
+    Filas por salto (RAW_COLUMNS) de un informe con formato mtr --json, ordenadas por salto y sin pandas;
+    name/asn/as_name salen de annotations (ver annotate_hops) y, si no hay, name es la propia IP
+    """
+    annotations=annotations or {}
     hubs=data.get("report",{}).get("hubs",[]);rows=[]
     for h in hubs:
         row={"hop":grab(h,"count","hop"),"host":grab(h,"host",default="???"),"loss":grab(h,"Loss%","loss"),"avg":grab(h,"Avg","avg"),"stdev":grab(h,"StDev","stdev"),"best":grab(h,"Best","best"),"worst":grab(h,"Wrst","worst")}
@@ -106,51 +263,566 @@ def parse_df_realistic(data:dict)->pd.DataFrame:
             if row[key] is not None:row[key]=float(row[key])
             else:row[key]=0.0
         row["cv"]=row["stdev"]/row["avg"]if row["avg"]and row["avg"]>0 else 0.0
+        row["sent"]=int(grab(h,"Snt","sent",default=0))
+        row["name"],row["asn"],row["as_name"]=annotations.get(row["host"],(row["host"],None,""))
         rows.append(row)
-    return pd.DataFrame(rows).sort_values("hop").reset_index(drop=True)
-
-# --- Análisis Matemático y Estadístico (Sin cambios) ---
-def perform_comprehensive_analysis(all_data_dfs:dict):
-    analysis={};summary_list=[]
-    for host,df in all_data_dfs.items():
-        if df.empty:continue
-        last_hop=df[df['loss']<100].iloc[-1]if not df[df['loss']<100].empty else df.iloc[-1]
-        summary_list.append({'Host':host,'Latency (ms)':last_hop['avg'],'Std Dev (ms)':last_hop['stdev'],'Packet Loss (%)':last_hop['loss'],'Stability (CV)':last_hop['cv']})
-    summary_df=pd.DataFrame(summary_list).set_index('Host').dropna()
+    return sorted(rows,key=lambda row:row["hop"])
+def hop_table(paths:dict,annotations:dict=None,categories:dict=None)->pd.DataFrame:
+    """
+    Una sola tabla larga con los saltos de todos los destinos ('target', 'category' + RAW_COLUMNS), ordenada por
+    (target, hop), con el incremento de latencia respecto al salto anterior del mismo destino en 'latency_delta'
+    """
+    rows=[{"target":host,**row}for host,path in paths.items()if path.last_ttl()for row in hop_rows(path.report(),annotations)]
+    table=pd.DataFrame(rows,columns=["target",*RAW_COLUMNS]).astype({'asn':'Int64'})
+    table.insert(1,'category',table['target'].map(categories or {}).fillna("general"))
+    table['latency_delta']=table.groupby('target',sort=False)['avg'].diff()
+    return table
+def write_raw_hops(paths:dict,outdir:str,annotations:dict=None)->int:
+    """Modo --no-analysis: un {host}.csv por destino con RAW_COLUMNS. Retorna cuántos destinos se escribieron"""
+    written=0
+    for host,path in paths.items():
+        if not path.last_ttl():continue
+        with open(f"{outdir}/{host}.csv",'w',newline='')as f:
+            writer=csv.DictWriter(f,fieldnames=RAW_COLUMNS);writer.writeheader();writer.writerows(hop_rows(path.report(),annotations))
+        written+=1
+    return written
+
+# --- Motor nativo de sondeo (asyncio) ---
+def icmp_checksum(data:bytes)->int:
+    if len(data)%2:data+=b"\x00"
+    total=sum(struct.unpack(f"!{len(data)//2}H",data));total=(total>>16)+(total&0xFFFF);total+=total>>16
+    return ~total&0xFFFF
+
+class HopStats:
+    """
+    Estadísticas de un salto acumuladas al vuelo (media y desviación por Welford), sin guardar
+    las muestras. Solo cuentan las sondas ya resueltas (respuesta o caducada), así la pérdida
+    es correcta también a mitad de la prueba.
+    """
+    __slots__=("received","lost","last","best","worst","mean","m2","hosts")
+    def __init__(self):
+        self.received=self.lost=0;self.last=self.mean=self.m2=self.worst=0.0;self.best=math.inf;self.hosts={}
+    def add_reply(self,rtt:float,address:str):
+        self.received+=1;self.last=rtt;self.best=min(self.best,rtt);self.worst=max(self.worst,rtt)
+        delta=rtt-self.mean;self.mean+=delta/self.received;self.m2+=delta*(rtt-self.mean)
+        self.hosts[address]=self.hosts.get(address,0)+1
+    def add_loss(self):self.lost+=1
+    @property
+    def sent(self)->int:return self.received+self.lost
+    @property
+    def loss(self)->float:return 100.0*self.lost/self.sent if self.sent else 0.0
+    @property
+    def stdev(self)->float:return math.sqrt(self.m2/(self.received-1))if self.received>1 else 0.0
+    @property
+    def host(self)->str:return max(self.hosts,key=self.hosts.get)if self.hosts else "???"
+    def hub(self,ttl:int)->dict:
+        """Retorna el salto con las mismas claves que un 'hub' de mtr --json"""
+        best=self.best if self.received else 0.0
+        return {"count":ttl,"host":self.host,"Loss%":round(self.loss,1),"Snt":self.sent,"Last":round(self.last,2),
+                "Avg":round(self.mean,2),"Best":round(best,2),"Wrst":round(self.worst,2),"StDev":round(self.stdev,2)}
+
+class PathStats:
+    """Saltos de un destino; dest_ttl es el menor TTL al que ya respondió el propio destino."""
+    def __init__(self,host:str,address:str,max_ttl:int):
+        self.host=host;self.address=address;self.hops=[HopStats()for _ in range(max_ttl)];self.dest_ttl=None
+    def limit(self)->int:return self.dest_ttl or len(self.hops)
+    def last_ttl(self)->int:return self.dest_ttl or max((ttl for ttl,hop in enumerate(self.hops,1)if hop.received),default=0)
+    def reply(self,ttl:int,rtt:float,address:str,final:bool=False):
+        """Anota una respuesta; final (o venir del propio destino) marca el fin del trayecto en ese TTL"""
+        if final or address==self.address:
+            if self.dest_ttl is not None and ttl>self.dest_ttl:return
+            self.dest_ttl=ttl
+        self.hops[ttl-1].add_reply(rtt,address)
+    def loss(self,ttl:int):
+        if self.dest_ttl is None or ttl<=self.dest_ttl:self.hops[ttl-1].add_loss()
+    def report(self)->dict:
+        """Retorna el trayecto en el formato de mtr --json, para que hop_rows lo lea igual"""
+        return {"report":{"mtr":{"dst":self.host},"hubs":[self.hops[ttl-1].hub(ttl)for ttl in range(1,self.last_ttl()+1)]}}
+
+class PathProber:
+    """
+    Sondeo tipo mtr de todos los destinos desde un solo proceso y un solo event loop. Un socket ICMP raw
+    recibe Echo Reply, Time Exceeded y Destination Unreachable de todos los trayectos; las sondas (echo ICMP
+    por ese mismo socket, o UDP a puertos 33434+ desde un socket UDP) llevan un TTL creciente y se
+    reconocen por el id/secuencia ICMP o el puerto UDP que el router cita en su error. El ritmo global
+    lo limita un cubo de fichas de max_pps paquetes por segundo, así la CPU y el enlace quedan acotados
+    con cientos de destinos. Requiere root (socket raw). Los parámetros omitidos toman el valor vigente de
+    PROBE_PROTOCOL, MAX_TTL, PROBE_TIMEOUT y MAX_PPS al crear el objeto (la configuración y la línea de órdenes
+    los cambian después de importar el módulo).
+    """
+    def __init__(self,protocol:str=None,max_ttl:int=None,timeout:float=None,max_pps:float=None):
+        self.protocol=protocol or PROBE_PROTOCOL;self.max_ttl=max_ttl or MAX_TTL
+        self.timeout=timeout or PROBE_TIMEOUT;self.max_pps=max_pps or MAX_PPS
+        self.ident=os.getpid()&0xFFFF;self.counter=0;self.pending={};self.sent_order=deque()
+        self.tokens=self.burst=max(1.0,self.max_pps*0.05);self.refilled=0.0
+        self.icmp=None;self.udp=None;self.udp_port=None
+
+    @staticmethod
+    def available()->bool:
+        try:socket.socket(socket.AF_INET,socket.SOCK_RAW,socket.IPPROTO_ICMP).close();return True
+        except PermissionError:return False
+
+    async def run(self,hosts:list,rounds:int,interval:float,on_cycle=None)->dict:
+        """
+        Sondea todos los destinos durante rounds ciclos de interval segundos y retorna {host: PathStats}.
+        on_cycle(ciclo, paths) se llama al final de cada ciclo con las estadísticas acumuladas hasta ese momento;
+        si retorna True se deja de sondear. Si se interrumpe, self.paths conserva lo recogido.
+        """
+        self.loop=asyncio.get_running_loop()
+        resolved=await asyncio.gather(*(self.loop.getaddrinfo(host,None,family=socket.AF_INET)for host in hosts),return_exceptions=True)
+        paths=self.paths={host:PathStats(host,infos[0][4][0],self.max_ttl)for host,infos in zip(hosts,resolved)if not isinstance(infos,BaseException)}
+        self._open()
+        try:
+            self.refilled=self.loop.time();next_cycle=self.loop.time()
+            for cycle in range(rounds):
+                for path in paths.values():
+                    for ttl in range(1,path.limit()+1):
+                        await self._pace();self._send(path,ttl)
+                    self._expire()
+                if on_cycle and on_cycle(cycle,paths):break
+                next_cycle+=interval
+                await asyncio.sleep(max(0.0,next_cycle-self.loop.time()));self._expire()
+            while self.pending:
+                await asyncio.sleep(min(0.1,self.timeout));self._expire()
+        finally:self._close()
+        return paths
+
+    def _open(self):
+        self.icmp=socket.socket(socket.AF_INET,socket.SOCK_RAW,socket.IPPROTO_ICMP);self.icmp.setblocking(False)
+        self.loop.add_reader(self.icmp.fileno(),self._on_reply)
+        if self.protocol=="udp":
+            self.udp=socket.socket(socket.AF_INET,socket.SOCK_DGRAM);self.udp.setblocking(False)
+            self.udp.bind(("",0));self.udp_port=self.udp.getsockname()[1]
+
+    def _close(self):
+        self.loop.remove_reader(self.icmp.fileno());self.icmp.close()
+        if self.udp:self.udp.close()
+        self.pending.clear();self.sent_order.clear()
+
+    def _refill(self):
+        now=self.loop.time();self.tokens=min(self.burst,self.tokens+(now-self.refilled)*self.max_pps);self.refilled=now
+
+    async def _pace(self):
+        self._refill()
+        if self.tokens<1:
+            # Dormir por cada paquete costaría más que enviarlo (el temporizador va por milisegundos):
+            # se espera a reponer medio cubo y se envía en ráfaga
+            await asyncio.sleep((self.burst/2-self.tokens)/self.max_pps);self._refill()
+        self.tokens-=1
+
+    def _send(self,path:PathStats,ttl:int):
+        # Clave de la sonda: secuencia ICMP, o (destino, puerto UDP) ya que el puerto es lo que vuelve citado
+        while True:
+            self.counter=(self.counter+1)&0xFFFF
+            key=self.counter if self.protocol=="icmp" else (path.address,UDP_BASE_PORT+self.counter%UDP_PORT_RANGE)
+            if key not in self.pending:break
+        try:
+            if self.protocol=="icmp":
+                header=struct.pack("!BBHHH",8,0,0,self.ident,key);payload=b"mtr_analysis"
+                packet=struct.pack("!BBHHH",8,0,icmp_checksum(header+payload),self.ident,key)+payload
+                self.icmp.setsockopt(socket.IPPROTO_IP,socket.IP_TTL,ttl);self.icmp.sendto(packet,(path.address,0))
+            else:
+                self.udp.setsockopt(socket.IPPROTO_IP,socket.IP_TTL,ttl);self.udp.sendto(b"mtr_analysis",key)
+        except OSError:
+            path.hops[ttl-1].add_loss();return
+        now=time.perf_counter();self.pending[key]=(path,ttl,now);self.sent_order.append((now,key))
+
+    def _on_reply(self):
+        while True:
+            try:data,(source,_)=self.icmp.recvfrom(2048)
+            except(BlockingIOError,InterruptedError):return
+            received=time.perf_counter();offset=(data[0]&0x0F)*4
+            if len(data)<offset+8:continue
+            icmp_type=data[offset]
+            if icmp_type==0 and self.protocol=="icmp":  # Echo Reply del destino
+                ident,key=struct.unpack_from("!HH",data,offset+4)
+                if ident!=self.ident:continue
+            elif icmp_type in(3,11):  # Destination Unreachable / Time Exceeded: citan la cabecera IP y 8 bytes de la sonda
+                inner=offset+8
+                if len(data)<inner+20:continue
+                quoted=inner+(data[inner]&0x0F)*4;protocol=data[inner+9]
+                if len(data)<quoted+8:continue
+                if self.protocol=="icmp" and protocol==socket.IPPROTO_ICMP:
+                    ident,key=struct.unpack_from("!HH",data,quoted+4)
+                    if ident!=self.ident:continue
+                elif self.protocol=="udp" and protocol==socket.IPPROTO_UDP:
+                    source_port,port=struct.unpack_from("!HH",data,quoted)
+                    if source_port!=self.udp_port:continue
+                    key=(socket.inet_ntoa(data[inner+16:inner+20]),port)
+                else:continue
+            else:continue
+            entry=self.pending.pop(key,None)
+            if entry is None:continue
+            path,ttl,sent=entry
+            # El destino, o un router que lo da por inalcanzable (tipo 3): fin del trayecto
+            path.reply(ttl,(received-sent)*1000,source,final=icmp_type==3)
+
+    def _expire(self):
+        """Las sondas se envían en orden, así que las caducadas siempre están al principio"""
+        limit=time.perf_counter()-self.timeout
+        while self.sent_order and self.sent_order[0][0]<limit:
+            _,key=self.sent_order.popleft();entry=self.pending.pop(key,None)
+            if entry:
+                path,ttl,_=entry;path.loss(ttl)
+
+def probe_native(hosts:list,rounds:int,interval:float,on_cycle=None)->tuple:
+    """
+    Retorna ({host: PathStats}, True si se interrumpió con Ctrl+C) de todos los destinos sondeados a la vez
+    (lo recogido hasta Ctrl+C si se interrumpe)
+    """
+    prober=PathProber();prober.paths={};interrupted=False
+    try:asyncio.run(prober.run(hosts,rounds,interval,on_cycle))
+    except KeyboardInterrupt:interrupted=True;tqdm.write("\n⏹️  Sondeo interrumpido: se analiza lo recogido hasta ahora.")
+    return prober.paths,interrupted
+
+# --- Olas de sondeo ---
+def wave_size(engine:str,interval:float,hosts:int)->int:
+    """Destinos por ola: los que caben en MAX_PPS con MAX_TTL sondas por intervalo (y MAX_WORKERS con mtr)"""
+    size=max(1,int(MAX_PPS*interval/MAX_TTL))
+    if engine!="native":size=min(size,MAX_WORKERS)
+    return max(1,min(size,hosts))
+def probe_waves(engine:str,hosts:list,rounds:int,interval:float,size:int,live:bool=True)->tuple:
+    """
+    Sondea hosts en olas de size destinos, cada una con su vista en vivo y su parada temprana (sin live, ninguna de
+    las dos). Ctrl+C termina la ola en curso y no lanza las siguientes. Retorna ({host: PathStats}, interrumpido)
+    """
+    probe_engine=probe_native if engine=="native"else probe_mtr
+    waves=[hosts[start:start+size]for start in range(0,len(hosts),size)];paths={};interrupted=False
+    for number,wave in enumerate(waves,1):
+        if not live:wave_paths,interrupted=probe_engine(wave,rounds,interval)
+        else:
+            view=LiveView(rounds,label=f"🌐 Ola {number}/{len(waves)} (ciclos)"if len(waves)>1 else"🌐 Sondeando redes (ciclos)")
+            try:wave_paths,interrupted=probe_engine(wave,rounds,interval,view.update)
+            finally:view.close()
+        paths.update(wave_paths)
+        if interrupted:break
+    return paths,interrupted
+
+# --- Configuración y destinos ---
+def load_config(path:str)->dict:
+    """Lee el fichero JSON de configuración (claves de CONFIG_KEYS y 'targets'; ver la cabecera del script)"""
+    with open(path)as f:config=json.load(f)
+    unknown=sorted(set(config)-set(CONFIG_KEYS)-{"targets"})
+    if unknown:raise ValueError(f"claves desconocidas en {path}: {', '.join(unknown)}")
+    return config
+def parse_targets(targets)->dict:
+    """Retorna {destino: categoría} de una lista ('general') o de un {categoría: [destinos]}; gana la primera categoría"""
+    if isinstance(targets,list):return dict.fromkeys(targets,"general")
+    categories={}
+    for category,hosts in targets.items():
+        for host in hosts:categories.setdefault(host,category)
+    return categories
+
+# --- Vista en vivo y parada temprana ---
+Z95=1.96
+def ci_halfwidths(hop:HopStats)->tuple:
+    """Retorna las semiamplitudes del IC95 de la latencia media (ms, normal) y de la pérdida (puntos %, Wilson)"""
+    n=hop.sent
+    if n==0:return math.inf,math.inf
+    p=hop.lost/n;loss_hw=100*Z95*math.sqrt(p*(1-p)/n+Z95**2/(4*n*n))/(1+Z95**2/n)
+    lat_hw=Z95*hop.stdev/math.sqrt(hop.received)if hop.received>1 else(0.0 if hop.received==0 else math.inf)
+    return lat_hw,loss_hw
+def path_converged(path:PathStats)->bool:
+    ttl=path.last_ttl()
+    if ttl==0:return False
+    hop=path.hops[ttl-1]
+    if hop.sent<MIN_CYCLES:return False
+    lat_hw,loss_hw=ci_halfwidths(hop)
+    return loss_hw<=CI_LOSS_PCT and lat_hw<=max(CI_LATENCY_MS,CI_LATENCY_REL*hop.mean)
+
+class LiveView:
+    """
+    Progreso por ciclos completados (no por reloj), tabla en vivo cada LIVE_REFRESH segundos con la latencia y
+    pérdida al destino, su IC95 y la pérdida de cada salto, y decisión de parada temprana.
+    """
+    def __init__(self,rounds:int,early_stop:bool=EARLY_STOP,label:str="🌐 Sondeando redes (ciclos)"):
+        self.early_stop=early_stop;self.next_render=time.monotonic()+LIVE_REFRESH;self.stopped_at=None
+        self.pbar=tqdm(total=rounds,desc=label,unit="ciclo")
+    def update(self,cycle:int,paths:dict)->bool:
+        """Retorna True si hay que dejar de sondear"""
+        if cycle+1>self.pbar.n:self.pbar.update(cycle+1-self.pbar.n)
+        converged=sum(path_converged(path)for path in paths.values())
+        self.pbar.set_postfix_str(f"convergidos {converged}/{len(paths)}")
+        if time.monotonic()>=self.next_render:self.next_render=time.monotonic()+LIVE_REFRESH;self.render(paths)
+        if self.early_stop and paths and converged==len(paths):self.stopped_at=cycle+1;return True
+        return False
+    def render(self,paths:dict):
+        lines=[f"{'Destino':<24}{'Saltos':>7}{'Ciclos':>7}{'Latencia (ms)':>18}{'Pérdida (%)':>16}  Pérdida por salto"]
+        for host,path in paths.items():
+            ttl=path.last_ttl()
+            if ttl==0:lines.append(f"{host:<24}{'-':>7}");continue
+            hop=path.hops[ttl-1];lat_hw,loss_hw=ci_halfwidths(hop);mark="✓"if path_converged(path)else" "
+            per_hop=" ".join(f"{h.loss:.0f}"for h in path.hops[:ttl])
+            lines.append(f"{host[:23]:<24}{ttl:>7}{hop.sent:>7}{hop.mean:>10.2f} ±{lat_hw:>5.2f}{hop.loss:>8.1f} ±{loss_hw:>5.1f} {mark} {per_hop}")
+        tqdm.write("\n".join(lines)+"\n")
+    def close(self):
+        self.pbar.close()
+        if self.stopped_at:print(f"⏱️  Parada temprana en el ciclo {self.stopped_at}: todos los destinos dentro de los intervalos de confianza.")
+
+# --- Anotación de saltos (PTR y ASN) ---
+class PrefixTable:
+    """
+    Tabla IP→ASN local con búsqueda del prefijo más largo: un dict {red: (asn, nombre)} por familia y longitud
+    de prefijo; cada búsqueda prueba las longitudes presentes de mayor a menor (como mucho 33 consultas en IPv4).
+    """
+    def __init__(self):
+        self.tables={4:{},6:{}};self.lengths={4:[],6:[]}
+    @classmethod
+    def load(cls,path:str)->PrefixTable:
+        """Lee líneas 'prefijo ASN [nombre]' separadas por espacios o tabuladores; '#' y ';' son comentarios"""
+        table=cls();skipped=0
+        with open(path)as f:
+            for line in f:
+                fields=line.split(None,2)
+                if len(fields)<2 or fields[0][0]in"#;":continue
+                try:table.add(fields[0],int(fields[1].upper().removeprefix("AS")),fields[2].strip()if len(fields)>2 else"")
+                except ValueError:skipped+=1
+        if skipped:print(f"⚠️ {skipped} líneas no válidas ignoradas en {path}.")
+        return table
+    def add(self,prefix:str,asn:int,name:str=""):
+        network=ipaddress.ip_network(prefix,strict=False);by_length=self.tables[network.version]
+        if network.prefixlen not in by_length:by_length[network.prefixlen]={};self.lengths[network.version]=sorted(by_length,reverse=True)
+        by_length[network.prefixlen][int(network.network_address)]=(asn,name)
+    def lookup(self,address:str)->tuple:
+        """Retorna (asn, nombre) del prefijo más largo que contiene address, o None"""
+        try:ip=ipaddress.ip_address(address)
+        except ValueError:return None
+        value=int(ip);bits=ip.max_prefixlen;by_length=self.tables[ip.version]
+        for length in self.lengths[ip.version]:
+            hit=by_length[length].get(value>>(bits-length)<<(bits-length))
+            if hit:return hit
+        return None
+
+def load_hop_cache(path:str)->dict:
+    """Retorna {ip: [nombre o None, caducidad (epoch)]} sin las entradas ya caducadas"""
+    try:
+        with open(path)as f:entries=json.load(f)
+    except(OSError,ValueError):return {}
+    now=time.time();return {ip:entry for ip,entry in entries.items()if entry[1]>now}
+def save_hop_cache(path:str,entries:dict):
+    with open(path+".tmp",'w')as f:json.dump(entries,f)
+    os.replace(path+".tmp",path)
+async def resolve_ptr(addresses:list,concurrency:int=PTR_CONCURRENCY)->dict:
+    """Retorna {ip: nombre o None} resolviendo hasta concurrency PTR a la vez, cada uno con PTR_TIMEOUT"""
+    loop=asyncio.get_running_loop();executor=ThreadPoolExecutor(max_workers=concurrency);slots=asyncio.Semaphore(concurrency)
+    async def lookup(ip):
+        # El plazo cuenta desde que empieza la consulta y el hueco se libera cuando el hilo termina de verdad,
+        # así una consulta colgada no deja a las siguientes esperando en la cola del pool.
+        await slots.acquire()
+        future=loop.run_in_executor(executor,socket.getnameinfo,(ip,0),socket.NI_NAMEREQD);future.add_done_callback(lambda _:slots.release())
+        try:name,_=await asyncio.wait_for(asyncio.shield(future),PTR_TIMEOUT);return ip,name
+        except(OSError,asyncio.TimeoutError):return ip,None
+    try:return dict(await asyncio.gather(*(lookup(ip)for ip in addresses)))
+    finally:executor.shutdown(wait=False,cancel_futures=True)
+def annotate_hops(addresses,cache_path:str=HOP_CACHE,asn_table:PrefixTable=None)->dict:
+    """
+    Retorna {ip: (nombre, asn, nombre del AS)} de las IPs de salto. Solo se resuelven los PTR que no están en la
+    caché o han caducado; sin PTR el nombre es la propia IP.
+    """
+    entries=load_hop_cache(cache_path);addresses={address for address in addresses if address!="???"}
+    missing=[address for address in addresses if address not in entries]
+    if missing:
+        expires={True:time.time()+PTR_TTL,False:time.time()+PTR_NEGATIVE_TTL}
+        for ip,name in asyncio.run(resolve_ptr(missing)).items():entries[ip]=[name,expires[name is not None]]
+        save_hop_cache(cache_path,entries)
+    annotations={}
+    for ip in addresses:
+        asn,as_name=(asn_table.lookup(ip)if asn_table else None)or(None,"")
+        annotations[ip]=(entries[ip][0]or ip,asn,as_name)
+    return annotations
+
+# --- Análisis Matemático y Estadístico ---
+SUMMARY_COLUMNS={'avg':'Latency (ms)','stdev':'Std Dev (ms)','loss':'Packet Loss (%)','cv':'Stability (CV)'}
+def last_hops(table:pd.DataFrame,keys:tuple=('target',))->pd.DataFrame:
+    """Fila del último salto que responde (pérdida < 100%, o el último si no responde ninguno) de cada grupo de keys"""
+    groups=[table[key]for key in keys]
+    responding_hop=table['hop'].where(table['loss']<100).groupby(groups).transform('max')
+    last_hop=responding_hop.fillna(table['hop'].groupby(groups).transform('max'))
+    return table[table['hop']==last_hop].drop_duplicates(list(keys),keep='last')
+def hop_graph(table:pd.DataFrame)->tuple:
+    """
+    Grafo dirigido de los saltos de todos los destinos con un nodo por dirección de salto ('???' no identifica un
+    router y se omite). Retorna (nodos, aristas) con destinos que pasan, pérdida e incremento de latencia agregados;
+    solo groupby sobre la tabla larga, lineal en el total de saltos.
+    """
+    known=table['host']!='???';previous=table.groupby('target',sort=False)['host'].shift()
+    nodes=table[known].groupby('host').agg(name=('name','first'),asn=('asn','first'),destinations=('target','nunique'),loss=('loss','mean'),latency_delta=('latency_delta','mean'),latency_delta_max=('latency_delta','max'))
+    links=table.assign(previous=previous)[known&previous.notna()&(previous!='???')]
+    edges=links.groupby(['previous','host']).agg(destinations=('target','nunique'),latency_delta=('latency_delta','mean'),loss=('loss','mean')).rename_axis(['from','to'])
+    return nodes,edges
+def shared_bottlenecks(table:pd.DataFrame,last:pd.DataFrame,nodes:pd.DataFrame)->tuple:
+    """
+    Para cada router, cuántos destinos degradados explica (ver BOTTLENECK_DELTA_MS/BOTTLENECK_LOSS_PCT) y qué
+    fracción de los que pasan por él. Retorna (tabla ordenada de más a menos destinos explicados, destinos degradados)
+    """
+    final_loss=table['target'].map(last.set_index('target')['loss'])
+    explains=(table['latency_delta']>=BOTTLENECK_DELTA_MS)|((table['loss']>=BOTTLENECK_LOSS_PCT)&(final_loss>=BOTTLENECK_LOSS_PCT))
+    rows=table[explains&(table['host']!='???')]
+    shared=rows.groupby('host').agg(explained=('target','nunique'),latency_delta=('latency_delta','mean'),loss=('loss','mean')).join(nodes[['name','asn','destinations']])
+    shared['share']=shared['explained']/shared['destinations']
+    return shared.sort_values(['explained','latency_delta'],ascending=False),int(table.loc[explains,'target'].nunique())
+def profile_labels(summary_df:pd.DataFrame,clusters,centers)->pd.Series:
+    """
+    Nombre del perfil de cada destino: el clúster con el centro (escalado) más cercano al origen es el óptimo y
+    los demás se nombran por la métrica en la que más destacan
+    """
+    cluster_means=summary_df[list(SUMMARY_COLUMNS.values())].groupby(np.asarray(clusters)).mean()
+    normalized_means=((cluster_means-cluster_means.mean())/cluster_means.std()).fillna(0)
+    dominant_feature=normalized_means[['Latency (ms)','Std Dev (ms)','Packet Loss (%)']].idxmax(axis=1)
+    feature_map={'Latency (ms)':"Latencia Alta",'Std Dev (ms)':"Inestable",'Packet Loss (%)':"Pérdida Paquetes"}
+    best_cluster_id=np.argmin(np.linalg.norm(centers,axis=1))
+    cluster_labels={}
+    for i,feature in dominant_feature.items():
+        if i==best_cluster_id:cluster_labels[i]="Rendimiento Óptimo"
+        else:cluster_labels[i]=f"Perfil: {feature_map.get(feature,'Atípico')}"
+    return pd.Series(clusters,index=summary_df.index,name="Performance Profile").map(cluster_labels)
+def perform_comprehensive_analysis(table:pd.DataFrame)->dict:
+    """
+    Todo sobre la tabla larga de hop_table() con groupby/transform, sin bucles por destino: el resumen sale del
+    último salto que responde (pérdida < 100%, o el último si no responde ninguno) y el cuello de botella del
+    mayor incremento de latencia entre saltos consecutivos.
+    """
+    analysis={};last=last_hops(table)
+    summary_df=last.set_index('target')[list(SUMMARY_COLUMNS)].rename(columns=SUMMARY_COLUMNS).rename_axis('Host').dropna()
     analysis['summary_df']=summary_df
+    if 'category' in last:
+        by_category=last.groupby('category')
+        analysis['category_summary']=by_category[list(SUMMARY_COLUMNS)].median().rename(columns=SUMMARY_COLUMNS).join(by_category.size().rename('Hosts'))
+    summ_numeric=summary_df.select_dtypes(include=np.number)
+    scaled_features=StandardScaler().fit_transform(summ_numeric)if not summary_df.empty else None
     if not summary_df.empty and len(summary_df)>=N_CLUSTERS:
-        summ_numeric=summary_df.select_dtypes(include=np.number)
-        scaler=StandardScaler();scaled_features=scaler.fit_transform(summ_numeric)
         kmeans=KMeans(n_clusters=N_CLUSTERS,random_state=42,n_init='auto')
         clusters_raw=kmeans.fit_predict(scaled_features);summary_df['cluster_raw']=clusters_raw
-        cluster_means=summary_df.groupby('cluster_raw').mean()
-        normalized_means=(cluster_means-cluster_means.mean())/cluster_means.std()
-        dominant_feature=normalized_means[['Latency (ms)','Std Dev (ms)','Packet Loss (%)']].idxmax(axis=1)
-        feature_map={'Latency (ms)':"Latencia Alta",'Std Dev (ms)':"Inestable",'Packet Loss (%)':"Pérdida Paquetes"}
-        cluster_centers_dist=np.linalg.norm(kmeans.cluster_centers_,axis=1)
-        best_cluster_id=np.argmin(cluster_centers_dist)
-        cluster_labels={}
-        for i,feature in dominant_feature.items():
-            if i==best_cluster_id:cluster_labels[i]="Rendimiento Óptimo"
-            else:cluster_labels[i]=f"Perfil: {feature_map.get(feature,'Atípico')}"
-        analysis['clusters']=summary_df['cluster_raw'].map(cluster_labels)
-        analysis['clusters'].name="Performance Profile"
-    bottlenecks={};
-    for host,df in all_data_dfs.items():
-        if df.shape[0]<2:continue
-        df['latency_delta']=df['avg'].diff()
-        idx_lat=df['latency_delta'].idxmax()
-        if pd.notna(idx_lat)and df.loc[idx_lat,'latency_delta']>0:bottlenecks[host]={'hop':int(df.loc[idx_lat,'hop']),'host_name':df.loc[idx_lat,'host'],'latency_increase':df.loc[idx_lat,'latency_delta']}
-    analysis['bottlenecks']=bottlenecks
+        analysis['clusters']=profile_labels(summary_df,clusters_raw,kmeans.cluster_centers_)
+    deltas=table.dropna(subset=['latency_delta'])
+    peaks=deltas.loc[deltas.groupby('target',sort=False)['latency_delta'].idxmax()]
+    peaks=peaks[peaks['latency_delta']>0]
+    analysis['bottlenecks']={target:{'hop':int(hop),'host_name':name,'latency_increase':delta}
+                             for target,hop,name,delta in zip(peaks['target'],peaks['hop'],peaks['name'],peaks['latency_delta'])}
+    nodes,edges=hop_graph(table);analysis['hop_graph']={'nodes':nodes,'edges':edges}
+    analysis['shared_bottlenecks'],analysis['degraded_destinations']=shared_bottlenecks(table,last,nodes)
     summ_variant=summ_numeric.loc[:,summ_numeric.nunique()>1]
     analysis['correlation_matrix']=summ_variant.corr()
-    if not summary_df.empty:
+    if len(summary_df)>=2:
         pca=PCA(n_components=2);principal_components=pca.fit_transform(scaled_features)
         analysis['pca']={'components':pd.DataFrame(data=principal_components,columns=['PC1','PC2'],index=summary_df.index),'explained_variance':pca.explained_variance_ratio_}
     return analysis
 
-# --- Visualizaciones (Sin cambios) ---
-def plot_performance_overview(analysis:dict,outdir:str):
+# --- Modo continuo: salud de los trayectos ---
+class PathHealth:
+    """
+    Resumen por destino (SUMMARY_COLUMNS) como media exponencial de las ventanas, y perfiles con StandardScaler,
+    MiniBatchKMeans e IncrementalPCA que solo se reajustan (partial_fit) si la matriz de resúmenes se ha desplazado
+    más de DRIFT_THRESHOLD desde el último ajuste; entre ajustes los perfiles se predicen con el modelo vigente.
+    Los componentes principales necesitan al menos 2 destinos. Sin argumentos se usan DAEMON_HALF_LIFE y el
+    N_CLUSTERS vigente (la configuración y la línea de órdenes lo cambian después de importar el módulo).
+    """
+    def __init__(self,half_life:float=None,n_clusters:int=None):
+        half_life=half_life or DAEMON_HALF_LIFE;n_clusters=n_clusters or N_CLUSTERS
+        self.alpha=1-0.5**(1/half_life);self.n_clusters=n_clusters;self.state=None;self.fitted=None;self.refits=0
+        self.scaler=StandardScaler();self.kmeans=MiniBatchKMeans(n_clusters=n_clusters,random_state=42,n_init=3);self.pca=IncrementalPCA(n_components=2)
+    def update(self,summary:pd.DataFrame)->tuple:
+        """Incorpora el resumen de una ventana; los destinos sin datos en ella conservan su valor. Retorna (reajustado, deriva)"""
+        if self.state is None:self.state=summary.copy()
+        else:
+            previous=self.state.reindex(self.state.index.union(summary.index,sort=False));current=summary.reindex(previous.index)
+            self.state=(previous+self.alpha*(current-previous)).fillna(previous).fillna(current)
+        drift=self.drift()
+        if len(self.state)<self.n_clusters or drift<=DRIFT_THRESHOLD:return False,drift
+        self.scaler.partial_fit(self.state);scaled=self.scaler.transform(self.state)
+        self.kmeans.partial_fit(scaled)
+        if len(scaled)>=self.pca.n_components:self.pca.partial_fit(scaled)
+        self.fitted=self.state.copy();self.refits+=1
+        return True,drift
+    def drift(self)->float:
+        """Desplazamiento medio (en desviaciones típicas del escalado vigente) desde el último ajuste; inf si hay destinos nuevos"""
+        if self.fitted is None or not self.state.index.isin(self.fitted.index).all():return math.inf
+        before=self.scaler.transform(self.fitted.loc[self.state.index]);now=self.scaler.transform(self.state)
+        return float(np.linalg.norm(now-before,axis=1).mean())
+    def snapshot(self)->pd.DataFrame:
+        """Estado actual: resúmenes, perfil y componentes principales de cada destino"""
+        health=self.state.copy()
+        if self.fitted is not None:
+            scaled=self.scaler.transform(self.state);clusters=self.kmeans.predict(scaled)
+            health['Performance Profile']=profile_labels(self.state,clusters,self.kmeans.cluster_centers_)
+            if hasattr(self.pca,'components_'):health[['PC1','PC2']]=self.pca.transform(scaled)
+        return health.rename_axis('Host')
+def run_daemon(engine:str,interval:float,window:int,per_wave:int):
+    """Modo --daemon: ventanas de window segundos sin fin hasta Ctrl+C o SIGTERM, con el estado en OUTDIR/DAEMON_FILE"""
+    signal.signal(signal.SIGTERM,signal.default_int_handler)
+    import_analysis();health=PathHealth(n_clusters=N_CLUSTERS);rounds=max(10,int(window/interval));number=0;previous=None
+    try:
+        while True:
+            number+=1;paths,interrupted=probe_waves(engine,URLS,rounds,interval,per_wave,live=False)
+            table=hop_table(paths,categories=CATEGORIES)
+            if not table.empty:
+                summary=last_hops(table).set_index('target')[list(SUMMARY_COLUMNS)].rename(columns=SUMMARY_COLUMNS).dropna()
+                refitted,drift=health.update(summary);snapshot=health.snapshot()
+                snapshot.to_csv(f"{OUTDIR}/{DAEMON_FILE}.tmp");os.replace(f"{OUTDIR}/{DAEMON_FILE}.tmp",f"{OUTDIR}/{DAEMON_FILE}")
+                status="perfiles reajustados"if refitted else f"deriva {drift:.2f} ≤ {DRIFT_THRESHOLD}"
+                line=f"[{datetime.now():%H:%M:%S}] Ventana {number}: {len(snapshot)} destinos, latencia mediana {snapshot['Latency (ms)'].median():.1f} ms, pérdida media {snapshot['Packet Loss (%)'].mean():.1f}% · {status}"
+                if 'Performance Profile' in snapshot:
+                    line+=" · "+", ".join(f"{profile} {count}"for profile,count in snapshot['Performance Profile'].value_counts().items())
+                    if previous is not None:
+                        changed=snapshot['Performance Profile'][snapshot['Performance Profile']!=previous.reindex(snapshot.index)]
+                        line+="".join(f"\n    {host}: {profile}"for host,profile in changed.items())
+                    previous=snapshot['Performance Profile']
+                tqdm.write(line)
+            if interrupted:break
+    except KeyboardInterrupt:pass
+    print(f"\n⏹️  Monitorización detenida tras {number} ventanas ({health.refits} reajustes de perfiles). Estado en '{OUTDIR}/{DAEMON_FILE}'.")
+
+# --- Histórico de ejecuciones (Parquet) ---
+def store_run(table:pd.DataFrame,meta:dict,store:str=STORE_DIR)->str:
+    """Añade la ejecución (tabla de saltos + metadatos de meta) a la partición de su día. Retorna la ruta o None"""
+    try:import pyarrow  # noqa: F401 (motor de to_parquet/read_parquet)
+    except ImportError:tqdm.write("⚠️ pyarrow no está instalado: la ejecución no se añade al histórico (pip install pyarrow).");return None
+    partition=os.path.join(store,f"date={meta['started']:%Y-%m-%d}");os.makedirs(partition,exist_ok=True)
+    path=os.path.join(partition,f"run-{meta['run_id']}.parquet")
+    table.assign(**meta).to_parquet(path,index=False)
+    return path
+def load_history(store:str,since:str=None,columns:list=None)->pd.DataFrame:
+    """Lee solo las particiones desde el día since ('AAAA-MM-DD') y solo las columnas pedidas"""
+    return pd.read_parquet(store,columns=columns,filters=[("date",">=",since)]if since else None)
+def compare_history(store:str,baseline_days:int)->tuple:
+    """
+    Compara la última ejecución del histórico con las de los baseline_days días anteriores (mediana de la ventana).
+    Retorna (deltas por destino, deltas por salto); en los saltos, path_changed marca que la IP/nombre del salto
+    difiere del más reciente de la ventana.
+    """
+    days=sorted(entry[5:]for entry in os.listdir(store)if entry.startswith("date="))
+    if not days:return None,None
+    since=(datetime.fromisoformat(days[-1])-timedelta(days=baseline_days)).strftime("%Y-%m-%d")
+    history=load_history(store,since,["run_id","started","target","hop","host","loss","avg","stdev"])
+    latest=history['run_id'].max();current_mask=history['run_id']==latest
+    window_start=history.loc[current_mask,'started'].iloc[0]-pd.Timedelta(days=baseline_days)
+    baseline=history[~current_mask&(history['started']>=window_start)];current=history[current_mask]
+    metrics=['avg','loss','stdev']
+    base_last=last_hops(baseline,('run_id','target'))
+    per_dest=last_hops(current).set_index('target')[['hop',*metrics]].join(
+        base_last.groupby('target')[metrics].median().add_suffix('_base').join(base_last.groupby('target')['run_id'].nunique().rename('base_runs')),how='left')
+    per_hop=current.set_index(['target','hop'])[['host',*metrics]].join(
+        baseline.sort_values('started').groupby(['target','hop']).agg(host_base=('host','last'),**{f"{metric}_base":(metric,'median')for metric in metrics}),how='left')
+    per_hop['path_changed']=per_hop['host_base'].notna()&(per_hop['host']!=per_hop['host_base'])
+    for frame in(per_dest,per_hop):
+        for metric in metrics:frame[f"{metric}_delta"]=frame[metric]-frame[f"{metric}_base"]
+    return per_dest.sort_values('avg_delta',ascending=False),per_hop.sort_values('avg_delta',ascending=False)
+def run_compare(store:str,baseline_days:int,outdir:str):
+    """Modo --compare: muestra las mayores regresiones y guarda las tablas completas en outdir"""
+    if not store or not os.path.isdir(store):print(f"❌ No hay histórico en '{store}'.");sys.exit(1)
+    per_dest,per_hop=compare_history(store,baseline_days)
+    if per_dest is None:print(f"❌ No hay ejecuciones en '{store}'.");sys.exit(1)
+    if per_dest['base_runs'].isna().all():print(f"⚠️ No hay ejecuciones de referencia en los {baseline_days} días anteriores a la última.")
+    per_dest.to_csv(f"{outdir}/compare_destinations.csv");per_hop.to_csv(f"{outdir}/compare_hops.csv")
+    print("\n"+"="*15+f" Última ejecución frente a la mediana de {baseline_days} días "+"="*15)
+    print(per_dest[['avg','avg_base','avg_delta','loss','loss_base','loss_delta','base_runs']].head(COMPARE_TOP).round(2))
+    print("\n"+"="*25+" Saltos con mayor deterioro "+"="*25)
+    print(per_hop[['host','avg_delta','loss_delta','path_changed']].head(COMPARE_TOP).round(2))
+    print(f"\n✅ Comparación completa guardada en '{outdir}/compare_destinations.csv' y '{outdir}/compare_hops.csv'.")
+
+# --- Visualizaciones ---
+def figure_path(outdir:str,name:str,fmt:str=FIG_FORMAT)->str:return f"{outdir}/{name}.{fmt}"
+def plot_performance_overview(analysis:dict,outdir:str,dpi:int=FIG_DPI,fmt:str=FIG_FORMAT):
     summary_df=analysis.get('summary_df');
     if summary_df is None or summary_df.empty:return
     fig,axes=plt.subplots(2,2,figsize=(20,14));fig.suptitle('Visión General del Rendimiento de Red',fontsize=20,fontweight='bold')
@@ -160,22 +832,23 @@ def plot_performance_overview(analysis:dict,outdir:str):
         data_to_plot.plot(kind='bar',ax=ax,color=config['color'],alpha=0.8)
         ax.set_title(config['title'],fontsize=14);ax.set_ylabel(metric);ax.set_xlabel('')
         ax.set_xticklabels(data_to_plot.index,rotation=45,ha='right')
-    plt.tight_layout(rect=[0,0.03,1,0.95]);plt.savefig(f"{outdir}/00_performance_overview.png",dpi=300);plt.close(fig)
-def plot_correlation_and_clustering(analysis:dict,outdir:str):
+    plt.tight_layout(rect=[0,0.03,1,0.95]);plt.savefig(figure_path(outdir,"00_performance_overview",fmt),dpi=dpi);plt.close(fig)
+def plot_correlation_and_clustering(analysis:dict,outdir:str,dpi:int=FIG_DPI,fmt:str=FIG_FORMAT):
     if'correlation_matrix'not in analysis or'pca'not in analysis:return
     fig,axes=plt.subplots(1,2,figsize=(22,10));fig.suptitle('Análisis de Relaciones y Agrupamiento',fontsize=20,fontweight='bold')
     ax=axes[0];sns.heatmap(analysis['correlation_matrix'],annot=True,cmap='vlag',fmt=".2f",linewidths=.5,ax=ax);ax.set_title('Correlación entre Métricas',fontsize=14)
-    ax=axes[1];pca_df=analysis['pca']['components'].copy();pca_df['cluster']=analysis['clusters']
-    palette="viridis"
-    sns.scatterplot(data=pca_df,x='PC1',y='PC2',hue='cluster',palette=palette,s=120,alpha=0.9,ax=ax)
+    ax=axes[1];pca_df=analysis['pca']['components'].copy();clusters=analysis.get('clusters')  # sin perfiles con < N_CLUSTERS destinos
+    if clusters is not None:pca_df['cluster']=clusters
+    sns.scatterplot(data=pca_df,x='PC1',y='PC2',hue='cluster'if clusters is not None else None,palette="viridis"if clusters is not None else None,s=120,alpha=0.9,ax=ax)
     texts=[ax.text(row['PC1'],row['PC2'],idx,fontsize=9)for idx,row in pca_df.iterrows()]
     adjust_text(texts,arrowprops=dict(arrowstyle='->',color='gray',lw=0.5))
     exp_var=analysis['pca']['explained_variance']
     ax.set_xlabel(f"Componente Principal 1 ({exp_var[0]:.1%})",fontsize=12)
     ax.set_ylabel(f"Componente Principal 2 ({exp_var[1]:.1%})",fontsize=12)
-    ax.set_title('Agrupación de Hosts por Perfil de Red',fontsize=14);ax.legend(title='Perfil de Rendimiento');ax.grid(True)
-    plt.tight_layout(rect=[0,0.03,1,0.95]);plt.savefig(f"{outdir}/01_correlation_and_clustering.png",dpi=300);plt.close(fig)
-def plot_bottlenecks(analysis:dict,outdir:str):
+    ax.set_title('Agrupación de Hosts por Perfil de Red',fontsize=14);ax.grid(True)
+    if clusters is not None:ax.legend(title='Perfil de Rendimiento')
+    plt.tight_layout(rect=[0,0.03,1,0.95]);plt.savefig(figure_path(outdir,"01_correlation_and_clustering",fmt),dpi=dpi);plt.close(fig)
+def plot_bottlenecks(analysis:dict,outdir:str,dpi:int=FIG_DPI,fmt:str=FIG_FORMAT):
     bottlenecks=analysis.get('bottlenecks',{});
     if not bottlenecks:return
     data=pd.DataFrame.from_dict(bottlenecks,orient='index').sort_values('latency_increase',ascending=False)
@@ -187,85 +860,266 @@ def plot_bottlenecks(analysis:dict,outdir:str):
     ax.set_ylabel('Aumento de Latencia (ms)');ax.set_title('Detección de Cuellos de Botella',fontsize=16)
     for i,(idx,row)in enumerate(data.iterrows()):
         ax.text(i,row['latency_increase']+1,f" H{row['hop']:.0f}\n {row['host_name']}",ha='center',va='bottom',fontsize=8,rotation=90)
-    fig.tight_layout();plt.savefig(f"{outdir}/02_bottleneck_analysis.png",dpi=300);plt.close(fig)
-def plot_per_host_details(host:str,df:pd.DataFrame,outdir:str):
+    fig.tight_layout();plt.savefig(figure_path(outdir,"02_bottleneck_analysis",fmt),dpi=dpi);plt.close(fig)
+def plot_per_host_details(host:str,df:pd.DataFrame,outdir:str,dpi:int=FIG_DPI,fmt:str=FIG_FORMAT):
     if df.empty:return
     fig,axes=plt.subplots(1,2,figsize=(15,6));fig.suptitle(f'Análisis Detallado para: {host}',fontsize=16,fontweight='bold')
     ax=axes[0];ax.plot(df['hop'],df['avg'],'o-',label='Latencia Media',color='b');ax.fill_between(df['hop'],df['best'],df['worst'],color='b',alpha=0.2,label='Rango (Best-Worst)')
     ax.set_ylabel('Latencia (ms)');ax.set_xlabel('Salto');ax.set_title('Latencia y Rango por Salto');ax.legend();ax.grid(True)
     ax=axes[1];ax.bar(df['hop'],df['loss'],color='red',alpha=0.7)
     ax.set_xlabel('Salto');ax.set_ylabel('Pérdida de Paquetes (%)');ax.set_title('Pérdida de Paquetes por Salto');ax.axhline(5,color='orange',linestyle='--',lw=1);ax.grid(True)
-    plt.tight_layout(rect=[0,0.03,1,0.95]);plt.savefig(f"{outdir}/{host}_details.png",dpi=300);plt.close(fig)
+    plt.tight_layout(rect=[0,0.03,1,0.95]);plt.savefig(figure_path(outdir,f"{host}_details",fmt),dpi=dpi);plt.close(fig)
+
+# --- Renderizado paralelo ---
+def _init_render_worker():
+    """Cada proceso del pool importa las librerías y fija el backend Agg (sin pantalla) antes de dibujar"""
+    import_analysis();import_plotting()
+def _render(function,args:tuple,dpi:int,fmt:str)->float:
+    start=time.perf_counter();function(*args,dpi=dpi,fmt=fmt);return time.perf_counter()-start
+def figure_jobs(analysis:dict,all_data_dfs:dict,outdir:str)->list:
+    """Retorna [(nombre, función, argumentos)]; cada figura recibe solo los datos que usa, que son también los que se hashean"""
+    jobs=[("00_performance_overview",plot_performance_overview,({'summary_df':analysis.get('summary_df')},outdir)),
+          ("01_correlation_and_clustering",plot_correlation_and_clustering,({key:analysis[key]for key in('correlation_matrix','pca','clusters')if key in analysis},outdir)),
+          ("02_bottleneck_analysis",plot_bottlenecks,({'bottlenecks':analysis.get('bottlenecks',{})},outdir))]
+    return jobs+[(f"{host}_details",plot_per_host_details,(host,df,outdir))for host,df in all_data_dfs.items()]
+def render_figures(jobs:list,outdir:str,dpi:int=FIG_DPI,fmt:str=FIG_FORMAT,workers:int=RENDER_WORKERS,on_figure=None)->tuple:
+    """
+    Dibuja las figuras en paralelo. Se omiten las que ya existen con el mismo hash de datos, dpi y formato
+    (guardado en RENDER_CACHE). on_figure(nombre) se llama al terminar cada una.
+    Retorna ({nombre: segundos} de las dibujadas, número de omitidas).
+    """
+    cache_file=os.path.join(outdir,RENDER_CACHE)
+    try:
+        with open(cache_file)as f:cache=json.load(f)
+    except(OSError,ValueError):cache={}
+    pending=[]
+    for name,function,args in jobs:
+        path=figure_path(outdir,name,fmt)
+        digest=hashlib.sha1(pickle.dumps((function.__name__,args[:-1],dpi,fmt),protocol=4)).hexdigest()
+        if cache.get(path)!=digest or not os.path.exists(path):pending.append((name,function,args,path,digest))
+    timings={}
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers,len(pending)),initializer=_init_render_worker)as executor:
+            futures={executor.submit(_render,function,args,dpi,fmt):(name,path,digest)for name,function,args,path,digest in pending}
+            for future in as_completed(futures):
+                name,path,digest=futures[future]
+                try:timings[name]=future.result();cache[path]=digest
+                except Exception as e:tqdm.write(f"\n⚠️ Error generando {name}: {e}")
+                if on_figure:on_figure(name)
+    with open(cache_file,'w')as f:json.dump(cache,f,indent=1)
+    return timings,len(jobs)-len(pending)
+
+# --- Estimación de tiempos calibrada ---
+PHASE_NAMES={'probe':'sondeo','annotate':'anotación','analysis':'análisis','render':'gráficos','save':'guardado'}
+FIGURE_TYPES={'00_performance_overview':'overview','01_correlation_and_clustering':'correlation','02_bottleneck_analysis':'bottlenecks'}  # el resto: 'details'
+COST_DRIVERS={'annotate':'hops','analysis':'hops','save':'hops','overview':'hosts','correlation':'hosts','bottlenecks':'hosts','details':'hosts'}
+def figure_type(name:str)->str:return FIGURE_TYPES.get(name,'details')
+def load_timings(path:str=TIMINGS_FILE,limit:int=CALIBRATION_RUNS)->list:
+    """Retorna las últimas limit ejecuciones de TIMINGS_FILE (una por línea JSON)"""
+    try:
+        with open(path)as f:runs=[json.loads(line)for line in f if line.strip()]
+    except(OSError,ValueError):return []
+    return runs[-limit:]
+def save_timings(run:dict,path:str=TIMINGS_FILE):
+    with open(path,'a')as f:f.write(json.dumps(run)+"\n")
+def fit_linear(points:list,proportional:bool=True)->tuple:
+    """
+    Mínimos cuadrados y = a + b·x. Si no hay variación en x o sale un coeficiente negativo: y = b·x (proportional)
+    o la media de y constante
+    """
+    n=len(points);mean_x=sum(x for x,_ in points)/n;mean_y=sum(y for _,y in points)/n
+    sxx=sum((x-mean_x)**2 for x,_ in points)
+    if sxx>0:
+        slope=sum((x-mean_x)*(y-mean_y)for x,y in points)/sxx;intercept=mean_y-slope*mean_x
+        if slope>=0 and intercept>=0:return intercept,slope
+    if not proportional:return mean_y,0.0
+    return 0.0,(mean_y/mean_x if mean_x else 0.0)
+class CostModel:
+    """
+    Coste por fase ajustado con ejecuciones anteriores. 'costs' de cada ejecución guarda los segundos de anotación,
+    análisis y guardado y, por tipo de figura, los segundos medios por figura dibujada.
+    """
+    def __init__(self,runs:list):
+        self.runs=runs;self.coefficients={}
+        for phase,driver in COST_DRIVERS.items():
+            points=[(run[driver],run['costs'][phase])for run in runs if phase in run['costs']and run[driver]]
+            if points:self.coefficients[phase]=fit_linear(points,proportional=driver=='hops')
+        hosts=sum(run['hosts']for run in runs)
+        self.hops_per_host=sum(run['hops']for run in runs)/hosts if hosts else DEFAULT_HOPS_PER_HOST
+    def predict(self,phase:str,hosts:int,hops:float)->float:
+        intercept,slope=self.coefficients.get(phase,(0.0,0.0))
+        return intercept+slope*(hosts if COST_DRIVERS[phase]=='hosts'else hops)
+    def estimate(self,hosts:int,workers:int=RENDER_WORKERS,hops:float=None)->dict:
+        """
+        Retorna {fase: segundos} del post-procesamiento; los gráficos se reparten entre los workers. hops, si no se
+        conoce todavía, sale de los saltos por destino de las ejecuciones anteriores.
+        """
+        if not self.runs:return {'render':math.ceil(hosts/workers)*PROCESSING_TIME_PER_HOST}
+        hops=hosts*self.hops_per_host if hops is None else hops;figures=hosts+len(FIGURE_TYPES)
+        render=sum(self.predict(kind,hosts,hops)for kind in FIGURE_TYPES.values())+hosts*self.predict('details',hosts,hops)
+        return {'annotate':self.predict('annotate',hosts,hops),'analysis':self.predict('analysis',hosts,hops),
+                'render':render/min(workers,figures),'save':self.predict('save',hosts,hops)}
+def figure_costs(rendered:dict)->dict:
+    """Segundos medios por figura dibujada de cada tipo (los tipos sin figuras dibujadas no se incluyen)"""
+    by_type={}
+    for name,seconds in rendered.items():by_type.setdefault(figure_type(name),[]).append(seconds)
+    return {kind:sum(values)/len(values)for kind,values in by_type.items()}
+def format_phases(phases:dict)->str:return " · ".join(f"{PHASE_NAMES.get(phase,phase)} {seconds:.1f}s"for phase,seconds in phases.items())
 
 # --- Main ---
 def main():
+    global URLS, CATEGORIES
+    parser = argparse.ArgumentParser(description="Análisis de rutas (pérdida/latencia por salto, cuellos de botella, clustering) de URLS")
+    parser.add_argument("-c", "--config", metavar="FICHERO", help="Fichero JSON con destinos (por categorías) y parámetros")
+    parser.add_argument("-t", "--targets", nargs="+", metavar="DESTINO", help="Destinos a sondear (sustituye a los de la configuración)")
+    parser.add_argument("--category", nargs="+", metavar="CATEGORÍA", help="Sondear solo estas categorías de la configuración")
+    parser.add_argument("-d", "--duration", help="Duración de la prueba (con --daemon, de cada ventana), p. ej. 30s, 5m, 1h (EXECUTION_TIME)")
+    parser.add_argument("--daemon", action="store_true", help="Monitorización continua: sondear en ventanas de EXECUTION_TIME hasta Ctrl+C/SIGTERM, con resúmenes exponenciales y perfiles incrementales")
+    parser.add_argument("--interval", type=float, help="Segundos entre ciclos (INTERVAL)")
+    parser.add_argument("--clusters", type=int, help="Número de perfiles de rendimiento (N_CLUSTERS)")
+    parser.add_argument("--workers", type=int, help="Máximo de procesos mtr simultáneos (MAX_WORKERS)")
+    parser.add_argument("--pps", type=int, help="Presupuesto de paquetes por segundo (MAX_PPS)")
+    parser.add_argument("--dpi", type=int, help="Resolución de los gráficos; 72-100 para previsualizaciones rápidas (FIG_DPI)")
+    parser.add_argument("--format", choices=FIG_FORMATS, help="Formato de los gráficos (FIG_FORMAT)")
+    parser.add_argument("--no-analysis", action="store_true", help="Solo sondear: guardar un CSV por salto de cada destino en OUTDIR y salir, sin importar pandas/matplotlib/sklearn")
+    parser.add_argument("--asn-table", default=ASN_TABLE, metavar="FICHERO", help="Tabla local 'prefijo ASN [nombre]' para anotar el ASN de cada salto")
+    parser.add_argument("--compare", type=int, nargs="?", const=BASELINE_DAYS, metavar="DÍAS", help=f"No sondear: comparar la última ejecución de STORE_DIR con la mediana de los DÍAS anteriores (por defecto {BASELINE_DAYS})")
+    args = parser.parse_args()
+    os.makedirs(OUTDIR, exist_ok=True)
+
+    config = {}
+    if args.config:
+        try: config = load_config(args.config)
+        except (OSError, ValueError) as e: print(f"Error: configuración no válida: {e}"); sys.exit(1)
+    settings = {CONFIG_KEYS[key]: value for key, value in config.items() if key in CONFIG_KEYS}
+    for option, name in (("duration", "EXECUTION_TIME"), ("interval", "INTERVAL"), ("clusters", "N_CLUSTERS"), ("workers", "MAX_WORKERS"), ("pps", "MAX_PPS"), ("dpi", "FIG_DPI"), ("format", "FIG_FORMAT")):
+        if getattr(args, option) is not None: settings[name] = getattr(args, option)
+    globals().update(settings)
+    if FIG_FORMAT not in FIG_FORMATS: print(f"Error: formato de gráficos '{FIG_FORMAT}' no soportado ({', '.join(FIG_FORMATS)})."); sys.exit(1)
+    CATEGORIES = parse_targets(args.targets or config.get("targets", URLS))
+    if args.category and not args.targets:
+        CATEGORIES = {host: category for host, category in CATEGORIES.items() if category in args.category}
+        if not CATEGORIES: print(f"Error: ningún destino en las categorías {', '.join(args.category)}."); sys.exit(1)
+    URLS = list(CATEGORIES)
+    if args.compare is not None:
+        import_analysis(); run_compare(STORE_DIR, args.compare, OUTDIR); return
+    asn_table = None
+    if args.asn_table:
+        try: asn_table = PrefixTable.load(args.asn_table)
+        except OSError as e: print(f"Error: no se pudo leer la tabla de ASN: {e}"); sys.exit(1)
+
     try: single_test_duration = parse_duration(EXECUTION_TIME)
     except ValueError as e: print(f"Error: {e}"); sys.exit(1)
 
+    engine = ENGINE
+    if engine == "auto": engine = "native" if PathProber.available() else "mtr"
+    elif engine == "native" and not PathProber.available():
+        print("Error: el motor nativo necesita root (sockets ICMP raw). Usa ENGINE = 'mtr' o 'auto'."); sys.exit(1)
     actual_interval = get_interval(INTERVAL)
     calculated_rounds = max(10, int(single_test_duration / actual_interval))
+    per_wave = wave_size(engine, actual_interval, len(URLS)); waves = math.ceil(len(URLS) / per_wave)
+    if args.daemon:
+        print(f"Monitorización continua de {len(URLS)} destinos: ventanas de {EXECUTION_TIME} ({waves} olas de hasta {per_wave}), motor {engine}, media exponencial con semivida de {DAEMON_HALF_LIFE} ventanas.")
+        print("Ctrl+C o SIGTERM la detienen.")
+        run_daemon(engine, actual_interval, single_test_duration, per_wave); return
 
-    # --- ESTIMACIÓN DE TIEMPO HOLÍSTICA ---
-    probing_time = single_test_duration + 5 # 5 segundos de margen
-    processing_time = len(URLS) * PROCESSING_TIME_PER_HOST
+    # --- ESTIMACIÓN DE TIEMPO HOLÍSTICA (calibrada con las ejecuciones anteriores) ---
+    probing_time = waves * single_test_duration + 5 # 5 segundos de margen
+    model = CostModel(load_timings())
+    estimate = {} if args.no_analysis else model.estimate(len(URLS))
+    processing_time = sum(estimate.values())
     estimated_total_seconds = int(probing_time + processing_time)
 
     print("="*50 + "\n      Configuración del Análisis de Red\n" + "="*50)
     print(f"Duración de prueba por host:   {EXECUTION_TIME} (~{single_test_duration} s)")
     print(f"Intervalo real entre pings:      {actual_interval} s")
     print(f"Ciclos a realizar por host:      {calculated_rounds}")
-    print(f"Workers paralelos (simultáneos): {WORKERS} (de {len(URLS)} hosts)")
+    if engine == "native":
+        print(f"Motor de sondeo:                 nativo asyncio ({PROBE_PROTOCOL}, {len(URLS)} hosts, máx. {MAX_PPS} pps)")
+    else:
+        print(f"Motor de sondeo:                 mtr (máx. {MAX_WORKERS} simultáneos, {len(URLS)} hosts)")
+    print(f"Olas de sondeo:                  {waves} de hasta {per_wave} destinos")
+    counts = {}
+    for category in CATEGORIES.values(): counts[category] = counts.get(category, 0) + 1
+    if len(counts) > 1: print(f"Categorías:                      {', '.join(f'{category} ({count})' for category, count in counts.items())}")
     print("-" * 50)
     print(f"Tiempo de sondeo estimado:       ~{probing_time // 60}m {probing_time % 60}s")
     print(f"Tiempo de procesamiento est.:    ~{int(processing_time)}s")
+    if estimate:
+        source = f"calibrado con {len(model.runs)} ejecuciones" if model.runs else "heurística, sin historial"
+        print(f"  ({source}: {format_phases(estimate)})")
     print(f"TIEMPO TOTAL ESTIMADO (APROX):   ~{estimated_total_seconds // 60}m {estimated_total_seconds % 60}s")
     print("="*50)
 
-    all_data_dfs={}
-    stop_progress_thread=threading.Event()
-    def time_progress(pbar):
-        while not stop_progress_thread.is_set():
-            time.sleep(1);pbar.update(1)
-            if pbar.n>=pbar.total:break
-
-    with tqdm(total=int(probing_time),desc="🌐 Sondeando redes (simultáneo)",unit="s",bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}s [{elapsed}<{remaining}]")as pbar_time:
-        progress_thread=threading.Thread(target=time_progress,args=(pbar_time,))
-        progress_thread.start()
-        with ThreadPoolExecutor(max_workers=WORKERS)as executor:
-            future_to_host={executor.submit(probe,host,calculated_rounds,actual_interval):host for host in URLS}
-            for future in as_completed(future_to_host):
-                host=future_to_host[future]
-                try:
-                    _,data=future.result()
-                    if data:df=parse_df_realistic(data);all_data_dfs[host]=df
-                except Exception as e:tqdm.write(f"\nError procesando {host}: {e}")
-        stop_progress_thread.set();progress_thread.join()
-        if pbar_time.n<pbar_time.total:pbar_time.update(pbar_time.total-pbar_time.n)
-
-    if not all_data_dfs:print("\n❌ No se pudo obtener datos. Saliendo.");sys.exit(1)
-
-    analysis_tasks=["Realizando análisis y etiquetado","Generando dashboard de rendimiento","Generando gráfico de correlación/clusters","Generando gráfico de cuellos de botella","Generando informes detallados","Guardando resultados en ficheros"]
-    with tqdm(total=len(analysis_tasks),desc="⚙️  Procesando resultados")as pbar_tasks:
-        pbar_tasks.set_description(analysis_tasks.pop(0));analysis=perform_comprehensive_analysis(all_data_dfs);pbar_tasks.update(1)
-        pbar_tasks.set_description(analysis_tasks.pop(0));plot_performance_overview(analysis,OUTDIR);pbar_tasks.update(1)
-        pbar_tasks.set_description(analysis_tasks.pop(0));plot_correlation_and_clustering(analysis,OUTDIR);pbar_tasks.update(1)
-        pbar_tasks.set_description(analysis_tasks.pop(0));plot_bottlenecks(analysis,OUTDIR);pbar_tasks.update(1)
+    if EARLY_STOP:
+        print(f"Parada temprana: tras {MIN_CYCLES} ciclos, con IC95 latencia ±max({CI_LATENCY_MS} ms, {CI_LATENCY_REL:.0%}) y pérdida ±{CI_LOSS_PCT}%")
+    print("Ctrl+C detiene el sondeo y analiza lo recogido hasta ese momento.")
+
+    started = datetime.now(timezone.utc);phases={};clock=time.perf_counter()
+    paths,_=probe_waves(engine,URLS,calculated_rounds,actual_interval,per_wave)
+    phases['probe']=time.perf_counter()-clock;clock=time.perf_counter()
+    annotations={}
+    if ANNOTATE_HOPS:annotations=annotate_hops({hop.host for path in paths.values()for hop in path.hops[:path.last_ttl()]},asn_table=asn_table)
+    phases['annotate']=time.perf_counter()-clock
+    if args.no_analysis:
+        written=write_raw_hops(paths,OUTDIR,annotations)
+        if not written:print("\n❌ No se pudo obtener datos. Saliendo.");sys.exit(1)
+        print(f"\n✅ Sondeo completo. Datos por salto de {written} destinos guardados en '{OUTDIR}'.");return
+
+    import_analysis()
+    table=hop_table(paths,annotations,CATEGORIES)
+
+    if table.empty:print("\n❌ No se pudo obtener datos. Saliendo.");sys.exit(1)
+
+    # La barra avanza en segundos estimados por el modelo, ya con los destinos y saltos reales
+    hosts=table['target'].nunique();estimate=model.estimate(hosts,hops=len(table));estimate.pop('annotate',None)
+    analysis_tasks=["Realizando análisis y etiquetado",f"Generando gráficos ({RENDER_WORKERS} procesos)","Guardando resultados en ficheros"]
+    with tqdm(total=max(0.1,round(sum(estimate.values()),1)),desc="⚙️  Procesando resultados",bar_format="{desc}: {percentage:3.0f}%|{bar}| {elapsed}<{remaining}")as pbar_tasks:
+        def reach(seconds:float):pbar_tasks.update(max(0.0,min(seconds,pbar_tasks.total)-pbar_tasks.n))
+        clock=time.perf_counter()
+        pbar_tasks.set_description(analysis_tasks.pop(0));analysis=perform_comprehensive_analysis(table)
+        all_data_dfs={host:df.drop(columns=['target','category']).reset_index(drop=True)for host,df in table.groupby('target',sort=False)}
+        phases['analysis']=time.perf_counter()-clock;clock=time.perf_counter();reach(estimate.get('analysis',0))
         pbar_tasks.set_description(analysis_tasks.pop(0))
-        for host,df in all_data_dfs.items():plot_per_host_details(host,df,OUTDIR)
-        pbar_tasks.update(1)
+        jobs=figure_jobs(analysis,all_data_dfs,OUTDIR);per_figure=estimate['render']/len(jobs)
+        rendered,skipped=render_figures(jobs,OUTDIR,dpi=FIG_DPI,fmt=FIG_FORMAT,on_figure=lambda _:reach(pbar_tasks.n+per_figure))
+        phases['render']=time.perf_counter()-clock;clock=time.perf_counter();reach(estimate.get('analysis',0)+estimate['render'])
         pbar_tasks.set_description(analysis_tasks.pop(0))
         for host,df in all_data_dfs.items():df.to_csv(f"{OUTDIR}/{host}.csv",index=False)
         serializable_analysis=serialize_analysis_dict(analysis)
         with open(f"{OUTDIR}/00_full_analysis_data.json",'w')as f:json.dump(serializable_analysis,f,indent=2)
-        pbar_tasks.update(1)
+        stored=None
+        if STORE_DIR:
+            meta={'run_id':started.strftime("%Y%m%dT%H%M%SZ"),'started':pd.Timestamp(started),'engine':engine,
+                  'protocol':PROBE_PROTOCOL if engine=="native" else "icmp",'interval':actual_interval,'rounds':calculated_rounds}
+            stored=store_run(table,meta)
+        phases['save']=time.perf_counter()-clock;reach(pbar_tasks.total)
+    costs={phase:phases[phase]for phase in('annotate','analysis','save')};costs.update(figure_costs(rendered))
+    save_timings({'started':started.isoformat(timespec='seconds'),'hosts':hosts,'hops':len(table),'workers':RENDER_WORKERS,'phases':phases,'costs':costs})
 
     print("\n"+"="*25+" RESUMEN DEL ANÁLISIS "+"="*25)
     print(analysis['summary_df'][['Latency (ms)','Std Dev (ms)','Packet Loss (%)','Stability (CV)']].round(2))
+    if len(analysis['category_summary'])>1:
+        print("\n"+"="*22+" Mediana por categoría "+"="*22)
+        print(analysis['category_summary'].round(2))
     print("\n"+"="*20+" Perfiles de Rendimiento "+"="*20)
     if 'clusters' in analysis:
         print(analysis['clusters'])
     else:
         print("No se pudieron generar perfiles (datos insuficientes).")
+    print("\n"+"="*20+" Cuellos de botella compartidos "+"="*20)
+    shared=analysis['shared_bottlenecks'];shared=shared[shared['explained']>=2]
+    if shared.empty:
+        print(f"Ningún salto explica la degradación de más de un destino ({analysis['degraded_destinations']} destinos degradados).")
+    else:
+        top=shared.index[0];label=top if shared['name'].iloc[0]==top else f"{shared['name'].iloc[0]} ({top})"
+        print(f"{label} explica la degradación de {int(shared['explained'].iloc[0])} de {analysis['degraded_destinations']} destinos degradados.")
+        print(shared.head(COMPARE_TOP).round(2))
+    print(f"\n🖼️  {len(rendered)} gráficos generados ({FIG_FORMAT}, {FIG_DPI} dpi), {skipped} sin cambios omitidos.")
+    if stored:print(f"\n🗄️  Ejecución añadida al histórico: {stored}")
+    processing=sum(seconds for phase,seconds in phases.items()if phase!='probe')
+    print(f"\n⏱️  Tiempo por fase: {format_phases(phases)} (procesamiento {processing:.1f}s, estimado {processing_time:.1f}s)")
+    if rendered:print("   Gráficos (s por figura): "+" · ".join(f"{kind} {seconds:.2f}"for kind,seconds in figure_costs(rendered).items()))
     print(f"\n✅ Análisis completo. Resultados guardados en '{OUTDIR}'.")
 
 if __name__ == '__main__':